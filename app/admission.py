@@ -0,0 +1,289 @@
+"""
+Admission control and load shedding for two-stage predictions.
+
+Every request passes through AdmissionController.predict(). It runs the
+full pipeline (service.predict_two_stage) unless the process is
+overloaded:
+  - more than MAX_IN_FLIGHT predictions are already running, or
+  - the p95 latency of full predictions over the last WINDOW_SECONDS is
+    above LATENCY_BUDGET_MS. Latency counts from when the request arrived
+    (serve.py passes its accept time), so a backed-up server is shed even
+    when each prediction itself is fast.
+serve.py workers handle requests on threads, so concurrent requests in one
+worker show up as in-flight predictions.
+Overloaded requests get a cheaper answer, in order:
+  1. "cache": a recent full result for the same inputs (location rounded to
+     ~100 m),
+  2. "table": the Stage 1 crime probability looked up in a table
+     precomputed for every borough x month x weekday x hour x age group x
+     gender (built in the background for each model version; Stage 2 is
+     skipped),
+and only fall through to the full pipeline when neither is available.
+While latency-shedding, every PROBE_EVERY-th request still runs in full so
+the latency window reflects recovery.
+
+Degraded results carry 'degraded': True and 'tier'; stats() counts the
+requests served by each tier and why they were shed. They are audited but
+not fed to the drift monitor (see service.record_prediction).
+
+Benchmark the tiers (from the app/ directory):
+    python admission.py
+"""
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+import service
+from features import STAGE1_COLUMNS
+
+MAX_IN_FLIGHT = int(os.environ.get("SAFETYSCOPE_MAX_IN_FLIGHT", "8"))
+LATENCY_BUDGET_MS = float(os.environ.get("SAFETYSCOPE_LATENCY_BUDGET_MS", "250"))
+WINDOW_SECONDS = 10.0
+MIN_WINDOW_SAMPLES = 20  # fewer recent samples: latency alone never sheds
+PROBE_EVERY = 10
+CACHE_SIZE = 4096
+COORDINATE_DIGITS = 3  # cache key precision, about 100 m
+
+TIERS = ("full", "cache", "table")
+
+TABLE_BOROUGHS = ["BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND"]
+TABLE_AGE_GROUPS = ["<18", "18-24", "25-44", "45-64", "65+"]
+TABLE_GENDERS = ["M", "F", "U"]
+
+
+def build_stage1_table(safety_model):
+    """Crime probability (float32) indexed [borough, month - 1, weekday, hour, age group, gender]"""
+    shape = (len(TABLE_BOROUGHS), 12, 7, 24, len(TABLE_AGE_GROUPS), len(TABLE_GENDERS))
+    b, m, w, h, a, g = (axis.ravel() for axis in np.indices(shape))
+    df = pd.DataFrame({
+        "BORO_NM": np.array(TABLE_BOROUGHS)[b],
+        "hour": h,
+        "weekday": w,
+        "month": m + 1,
+        "is_weekend": (w >= 5).astype(int),
+        "is_night": ((h >= 20) | (h <= 6)).astype(int),
+        "VIC_SEX": np.array(TABLE_GENDERS)[g],
+        "VIC_AGE_GROUP": np.array(TABLE_AGE_GROUPS)[a],
+        "SUSP_SEX": "U",
+        "SUSP_AGE_GROUP": "UNKNOWN",
+    })[STAGE1_COLUMNS]
+    return crime_proba_single_threaded(safety_model, df).astype(np.float32).reshape(shape)
+
+
+def crime_proba_single_threaded(safety_model, df):
+    """
+    Class 0 (crime) probabilities, as in predict_two_stage, with LightGBM on one thread. serve.py builds the
+    table before forking, and a child forked after LightGBM's OpenMP pool has started can hang.
+    """
+    if getattr(safety_model, "takes_codes", False):
+        return 1 - safety_model.booster_.predict(safety_model.transform(df), num_threads=1)
+    classifier = safety_model.steps[-1][1] if hasattr(safety_model, "steps") else safety_model
+    if not hasattr(classifier, "booster_"):
+        return safety_model.predict_proba(df)[:, 0]
+    X = safety_model[:-1].transform(df) if classifier is not safety_model else df
+    return classifier.predict_proba(X, num_threads=1)[:, 0]
+
+
+class AdmissionController:
+    """Per-process load signals, result cache and Stage 1 table in front of predict_two_stage()"""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, latency_budget_ms=LATENCY_BUDGET_MS):
+        self.max_in_flight = max_in_flight
+        self.latency_budget_ms = latency_budget_ms
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._latencies = deque(maxlen=1000)  # (monotonic time, ms from arrival) of full predictions
+        self._waits = deque(maxlen=1000)  # (monotonic time, ms between arrival and admission)
+        self._cache = OrderedDict()
+        self._table = None  # (model version, table)
+        self._table_thread = None
+        self._probe = 0
+        self.served = dict.fromkeys(TIERS, 0)
+        self.shed = {"queue": 0, "latency": 0}
+
+    # --- load signals -------------------------------------------------------
+
+    def recent_p95(self, samples=None):
+        now = time.monotonic()
+        with self._lock:
+            recent = [ms for t, ms in (self._latencies if samples is None else samples) if now - t <= WINDOW_SECONDS]
+        if len(recent) < MIN_WINDOW_SAMPLES:
+            return None
+        return float(np.percentile(recent, 95))
+
+    def overload(self):
+        """'queue', 'latency' or None; called with the request not yet counted as in flight"""
+        if self._in_flight >= self.max_in_flight:
+            return "queue"
+        p95 = self.recent_p95()
+        if p95 is not None and p95 > self.latency_budget_ms:
+            with self._lock:
+                self._probe += 1
+                if self._probe % PROBE_EVERY == 0:
+                    return None  # let a probe through to measure recovery
+            return "latency"
+        return None
+
+    # --- degraded tiers -----------------------------------------------------
+
+    @staticmethod
+    def cache_key(version, date, hour, latitude, longitude, place, age, race, gender):
+        return (version, date, int(hour), round(float(latitude), COORDINATE_DIGITS),
+                round(float(longitude), COORDINATE_DIGITS), place, service.map_age_to_group(int(age)), race,
+                service.map_gender(gender))
+
+    def from_cache(self, key):
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+        return None if result is None else dict(result, degraded=True, tier="cache")
+
+    def remember(self, key, result):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def ensure_table(self, models):
+        """Start building the Stage 1 table for a model version in the background if needed"""
+        if models.safety_model is None or (self._table and self._table[0] == models.version):
+            return
+        with self._lock:
+            if self._table_thread is not None and self._table_thread.is_alive():
+                return
+            self._table_thread = threading.Thread(target=self.build_table, args=(models,), daemon=True,
+                                                  name="admission-table")
+            self._table_thread.start()
+
+    def build_table(self, models):
+        """Build the Stage 1 table for a model set now (serve.py does this before forking, single-threaded)"""
+        if models.safety_model is None:
+            return
+        try:
+            start = time.perf_counter()
+            table = build_stage1_table(models.safety_model)
+            self._table = (models.version, table)
+            print(f"✓ Stage 1 fallback table for model {models.version} built in "
+                  f"{time.perf_counter() - start:.1f}s ({table.nbytes / 1e6:.1f} MB)")
+        except Exception as e:
+            print(f"WARNING: Could not build the Stage 1 fallback table: {e}")
+
+    def from_table(self, models, date, hour, age, gender, borough):
+        table = self._table
+        boro = borough.upper()
+        if table is None or table[0] != models.version or boro not in TABLE_BOROUGHS:
+            return None
+        hour = int(hour) if int(hour) < 24 else 0
+        index = (TABLE_BOROUGHS.index(boro), date.month - 1, date.weekday(), hour,
+                 TABLE_AGE_GROUPS.index(service.map_age_to_group(int(age))),
+                 TABLE_GENDERS.index(service.map_gender(gender)))
+        crime_proba = float(table[1][index])
+        crime_probability = round(crime_proba * 100, 2)
+        safe = crime_proba < service.CRIME_THRESHOLD
+        return {
+            'status': 'SAFE' if safe else 'CRIME RISK',
+            'risk_level': 'LOW' if safe else 'HIGH' if crime_proba >= service.HIGH_RISK_THRESHOLD else 'MEDIUM',
+            'crime_probability': crime_probability,
+            'confidence': round(max(crime_proba, 1 - crime_proba) * 100, 2),
+            'message': (f'Estimated under high load from the precomputed risk table. Crime risk: '
+                        f'{crime_probability:.1f}%'),
+            'crime_type': None,
+            'crime_list': [],
+            'probabilities': None,  # Stage 2 skipped: null in the audit log, not 0%
+            'model_version': models.version,
+            'degraded': True,
+            'tier': 'table',
+        }
+
+    # --- request path -------------------------------------------------------
+
+    def predict(self, date, hour, latitude, longitude, place, age, race, gender, precinct, borough, arrived=None,
+                explain=False):
+        """
+        predict_two_stage() with load shedding; results carry 'degraded' and 'tier'.
+        `arrived` (time.perf_counter()) is when the request was accepted, so the latency signal includes the
+        time it waited before reaching the pipeline. `explain` is passed on to predict_two_stage(); degraded
+        answers carry the explanation of a cached result, if any.
+        """
+        started = arrived or time.perf_counter()
+        models = service.registry.active
+        self.ensure_table(models)
+        key = self.cache_key(models.version, date, hour, latitude, longitude, place, age, race, gender)
+
+        with self._lock:
+            self._waits.append((time.monotonic(), (time.perf_counter() - started) * 1000))
+        reason = self.overload()
+        if reason is not None:
+            result = self.from_cache(key) or self.from_table(models, date, hour, age, gender, borough)
+            if result is not None:
+                with self._lock:
+                    self.shed[reason] += 1
+                    self.served[result['tier']] += 1
+                return service.record_prediction(date, hour, latitude, longitude, place, age, race, gender,
+                                                  precinct, borough, result, started)
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            result = service.predict_two_stage(date, hour, latitude, longitude, place, age, race, gender, precinct,
+                                               borough, explain)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._in_flight -= 1
+                self._latencies.append((time.monotonic(), elapsed_ms))
+                self.served["full"] += 1
+        result = dict(result, degraded=False, tier="full")
+        self.remember(key, result)
+        return result
+
+    def stats(self):
+        total = max(sum(self.served.values()), 1)
+        return {
+            "served": dict(self.served),
+            "share": {tier: round(count / total, 4) for tier, count in self.served.items()},
+            "shed_reasons": dict(self.shed),
+            "in_flight": self._in_flight,
+            "recent_p95_ms": self.recent_p95(),
+            "recent_wait_p95_ms": self.recent_p95(self._waits),
+            "table_version": self._table[0] if self._table else None,
+        }
+
+
+controller = AdmissionController()
+
+
+def predict(date, hour, latitude, longitude, place, age, race, gender, precinct, borough, arrived=None, explain=False):
+    return controller.predict(date, hour, latitude, longitude, place, age, race, gender, precinct, borough, arrived,
+                              explain)
+
+
+def benchmark(n=200):
+    """Per-request cost of each tier"""
+    models = service.registry.active
+    controller.build_table(models)
+    date = datetime.date(2025, 7, 12)
+    inputs = (date, 22, 40.7580, -73.9855, "In park", 30, "WHITE", "Female", 14, "Manhattan")
+    key = controller.cache_key(models.version, *inputs[:8])
+    controller.remember(key, service.predict_two_stage(*inputs))
+    timings = {
+        "full": lambda: service.predict_two_stage(*inputs),
+        "cache": lambda: controller.from_cache(key),
+        "table": lambda: controller.from_table(models, date, 22, 30, "Female", "Manhattan"),
+    }
+    for tier, fn in timings.items():
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        print(f"  {tier:<6} {(time.perf_counter() - start) / n * 1000:.3f} ms/request")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,276 @@
+"""
+Out-of-core analytics over the complaint dataset.
+
+The complaint CSV is converted once to Parquet, partitioned by year, with
+the same cleaning and derived columns as complaints.clean_chunk (year,
+month, day, weekday, hour, category). Queries run lazily in DuckDB: only the
+referenced columns are read, year filters skip whole partitions, and other
+filters are pushed down to the Parquet row groups. Aggregations spill to
+disk instead of needing the dataset in memory.
+
+Results are cached by query and data version (a hash of the Parquet files),
+in memory and as Parquet under ./data/analytics_cache/, so notebooks and the
+app get repeated questions back instantly and a re-conversion invalidates
+them automatically.
+
+Usage (from the app/ directory):
+    python analytics.py convert --csv ../nypd-data/NYPD_Complaint_Data_Historic.csv
+    python analytics.py summary --years 2015 2021 --borough BROOKLYN
+
+From a notebook:
+    import analytics
+    analytics.counts_by_hour(years=(2015, 2021), boroughs=["Brooklyn"])
+    analytics.top_offenses(10, categories=["PROPERTY"])
+"""
+import argparse
+import functools
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import duckdb
+import pandas as pd
+
+from complaints import CATEGORY_NAMES, COMPLAINTS_CSV, OFFENSE_TO_CATEGORY
+
+PARQUET_DIR = "./data/complaints_parquet"
+CACHE_DIR = "./data/analytics_cache"
+MEMORY_CACHE_SIZE = 256
+
+MEMORY_LIMIT = os.environ.get("SAFETYSCOPE_DUCKDB_MEMORY", "2GB")
+TEMP_DIR = "./data/duckdb_tmp"
+
+# Columns that can be grouped on (query text is built from these names only)
+DIMENSIONS = ("year", "month", "day", "weekday", "hour", "BORO_NM", "ADDR_PCT_CD", "category", "OFNS_DESC",
+              "LAW_CAT_CD", "CRM_ATPT_CPTD_CD", "PREM_TYP_DESC", "LOC_OF_OCCUR_DESC", "VIC_AGE_GROUP",
+              "VIC_SEX", "VIC_RACE", "SUSP_AGE_GROUP", "SUSP_SEX", "SUSP_RACE")
+
+CONVERT_SQL = """
+COPY (
+    SELECT
+        c.*,
+        year(c.date) AS year,
+        month(c.date) AS month,
+        day(c.date) AS day,
+        isodow(c.date) - 1 AS weekday,
+        COALESCE(o.category, -1) AS category
+    FROM (
+        SELECT
+            CMPLNT_NUM,
+            try_strptime(CMPLNT_FR_DT, '%m/%d/%Y')::DATE AS date,
+            hour(try_strptime(CMPLNT_FR_TM, '%H:%M:%S')) AS hour,
+            COALESCE(BORO_NM, 'UNKNOWN') AS BORO_NM,
+            TRY_CAST(TRY_CAST(ADDR_PCT_CD AS DOUBLE) AS SMALLINT) AS ADDR_PCT_CD,
+            OFNS_DESC, LAW_CAT_CD, CRM_ATPT_CPTD_CD, PREM_TYP_DESC, LOC_OF_OCCUR_DESC,
+            VIC_AGE_GROUP, VIC_SEX, VIC_RACE, SUSP_AGE_GROUP, SUSP_SEX, SUSP_RACE,
+            TRY_CAST(Latitude AS DOUBLE) AS Latitude,
+            TRY_CAST(Longitude AS DOUBLE) AS Longitude
+        FROM read_csv('{csv}', header = true, all_varchar = true)
+    ) c
+    LEFT JOIN offense_categories o USING (OFNS_DESC)
+    WHERE c.date IS NOT NULL AND c.hour IS NOT NULL
+) TO '{out}' (FORMAT PARQUET, PARTITION_BY (year), COMPRESSION ZSTD)
+"""
+
+
+def sql_string(value):
+    """Escape a path for a single-quoted SQL literal (COPY cannot take parameters)"""
+    return str(value).replace("'", "''")
+
+
+@functools.lru_cache(maxsize=None)
+def connect():
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = '{MEMORY_LIMIT}'")
+    con.execute(f"SET temp_directory = '{TEMP_DIR}'")
+    return con
+
+
+def convert_to_parquet(csv_path=COMPLAINTS_CSV, parquet_dir=PARQUET_DIR):
+    """
+    Stream the CSV into year-partitioned Parquet; DuckDB never holds the whole file in memory.
+    The output is written to a fresh directory and renamed over the previous conversion, so no stale
+    files from it are left in the year= partitions.
+    """
+    start = time.perf_counter()
+    cursor = connect().cursor()
+    categories = pd.DataFrame({"OFNS_DESC": list(OFFENSE_TO_CATEGORY),
+                               "category": list(OFFENSE_TO_CATEGORY.values())})
+    cursor.register("offense_categories", categories)
+    staging, previous = parquet_dir.rstrip("/") + ".tmp", parquet_dir.rstrip("/") + ".old"
+    for leftover in (staging, previous):
+        shutil.rmtree(leftover, ignore_errors=True)
+    cursor.execute(CONVERT_SQL.format(csv=sql_string(csv_path), out=sql_string(staging)))
+    if os.path.exists(parquet_dir):
+        os.rename(parquet_dir, previous)
+    os.rename(staging, parquet_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+    n_rows = cursor.execute("SELECT count(*) FROM read_parquet(?)", [f"{parquet_dir}/**/*.parquet"]).fetchone()[0]
+    print(f"✓ {n_rows:,} complaints -> {parquet_dir} in {time.perf_counter() - start:.0f}s")
+
+
+def data_version(parquet_dir=PARQUET_DIR):
+    """Hash of the Parquet files' names, sizes and mtimes"""
+    files = sorted(glob.glob(os.path.join(parquet_dir, "**", "*.parquet"), recursive=True))
+    if not files:
+        raise FileNotFoundError(f"No Parquet data in {parquet_dir}. Run `python analytics.py convert` first.")
+    h = hashlib.sha1()
+    for path in files:
+        stat = os.stat(path)
+        h.update(f"{os.path.relpath(path, parquet_dir)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()[:12]
+
+
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def query(sql, params=(), parquet_dir=PARQUET_DIR, use_cache=True):
+    """
+    Run SQL over the `complaints` view and return a DataFrame, cached by (sql, params, data version).
+    Use ? placeholders for values.
+    """
+    key = hashlib.sha1(json.dumps([sql, list(params), data_version(parquet_dir)], default=str).encode()).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{key}.parquet")
+    if use_cache:
+        with _memory_lock:
+            if key in _memory_cache:
+                _memory_cache.move_to_end(key)
+                return _memory_cache[key].copy()
+
+    cursor = connect().cursor()
+    if use_cache and os.path.exists(cache_path):
+        result = cursor.execute("SELECT * FROM read_parquet(?)", [cache_path]).df()
+    else:
+        cursor.execute(f"CREATE OR REPLACE TEMP VIEW complaints AS "
+                       f"SELECT * FROM read_parquet('{sql_string(parquet_dir)}/**/*.parquet', hive_partitioning = true)")
+        result = cursor.execute(sql, list(params)).df()
+        if use_cache:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            cursor.register("query_result", result)
+            cursor.execute(f"COPY query_result TO '{sql_string(cache_path)}' (FORMAT PARQUET)")
+
+    if use_cache:
+        with _memory_lock:
+            _memory_cache[key] = result
+            if len(_memory_cache) > MEMORY_CACHE_SIZE:
+                _memory_cache.popitem(last=False)
+    return result.copy()
+
+
+def where_clause(years=None, boroughs=None, categories=None, hours=None, precincts=None, offenses=None):
+    """SQL WHERE clause and parameters for the common filters"""
+    clauses, params = [], []
+
+    def is_in(column, values):
+        clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+
+    if years is not None:
+        clauses.append("year BETWEEN ? AND ?")
+        params.extend([int(years[0]), int(years[1])])
+    if boroughs:
+        is_in("BORO_NM", [borough.upper() for borough in boroughs])
+    if categories:
+        is_in("category", [CATEGORY_NAMES.index(name) for name in categories])
+    if hours:
+        is_in("hour", [int(hour) for hour in hours])
+    if precincts:
+        is_in("ADDR_PCT_CD", [int(precinct) for precinct in precincts])
+    if offenses:
+        is_in("OFNS_DESC", list(offenses))
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def counts_by(dimensions, order_by_count=False, limit=None, **filters):
+    """Incident counts grouped by one or more DIMENSIONS, with optional filters"""
+    if isinstance(dimensions, str):
+        dimensions = [dimensions]
+    unknown = set(dimensions) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {sorted(unknown)}")
+    columns = ", ".join(dimensions)
+    where, params = where_clause(**filters)
+    order = "incidents DESC" if order_by_count else columns
+    sql = f"SELECT {columns}, count(*) AS incidents FROM complaints {where} GROUP BY {columns} ORDER BY {order}"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return query(sql, params)
+
+
+def counts_by_borough(**filters):
+    return counts_by("BORO_NM", **filters)
+
+
+def counts_by_hour(**filters):
+    return counts_by("hour", **filters)
+
+
+def counts_by_weekday(**filters):
+    return counts_by("weekday", **filters)
+
+
+def counts_by_month(**filters):
+    return counts_by("month", **filters)
+
+
+def counts_by_year(**filters):
+    return counts_by("year", **filters)
+
+
+def top_offenses(n=10, **filters):
+    return counts_by("OFNS_DESC", order_by_count=True, limit=n, **filters)
+
+
+def top_premises(n=10, **filters):
+    return counts_by("PREM_TYP_DESC", order_by_count=True, limit=n, **filters)
+
+
+def category_share(**filters):
+    """Share of each crime category (other offenses excluded)"""
+    counts = counts_by("category", **filters)
+    counts = counts[counts["category"] >= 0].copy()
+    counts["category"] = [CATEGORY_NAMES[code] for code in counts["category"]]
+    counts["share"] = counts["incidents"] / counts["incidents"].sum()
+    return counts
+
+
+def borough_hour_matrix(**filters):
+    """Boroughs x hours table of incident counts"""
+    counts = counts_by(["BORO_NM", "hour"], **filters)
+    return counts.pivot(index="BORO_NM", columns="hour", values="incidents").fillna(0).astype("int64")
+
+
+def clear_cache():
+    with _memory_lock:
+        _memory_cache.clear()
+    for path in glob.glob(os.path.join(CACHE_DIR, "*.parquet")):
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lazy analytics over the complaint dataset")
+    parser.add_argument("command", choices=["convert", "summary", "clear-cache"])
+    parser.add_argument("--csv", default=COMPLAINTS_CSV)
+    parser.add_argument("--years", type=int, nargs=2, default=None)
+    parser.add_argument("--borough", action="append", default=None)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_to_parquet(args.csv)
+    elif args.command == "clear-cache":
+        clear_cache()
+        print("✓ Analytics cache cleared")
+    else:
+        filters = {"years": args.years, "boroughs": args.borough}
+        for title, fn in [("Incidents per borough", counts_by_borough), ("Incidents per hour", counts_by_hour),
+                          ("Top offenses", top_offenses), ("Category share", category_share)]:
+            start = time.perf_counter()
+            result = fn(**filters)
+            print(f"\n{title} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+            print(result.to_string(index=False))
@@ -0,0 +1,273 @@
+"""
+Append-only audit log of every two-stage prediction.
+
+predict_two_stage() only appends a record (inputs, stage probabilities,
+model version, latency) to a bounded in-memory buffer; it never waits for
+disk. A background thread drains the buffer every FLUSH_SECONDS, or as soon
+as BATCH_ROWS records are waiting, and writes each batch as a row group of
+the current Parquet file under ./data/audit/. Files rotate after
+ROTATE_ROWS rows or ROTATE_SECONDS and are named
+audit-<pid>-<start time>.parquet; the file being written is named
+_audit-...parquet.inprogress, which Parquet readers skip, so they only
+ever see complete files:
+
+    pd.read_parquet("data/audit")  # or duckdb: SELECT * FROM 'data/audit/*.parquet'
+
+When the buffer is full (the disk can't keep up) new records are dropped
+and counted instead of blocking the request. close() flushes what is left;
+it runs at interpreter exit and on worker shutdown in serve.py.
+"""
+import atexit
+import datetime
+import os
+import threading
+import time
+from collections import deque
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from complaints import CATEGORY_NAMES
+
+AUDIT_DIR = "./data/audit"
+
+ENABLED = os.environ.get("SAFETYSCOPE_AUDIT_LOG", "1") == "1"
+BUFFER_SIZE = int(os.environ.get("SAFETYSCOPE_AUDIT_BUFFER", "10000"))
+FLUSH_SECONDS = float(os.environ.get("SAFETYSCOPE_AUDIT_FLUSH_SECONDS", "5"))
+ROTATE_ROWS = int(os.environ.get("SAFETYSCOPE_AUDIT_ROTATE_ROWS", "100000"))
+ROTATE_SECONDS = float(os.environ.get("SAFETYSCOPE_AUDIT_ROTATE_SECONDS", "3600"))
+BATCH_ROWS = 1000  # wake the writer early once this many records are waiting
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ms")),
+    ("pid", pa.int32()),
+    ("date", pa.date32()),
+    ("hour", pa.int8()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("place", pa.string()),
+    ("age", pa.int16()),
+    ("race", pa.string()),
+    ("gender", pa.string()),
+    ("precinct", pa.int16()),
+    ("borough", pa.string()),
+    ("status", pa.string()),
+    ("risk_level", pa.string()),
+    ("crime_probability", pa.float32()),  # Stage 1, percent; null without Stage 1
+    ("crime_type", pa.string()),
+    ("confidence", pa.float32()),
+] + [(f"p_{name}", pa.float32()) for name in CATEGORY_NAMES] + [  # Stage 2, percent
+    ("model_version", pa.string()),
+    ("tier", pa.string()),  # admission.py: full, cache or table
+    ("latency_ms", pa.float32()),
+])
+
+
+def number(value):
+    return None if value is None else float(value)
+
+
+def text(value):
+    return None if value is None else str(value)
+
+
+def integer(value, bits):
+    """int(value), checked against the signed range of its Arrow column"""
+    value = int(value)
+    if not -2 ** (bits - 1) <= value < 2 ** (bits - 1):
+        raise OverflowError(f"{value} does not fit int{bits}")
+    return value
+
+
+class AuditLog:
+    """Bounded record buffer drained to rotating Parquet files by a background thread"""
+
+    def __init__(self, audit_dir=AUDIT_DIR, buffer_size=BUFFER_SIZE, flush_seconds=FLUSH_SECONDS,
+                 rotate_rows=ROTATE_ROWS, rotate_seconds=ROTATE_SECONDS):
+        self.audit_dir = audit_dir
+        self.buffer_size = buffer_size
+        self.flush_seconds = flush_seconds
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self._buffer = deque()
+        self._lock = threading.Lock()  # guards the buffer and counters, never held during I/O
+        self._write_lock = threading.Lock()  # one writer at a time (thread, flush(), close())
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._writer = None
+        self._path = None
+        self._file_rows = 0
+        self._file_started = 0.0
+        self.logged = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.invalid = 0
+        self.files = 0
+
+    def log(self, date, hour, latitude, longitude, place, age, race, gender, precinct, borough, result,
+            latency_ms):
+        """Queue one prediction; drops it (and counts the drop) when the buffer is full"""
+        record = (time.time(), date, hour, latitude, longitude, place, age, race, gender, precinct, borough,
+                  result, latency_ms)
+        with self._lock:
+            if len(self._buffer) >= self.buffer_size:
+                self.dropped += 1
+                return False
+            self._buffer.append(record)
+            self.logged += 1
+            waiting = len(self._buffer)
+        if waiting >= BATCH_ROWS:
+            self._wake.set()
+        return True
+
+    def _drain(self):
+        with self._lock:
+            records = list(self._buffer)
+            self._buffer.clear()
+        return records
+
+    @staticmethod
+    def to_row(record, pid):
+        """{column: value} of one queued record typed for SCHEMA; raises on malformed input (e.g. precinct None)"""
+        (timestamp, date, hour, latitude, longitude, place, age, race, gender, precinct, borough, result,
+         latency_ms) = record
+        if not isinstance(date, datetime.date):
+            raise TypeError(f"date must be a datetime.date, got {type(date).__name__}")
+        probabilities = result.get("probabilities") or {}
+        values = {
+            "timestamp": datetime.datetime.fromtimestamp(timestamp), "pid": pid, "date": date,
+            "hour": integer(hour, 8), "latitude": float(latitude), "longitude": float(longitude), "place": text(place),
+            "age": integer(age, 16), "race": text(race), "gender": text(gender), "precinct": integer(precinct, 16),
+            "borough": text(borough), "status": text(result.get("status")), "risk_level": text(result.get("risk_level")),
+            "crime_probability": number(result.get("crime_probability")), "crime_type": text(result.get("crime_type")),
+            "confidence": number(result.get("confidence")), "model_version": text(result.get("model_version")),
+            "tier": text(result.get("tier", "full")), "latency_ms": float(latency_ms),
+        }
+        for name in CATEGORY_NAMES:
+            values[f"p_{name}"] = number(probabilities.get(name))
+        return values
+
+    def to_table(self, records):
+        """
+        Column-wise Arrow table of queued records (conversion runs on the writer thread).
+        A record that fails conversion is dropped and counted in `invalid`; the rest of the batch is kept.
+        """
+        columns = {name: [] for name in SCHEMA.names}
+        pid = os.getpid()
+        for record in records:
+            try:
+                values = self.to_row(record, pid)
+            except (TypeError, ValueError, AttributeError, OverflowError) as e:
+                self.invalid += 1
+                if self.invalid == 1 or self.invalid % 1000 == 0:
+                    print(f"WARNING: Dropped malformed audit record ({self.invalid} so far): {e}")
+                continue
+            for name, value in values.items():
+                columns[name].append(value)
+        return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+    def _rotate(self):
+        """Close the current file and give it its final name"""
+        if self._writer is not None:
+            self._writer.close()
+            directory, name = os.path.split(self._path)
+            os.replace(self._path, os.path.join(directory, name[1:-len(".inprogress")]))
+            self._writer = None
+
+    def _open(self):
+        os.makedirs(self.audit_dir, exist_ok=True)
+        name = f"_audit-{os.getpid()}-{datetime.datetime.now():%Y%m%d-%H%M%S-%f}.parquet.inprogress"
+        self._path = os.path.join(self.audit_dir, name)
+        self._writer = pq.ParquetWriter(self._path, SCHEMA, compression="zstd")
+        self._file_rows = 0
+        self._file_started = time.monotonic()
+        self.files += 1
+
+    def flush(self):
+        """Write everything buffered as one row group; returns the number of records written"""
+        with self._write_lock:
+            if self._writer is not None and (self._file_rows >= self.rotate_rows or
+                                             time.monotonic() - self._file_started >= self.rotate_seconds):
+                self._rotate()
+            records = self._drain()
+            if not records:
+                return 0
+            try:
+                table = self.to_table(records)  # drops (and counts) malformed records only
+            except Exception as e:
+                self.failed += len(records)
+                print(f"WARNING: Audit log conversion failed, {len(records)} records lost: {e}")
+                return 0
+            if not table.num_rows:
+                return 0
+            try:
+                if self._writer is None:
+                    self._open()
+                self._writer.write_table(table)
+                self._file_rows += table.num_rows
+                self.written += table.num_rows
+                return table.num_rows
+            except Exception as e:
+                self.failed += table.num_rows
+                print(f"WARNING: Audit log write failed, {table.num_rows} records lost: {e}")
+                return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        """Start the background writer (once per process)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="audit-log")
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the writer, flush the remaining records and close the current file"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+        self.flush()
+        with self._write_lock:
+            self._rotate()
+
+    def stats(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        return {"logged": self.logged, "dropped": self.dropped, "written": self.written, "failed": self.failed,
+                "invalid": self.invalid, "buffered": buffered, "files": self.files}
+
+
+def create():
+    """The process's audit log, closed (flushed) at interpreter exit"""
+    audit = AuditLog()
+    atexit.register(audit.close)
+    return audit
+
+
+def benchmark(n=100_000):
+    """Cost of log() on the request path"""
+    audit = AuditLog(buffer_size=n)
+    result = {"status": "CRIME RISK", "risk_level": "MEDIUM", "crime_probability": 61.2, "crime_type": "PROPERTY",
+              "confidence": 48.0, "probabilities": {name: 25.0 for name in CATEGORY_NAMES}, "model_version": "base"}
+    date = datetime.date(2025, 7, 12)
+    start = time.perf_counter()
+    for i in range(n):
+        audit.log(date, i % 24, 40.7580, -73.9855, "In park", 30, "WHITE", "Female", 14, "Manhattan", result, 3.2)
+    logged = time.perf_counter() - start
+    start = time.perf_counter()
+    table = audit.to_table(audit._drain())
+    converted = time.perf_counter() - start
+    print(f"✓ log(): {logged / n * 1e6:.2f} µs/record on the request path; "
+          f"background conversion {converted / n * 1e6:.2f} µs/record ({table.num_rows:,} rows)")
+
+
+if __name__ == "__main__":
+    benchmark()
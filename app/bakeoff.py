@@ -0,0 +1,220 @@
+"""
+Fold-parallel Stage 2 model bake-off.
+
+The encoded dataset and the stratified CV fold indices are written once as
+.npy files under ./data/bakeoff/<dataset key>/ and reused by later runs.
+Worker processes open them memory-mapped, so N concurrent jobs share one
+copy of the features through the page cache instead of each re-reading the
+CSV and re-running get_dummies.
+
+Every (candidate, fold) pair is one job in a process pool. Each job is
+limited to `--threads` BLAS/OpenMP threads and the pool to `--jobs`
+processes (jobs x threads <= cores by default), so the libraries' own
+thread pools don't oversubscribe the machine. Besides accuracy, each job
+measures what a model costs to serve: training time, serialized size,
+single-row predict_proba latency and batch throughput.
+
+Usage (from the app/ directory):
+    python bakeoff.py --csv ../final_data.csv --folds 5
+    python bakeoff.py --models lightgbm xgboost --sample 200000 --jobs 4 --threads 2
+"""
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from complaints import CATEGORY_NAMES
+from training import LGBM_PARAMS, STAGE2_CSV, load_stage2_data
+
+BAKEOFF_DIR = "./data/bakeoff"
+CANDIDATES = ("lightgbm", "xgboost", "catboost", "random_forest")
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+LATENCY_ROWS = 200
+BATCH_ROWS = 10_000
+
+
+def make_candidate(name, threads, seed=42):
+    """Unfitted model with the Modeling.ipynb hyperparameters; libraries are imported lazily"""
+    if name == "lightgbm":
+        from lightgbm import LGBMClassifier
+        return LGBMClassifier(**LGBM_PARAMS, n_jobs=threads, random_state=seed, verbose=-1)
+    if name == "xgboost":
+        from xgboost import XGBClassifier
+        return XGBClassifier(max_depth=5, learning_rate=0.0828, n_estimators=60, subsample=0.48,
+                             colsample_bytree=0.26, min_child_weight=7.47, tree_method="hist",
+                             n_jobs=threads, random_state=seed)
+    if name == "catboost":
+        from catboost import CatBoostClassifier
+        return CatBoostClassifier(iterations=1200, depth=7, learning_rate=0.08, l2_leaf_reg=4, border_count=198,
+                                  colsample_bylevel=0.44, loss_function="MultiClass", thread_count=threads,
+                                  random_seed=seed, verbose=0)
+    if name == "random_forest":
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(n_estimators=100, n_jobs=threads, random_state=seed)
+    raise ValueError(f"Unknown candidate: {name}")
+
+
+def dataset_key(csv_path, folds, sample, seed):
+    stat = os.stat(csv_path)
+    key = f"{os.path.abspath(csv_path)}:{stat.st_size}:{stat.st_mtime_ns}:{folds}:{sample}:{seed}"
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def materialize_folds(csv_path=STAGE2_CSV, folds=5, sample=None, seed=42):
+    """Encode the data and write X, y and the fold indices as .npy once; returns the fold directory"""
+    from sklearn.model_selection import StratifiedKFold
+    fold_dir = os.path.join(BAKEOFF_DIR, dataset_key(csv_path, folds, sample, seed))
+    done = os.path.join(fold_dir, "meta.json")
+    if os.path.exists(done):
+        print(f"✓ Reusing encoded folds in {fold_dir}")
+        return fold_dir
+
+    start = time.perf_counter()
+    X, y = load_stage2_data(csv_path, sample=sample, seed=seed)
+    os.makedirs(fold_dir, exist_ok=True)
+    np.save(os.path.join(fold_dir, "X.npy"), np.ascontiguousarray(X))
+    np.save(os.path.join(fold_dir, "y.npy"), y)
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    for fold, (train_idx, test_idx) in enumerate(splitter.split(np.zeros(len(y)), y)):
+        np.save(os.path.join(fold_dir, f"fold{fold}_train.npy"), train_idx.astype(np.int64))
+        np.save(os.path.join(fold_dir, f"fold{fold}_test.npy"), test_idx.astype(np.int64))
+    # Written last: a directory without meta.json is an interrupted run and gets rebuilt
+    with open(done, "w") as f:
+        json.dump({"csv": csv_path, "rows": len(y), "features": X.shape[1], "folds": folds,
+                   "sample": sample, "seed": seed}, f, indent=2)
+    print(f"✓ Encoded {len(y):,} rows into {folds} folds in {time.perf_counter() - start:.0f}s -> {fold_dir}")
+    return fold_dir
+
+
+def limit_threads(threads):
+    """Pool initializer: cap the native thread pools before any model library is imported"""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+
+def model_size(model):
+    """Size in bytes of the model as joblib.dump writes it"""
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.getbuffer().nbytes
+
+
+def run_job(fold_dir, candidate, fold, threads, seed=42):
+    """Train and measure one candidate on one fold; runs in a worker process"""
+    from sklearn.metrics import accuracy_score, f1_score, log_loss
+    result = {"model": candidate, "fold": fold}
+    try:
+        model = make_candidate(candidate, threads, seed)
+    except ImportError as e:
+        return {**result, "error": f"not installed ({e.name})"}
+
+    X = np.load(os.path.join(fold_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(fold_dir, "y.npy"), mmap_mode="r")
+    train_idx = np.load(os.path.join(fold_dir, f"fold{fold}_train.npy"))
+    test_idx = np.load(os.path.join(fold_dir, f"fold{fold}_test.npy"))
+    # Fancy indexing copies only this fold's rows out of the shared mapping
+    X_train, y_train = X[train_idx], y[train_idx]
+    X_test, y_test = X[test_idx], y[test_idx]
+
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    result["fit_s"] = time.perf_counter() - start
+
+    proba = model.predict_proba(X_test)
+    result["accuracy"] = accuracy_score(y_test, proba.argmax(axis=1))
+    result["macro_f1"] = f1_score(y_test, proba.argmax(axis=1), average="macro")
+    result["log_loss"] = log_loss(y_test, proba, labels=range(len(CATEGORY_NAMES)))
+    result["size_mb"] = model_size(model) / 1e6
+
+    # Single-row latency as the app calls it (one click = one row)
+    timings = []
+    for i in range(min(LATENCY_ROWS, len(X_test))):
+        row = X_test[i:i + 1]
+        start = time.perf_counter()
+        model.predict_proba(row)
+        timings.append(time.perf_counter() - start)
+    result["single_row_p50_ms"] = float(np.percentile(timings, 50)) * 1000
+    result["single_row_p95_ms"] = float(np.percentile(timings, 95)) * 1000
+
+    batch = X_test[:BATCH_ROWS]
+    start = time.perf_counter()
+    model.predict_proba(batch)
+    result["batch_us_per_row"] = (time.perf_counter() - start) / len(batch) * 1e6
+    return result
+
+
+def leaderboard(results):
+    """Mean (and std of accuracy/fit time) per model across folds, best accuracy first"""
+    df = pd.DataFrame([r for r in results if "error" not in r])
+    if df.empty:
+        return df
+    metrics = ["accuracy", "macro_f1", "log_loss", "fit_s", "size_mb", "single_row_p50_ms", "single_row_p95_ms",
+               "batch_us_per_row"]
+    board = df.groupby("model")[metrics].mean()
+    board["accuracy_std"] = df.groupby("model")["accuracy"].std()
+    board["fit_s_std"] = df.groupby("model")["fit_s"].std()
+    board["folds"] = df.groupby("model").size()
+    return board.sort_values("accuracy", ascending=False).reset_index()
+
+
+def run_bakeoff(csv_path=STAGE2_CSV, models=CANDIDATES, folds=5, jobs=None, threads=None, sample=None, seed=42):
+    cores = os.cpu_count() or 1
+    jobs = jobs or max(1, min(len(models) * folds, cores))
+    threads = threads or max(1, cores // jobs)
+    fold_dir = materialize_folds(csv_path, folds, sample, seed)
+
+    print(f"Running {len(models)} models x {folds} folds on {jobs} processes x {threads} threads")
+    results = []
+    # spawn: workers start without the parent's thread pools and pick up limit_threads first
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=limit_threads,
+                             initargs=(threads,)) as pool:
+        futures = [pool.submit(run_job, fold_dir, name, fold, threads, seed) for name in models
+                   for fold in range(folds)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if "error" in result:
+                print(f"WARNING: {result['model']} fold {result['fold']} skipped: {result['error']}")
+            else:
+                print(f"✓ {result['model']} fold {result['fold']}: accuracy {result['accuracy']:.4f}, "
+                      f"fit {result['fit_s']:.1f}s")
+
+    board = leaderboard(results)
+    os.makedirs(BAKEOFF_DIR, exist_ok=True)
+    board.to_csv(os.path.join(BAKEOFF_DIR, "leaderboard.csv"), index=False)
+    with open(os.path.join(BAKEOFF_DIR, "leaderboard.json"), "w") as f:
+        json.dump({"fold_dir": fold_dir, "jobs": jobs, "threads": threads, "results": results}, f, indent=2)
+    return board
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validated bake-off of Stage 2 candidate models")
+    parser.add_argument("--csv", default=STAGE2_CSV)
+    parser.add_argument("--models", nargs="+", choices=CANDIDATES, default=list(CANDIDATES))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--threads", type=int, default=None, help="Threads per job (default: cores // jobs)")
+    parser.add_argument("--sample", type=int, default=None, help="Use a random sample of rows")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    board = run_bakeoff(args.csv, args.models, args.folds, args.jobs, args.threads, args.sample, args.seed)
+    if board.empty:
+        print("WARNING: No candidate could be trained")
+    else:
+        print("\n" + board.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+        print(f"\n✓ Leaderboard written to {BAKEOFF_DIR}/leaderboard.csv")
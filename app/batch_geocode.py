@@ -0,0 +1,196 @@
+"""
+Concurrent batch geocoding and scoring.
+
+Geocodes thousands of addresses with asyncio over one pooled aiohttp
+session. Concurrency is bounded by a semaphore and the request rate by a
+token bucket (Nominatim's usage policy allows 1 request/second). 429s, 5xx
+and transport errors are retried with exponential backoff (other 4xx
+answers are final), and the endpoint is pluggable so the same code runs
+against geocode_stub.py.
+
+The coordinates are then resolved to precincts/boroughs in one vectorized
+lookup and scored in one batch.
+
+Usage (from the app/ directory):
+    python batch_geocode.py venues.txt --out venues_scored.csv --date 2025-07-12 --hour 22
+"""
+import argparse
+import asyncio
+import datetime
+import email.utils
+import random
+import time
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+USER_AGENT = "NYC-SafetyScope-AI/batch-geocoder"
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 1.0  # requests per second
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # seconds, doubled on every retry
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delay in seconds or an HTTP date), None if unusable"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+async def geocode_one(session, query, endpoint, limiter, semaphore, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Geocode one address; returns (lat, lon) or None. Never raises, so one bad answer can't abort a batch"""
+    params = {"q": query, "format": "json", "limit": 1}
+    async with semaphore:
+        for attempt in range(retries + 1):
+            await limiter.acquire()
+            try:
+                async with session.get(endpoint, params=params) as response:
+                    if response.status == 429 or response.status >= 500:
+                        retry_after = response.headers.get("Retry-After")
+                        raise RetryableError(f"HTTP {response.status}", parse_retry_after(retry_after))
+                    if response.status >= 400:  # 400/403/404...: retrying would only spend rate-limit tokens
+                        print(f"Error geocoding {query!r}: HTTP {response.status}")
+                        return None
+                    data = await response.json(content_type=None)
+                    if not data:
+                        return None
+                    return float(data[0]["lat"]), float(data[0]["lon"])
+            except (aiohttp.ClientError, asyncio.TimeoutError, RetryableError) as e:
+                if attempt == retries:
+                    print(f"Error geocoding {query!r}: {e}")
+                    return None
+                delay = backoff * 2 ** attempt + random.uniform(0, backoff)
+                if isinstance(e, RetryableError) and e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                await asyncio.sleep(delay)
+            except (ValueError, KeyError, IndexError, TypeError) as e:  # json.JSONDecodeError is a ValueError
+                print(f"Error geocoding {query!r}: malformed response ({type(e).__name__}: {e})")
+                return None
+
+
+async def geocode_all(queries, endpoint=NOMINATIM_URL, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                      retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, timeout=10):
+    """Geocode all queries concurrently; results are in input order"""
+    limiter = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT},
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        return await asyncio.gather(*[
+            geocode_one(session, query, endpoint, limiter, semaphore, retries, backoff) for query in queries
+        ])
+
+
+def batch_geocode(queries, **kwargs):
+    """Synchronous wrapper around geocode_all"""
+    return asyncio.run(geocode_all(list(queries), **kwargs))
+
+
+def geocode_and_score(queries, date, hour, place, age, race, gender, **geocode_kwargs):
+    """
+    Geocode addresses, resolve precinct/borough in bulk and score them in one batch.
+    Returns a DataFrame with one row per address.
+    """
+    # Imported here so geocoding alone does not load the models
+    import service
+    from geo_lookup import resolve_precincts_boroughs
+
+    coordinates = batch_geocode(queries, **geocode_kwargs)
+    df = pd.DataFrame({
+        "address": list(queries),
+        "lat": [c[0] if c else np.nan for c in coordinates],
+        "lon": [c[1] if c else np.nan for c in coordinates],
+    })
+    df["precinct"], df["borough"] = None, None
+    df["status"], df["risk_level"], df["crime_probability"], df["crime_type"] = None, None, np.nan, None
+    df["model_version"] = None
+
+    found = df["lat"].notna().values
+    if found.any():
+        precincts, boroughs = resolve_precincts_boroughs(df.loc[found, "lat"].values, df.loc[found, "lon"].values)
+        df.loc[found, "precinct"], df.loc[found, "borough"] = precincts, boroughs
+
+    inside = df["precinct"].notna().values & df["borough"].notna().values
+    if inside.any():
+        rows = df[inside]
+        result = service.predict_two_stage_batch(
+            date, hour, rows["lat"].values, rows["lon"].values, place, age, race, gender,
+            rows["precinct"].values, rows["borough"].values
+        )
+        df.loc[inside, "status"] = result["status"]
+        df.loc[inside, "risk_level"] = result["risk_level"]
+        df.loc[inside, "crime_type"] = result["crime_type"]
+        df.loc[inside, "model_version"] = result["model_version"]
+        if result["crime_probability"] is not None:
+            df.loc[inside, "crime_probability"] = result["crime_probability"]
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geocode and score a list of addresses (one per line)")
+    parser.add_argument("addresses")
+    parser.add_argument("--out", default="scored_addresses.csv")
+    parser.add_argument("--endpoint", default=NOMINATIM_URL)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Max requests per second")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--date", default=datetime.date.today().isoformat())
+    parser.add_argument("--hour", type=int, default=12)
+    parser.add_argument("--place", default="In park")
+    parser.add_argument("--age", type=int, default=30)
+    parser.add_argument("--race", default="WHITE")
+    parser.add_argument("--gender", default="Male")
+    args = parser.parse_args()
+
+    with open(args.addresses) as f:
+        addresses = [line.strip() for line in f if line.strip()]
+    start = time.perf_counter()
+    scored = geocode_and_score(
+        addresses, datetime.date.fromisoformat(args.date), args.hour, args.place, args.age, args.race, args.gender,
+        endpoint=args.endpoint, concurrency=args.concurrency, rate=args.rate, retries=args.retries
+    )
+    scored.to_csv(args.out, index=False)
+    print(f"✓ {scored['lat'].notna().sum()}/{len(scored)} addresses geocoded and scored "
+          f"in {time.perf_counter() - start:.1f}s -> {args.out}")
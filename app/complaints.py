@@ -0,0 +1,77 @@
+"""
+Shared helpers for reading the NYPD Complaint Data Historic CSV.
+
+The raw file is several GB, so it is always read in chunks with only the
+columns a build step needs. Each chunk is cleaned the same way as in
+research/EDA.ipynb and gets the derived columns used across the app:
+year, month, day, hour, weekday (0=Monday) and category (crime type code).
+"""
+import numpy as np
+import pandas as pd
+
+COMPLAINTS_CSV = "../nypd-data/NYPD_Complaint_Data_Historic.csv"
+CHUNKSIZE = 500_000
+
+# Crime type mapping shared with the Stage 2 model (class code -> name, offenses)
+CRIME_TYPES = {
+    0: ('DRUGS/ALCOHOL', ['DANGEROUS DRUGS', 'INTOXICATED & IMPAIRED DRIVING',
+          'ALCOHOLIC BEVERAGE CONTROL LAW', 'INTOXICATED/IMPAIRED DRIVING',
+          'UNDER THE INFLUENCE OF DRUGS', 'LOITERING FOR DRUG PURPOSES']),
+    2: ('PROPERTY', ['BURGLARY', 'PETIT LARCENY', 'GRAND LARCENY', 'ROBBERY', 'THEFT-FRAUD',
+     'GRAND LARCENY OF MOTOR VEHICLE', 'FORGERY', 'JOSTLING', 'ARSON',
+     'PETIT LARCENY OF MOTOR VEHICLE', 'OTHER OFFENSES RELATED TO THEF',
+     "BURGLAR'S TOOLS", 'FRAUDS', 'POSSESSION OF STOLEN PROPERTY',
+     'CRIMINAL MISCHIEF & RELATED OF', 'OFFENSES INVOLVING FRAUD',
+     'FRAUDULENT ACCOSTING', 'THEFT OF SERVICES']),
+    1: ('PERSONAL', ['ASSAULT 3 & RELATED OFFENSES', 'FELONY ASSAULT',
+         'OFFENSES AGAINST THE PERSON', 'HOMICIDE-NEGLIGENT,UNCLASSIFIE',
+         'HOMICIDE-NEGLIGENT-VEHICLE', 'KIDNAPPING & RELATED OFFENSES',
+         'ENDAN WELFARE INCOMP', 'OFFENSES RELATED TO CHILDREN',
+         'CHILD ABANDONMENT/NON SUPPORT', 'KIDNAPPING', 'DANGEROUS WEAPONS',
+         'UNLAWFUL POSS. WEAP. ON SCHOOL']),
+    3: ('SEXUAL', ['SEX CRIMES', 'HARRASSMENT 2', 'RAPE', 'PROSTITUTION & RELATED OFFENSES',
+       'FELONY SEX CRIMES', 'LOITERING/DEVIATE SEX'])
+}
+
+CATEGORY_NAMES = [CRIME_TYPES[code][0] for code in sorted(CRIME_TYPES)]
+
+# OFNS_DESC -> category code; offenses outside the four categories map to -1
+OFFENSE_TO_CATEGORY = {
+    offense: code for code, (name, offenses) in CRIME_TYPES.items() for offense in offenses
+}
+
+
+def clean_chunk(chunk):
+    """Parse dates/times, drop unusable rows and add the derived columns"""
+    chunk = chunk.copy()
+    if "CMPLNT_FR_DT" in chunk:
+        dates = pd.to_datetime(chunk["CMPLNT_FR_DT"], format="%m/%d/%Y", errors="coerce")
+        chunk = chunk[dates.notna()]
+        dates = dates[dates.notna()]
+        chunk["year"] = dates.dt.year.astype(np.int16)
+        chunk["month"] = dates.dt.month.astype(np.int8)
+        chunk["day"] = dates.dt.day.astype(np.int8)
+        chunk["weekday"] = dates.dt.weekday.astype(np.int8)
+        chunk["date"] = dates.values.astype("datetime64[D]")
+        chunk = chunk.drop(columns="CMPLNT_FR_DT")
+    if "CMPLNT_FR_TM" in chunk:
+        times = pd.to_datetime(chunk["CMPLNT_FR_TM"], format="%H:%M:%S", errors="coerce")
+        chunk = chunk[times.notna()]
+        chunk["hour"] = times[times.notna()].dt.hour.astype(np.int8)
+        chunk = chunk.drop(columns="CMPLNT_FR_TM")
+    if "Latitude" in chunk:
+        chunk = chunk[chunk["Latitude"].notna() & chunk["Longitude"].notna()]
+    if "ADDR_PCT_CD" in chunk:
+        chunk = chunk[chunk["ADDR_PCT_CD"].notna()]
+        chunk["ADDR_PCT_CD"] = chunk["ADDR_PCT_CD"].astype(np.int16)
+    if "BORO_NM" in chunk:
+        chunk["BORO_NM"] = chunk["BORO_NM"].fillna("UNKNOWN")
+    if "OFNS_DESC" in chunk:
+        chunk["category"] = chunk["OFNS_DESC"].map(OFFENSE_TO_CATEGORY).fillna(-1).astype(np.int8)
+    return chunk
+
+
+def iter_complaints(path=COMPLAINTS_CSV, columns=None, chunksize=CHUNKSIZE):
+    """Yield cleaned chunks of the complaint CSV, reading only `columns`"""
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize, low_memory=False):
+        yield clean_chunk(chunk)
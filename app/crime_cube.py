@@ -0,0 +1,110 @@
+"""
+Precomputed historical crime cube: incident counts per
+precinct x hour x weekday x month x crime category.
+
+Build once from the complaint CSV (from the app/ directory):
+    python crime_cube.py --csv ../nypd-data/NYPD_Complaint_Data_Historic.csv
+
+The cube is a dense uint32 array saved as .npy and memory-mapped at load
+time, so answering "how many incidents happened here at this time?" is an
+array slice instead of a scan over the full CSV.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from complaints import CATEGORY_NAMES, COMPLAINTS_CSV, iter_complaints
+
+CUBE_PATH = "./data/crime_cube.npy"
+
+# Precinct numbers go up to 123, so they are used directly as the first index
+N_PRECINCTS = 124
+SHAPE = (N_PRECINCTS, 24, 7, 12, len(CATEGORY_NAMES))
+
+CUBE_COLUMNS = ["CMPLNT_FR_DT", "CMPLNT_FR_TM", "ADDR_PCT_CD", "OFNS_DESC"]
+
+
+def metadata_path(cube_path):
+    return os.path.splitext(cube_path)[0] + ".json"
+
+
+def build_cube(csv_path=COMPLAINTS_CSV, cube_path=CUBE_PATH):
+    """Aggregate the complaint CSV into the dense count cube"""
+    counts = np.zeros(int(np.prod(SHAPE)), dtype=np.int64)
+    first_year, last_year, n_rows = None, None, 0
+    for chunk in iter_complaints(csv_path, columns=CUBE_COLUMNS):
+        chunk = chunk[(chunk["category"] >= 0) & (chunk["ADDR_PCT_CD"] >= 0) & (chunk["ADDR_PCT_CD"] < N_PRECINCTS)]
+        if chunk.empty:
+            continue
+        flat = np.ravel_multi_index(
+            (chunk["ADDR_PCT_CD"].values, chunk["hour"].values, chunk["weekday"].values,
+             chunk["month"].values - 1, chunk["category"].values),
+            SHAPE
+        )
+        counts += np.bincount(flat, minlength=counts.size)
+        years = chunk["year"].values
+        first_year = int(years.min()) if first_year is None else min(first_year, int(years.min()))
+        last_year = int(years.max()) if last_year is None else max(last_year, int(years.max()))
+        n_rows += len(chunk)
+
+    os.makedirs(os.path.dirname(cube_path) or ".", exist_ok=True)
+    np.save(cube_path, counts.reshape(SHAPE).astype(np.uint32))
+    with open(metadata_path(cube_path), "w") as f:
+        json.dump({"first_year": first_year, "last_year": last_year, "n_incidents": n_rows,
+                   "categories": CATEGORY_NAMES}, f)
+    print(f"✓ Crime cube built from {n_rows:,} incidents ({first_year}-{last_year}) -> {cube_path}")
+
+
+class CrimeCube:
+    """Read-only, memory-mapped view of the crime cube"""
+
+    def __init__(self, cube_path=CUBE_PATH):
+        self.counts = np.load(cube_path, mmap_mode="r")
+        with open(metadata_path(cube_path)) as f:
+            self.metadata = json.load(f)
+
+    @property
+    def n_years(self):
+        return self.metadata["last_year"] - self.metadata["first_year"] + 1
+
+    def _slice(self, precinct, hour=None, weekday=None, month=None):
+        index = (
+            int(float(precinct)),
+            slice(None) if hour is None else int(hour),
+            slice(None) if weekday is None else int(weekday),
+            slice(None) if month is None else int(month) - 1,
+        )
+        return self.counts[index]
+
+    def counts_by_category(self, precinct, hour=None, weekday=None, month=None):
+        """
+        Incident counts per crime category for a precinct.
+        Any of hour (0-23), weekday (0=Monday) and month (1-12) left as None is summed over.
+        """
+        if not 0 <= int(float(precinct)) < N_PRECINCTS:
+            return {name: 0 for name in CATEGORY_NAMES}
+        cell = np.asarray(self._slice(precinct, hour, weekday, month))
+        totals = cell.reshape(-1, len(CATEGORY_NAMES)).sum(axis=0)
+        return {name: int(total) for name, total in zip(CATEGORY_NAMES, totals)}
+
+    def hourly_profile(self, precinct, weekday=None, month=None):
+        """Total incidents per hour (24 values) for a precinct"""
+        cell = np.asarray(self._slice(precinct, None, weekday, month))
+        return cell.reshape(24, -1).sum(axis=1)
+
+
+def load_cube(cube_path=CUBE_PATH):
+    """Load the crime cube, returning None when it has not been built"""
+    if not os.path.exists(cube_path):
+        return None
+    return CrimeCube(cube_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the historical crime cube")
+    parser.add_argument("--csv", default=COMPLAINTS_CSV)
+    parser.add_argument("--out", default=CUBE_PATH)
+    args = parser.parse_args()
+    build_cube(args.csv, args.out)
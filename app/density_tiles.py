@@ -0,0 +1,125 @@
+"""
+Multi-resolution incident density pyramid for the map.
+
+Incident coordinates are binned into Web Mercator grid cells for every map
+zoom level the app allows (11-15). Each zoom level uses cells of
+1/2**CELL_BITS of a map tile (32 px with CELL_BITS = 3), so the number of
+cells visible in the viewport - and therefore the payload sent to the
+browser - is bounded by the screen size, not by how many years of data
+were aggregated.
+
+Build once from the complaint CSV (from the app/ directory):
+    python density_tiles.py --csv ../nypd-data/NYPD_Complaint_Data_Historic.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from complaints import COMPLAINTS_CSV, iter_complaints
+
+TILES_PATH = "./data/density_tiles.npz"
+
+MIN_ZOOM = 11
+MAX_ZOOM = 15
+CELL_BITS = 3
+MAX_CELLS = 2000
+
+TILE_COLUMNS = ["Latitude", "Longitude"]
+
+
+def lon_lat_to_grid(lon, lat, level):
+    """Web Mercator grid indices of lon/lat at a given grid level (zoom + CELL_BITS)"""
+    n = 2 ** level
+    lat_rad = np.radians(np.clip(lat, -85.0511, 85.0511))
+    x = (np.asarray(lon) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+    return (x * n).astype(np.int64), (y * n).astype(np.int64)
+
+
+def grid_to_lon_lat(ix, iy, level):
+    """Lon/lat of the centre of grid cells"""
+    n = 2 ** level
+    lon = (np.asarray(ix) + 0.5) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (np.asarray(iy) + 0.5) / n))))
+    return lon, lat
+
+
+def build_tiles(csv_path=COMPLAINTS_CSV, tiles_path=TILES_PATH):
+    """Aggregate incident coordinates into the density pyramid"""
+    level = MAX_ZOOM + CELL_BITS
+    totals = pd.Series(dtype=np.int64)
+    for chunk in iter_complaints(csv_path, columns=TILE_COLUMNS):
+        ix, iy = lon_lat_to_grid(chunk["Longitude"].values, chunk["Latitude"].values, level)
+        counts = pd.Series(ix << 32 | iy).value_counts()
+        totals = totals.add(counts, fill_value=0)
+
+    keys = totals.index.values.astype(np.int64)
+    counts = totals.values.astype(np.int64)
+    ix, iy = keys >> 32, keys & 0xFFFFFFFF
+
+    arrays = {}
+    for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+        shift = MAX_ZOOM - zoom
+        level_keys = (ix >> shift) << 32 | (iy >> shift)
+        level = pd.Series(counts).groupby(level_keys).sum().sort_index()
+        level_keys = level.index.values.astype(np.int64)
+        arrays[f"z{zoom}_x"] = (level_keys >> 32).astype(np.uint32)
+        arrays[f"z{zoom}_y"] = (level_keys & 0xFFFFFFFF).astype(np.uint32)
+        arrays[f"z{zoom}_count"] = level.values.astype(np.uint32)
+
+    os.makedirs(os.path.dirname(tiles_path) or ".", exist_ok=True)
+    np.savez_compressed(tiles_path, **arrays)
+    print(f"✓ Density pyramid (zoom {MIN_ZOOM}-{MAX_ZOOM}) built from {int(counts.sum()):,} incidents -> {tiles_path}")
+
+
+class DensityTiles:
+    """In-memory density pyramid; cells of each zoom are sorted by x then y"""
+
+    def __init__(self, tiles_path=TILES_PATH):
+        with np.load(tiles_path) as f:
+            self.levels = {
+                zoom: (f[f"z{zoom}_x"], f[f"z{zoom}_y"], f[f"z{zoom}_count"])
+                for zoom in range(MIN_ZOOM, MAX_ZOOM + 1)
+            }
+
+    def visible_cells(self, zoom, south, west, north, east, max_cells=MAX_CELLS):
+        """
+        Cells intersecting the viewport at the given zoom, as [lat, lon, weight] rows
+        (weight normalised to 0-1). At most max_cells of the densest cells are returned.
+        """
+        zoom = int(min(max(round(zoom), MIN_ZOOM), MAX_ZOOM))
+        level = zoom + CELL_BITS
+        xs, ys, counts = self.levels[zoom]
+
+        (x0, x1), (y1, y0) = lon_lat_to_grid(np.array([west, east]), np.array([south, north]), level)
+        lo, hi = np.searchsorted(xs, [x0, x1 + 1])
+        x, y, c = xs[lo:hi], ys[lo:hi], counts[lo:hi]
+        in_view = (y >= y0) & (y <= y1)
+        x, y, c = x[in_view], y[in_view], c[in_view]
+
+        if len(c) > max_cells:
+            top = np.argpartition(c, -max_cells)[-max_cells:]
+            x, y, c = x[top], y[top], c[top]
+        if len(c) == 0:
+            return []
+
+        lon, lat = grid_to_lon_lat(x, y, level)
+        weight = c / c.max()
+        return np.column_stack([lat, lon, weight]).tolist()
+
+
+def load_tiles(tiles_path=TILES_PATH):
+    """Load the density pyramid, returning None when it has not been built"""
+    if not os.path.exists(tiles_path):
+        return None
+    return DensityTiles(tiles_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the incident density pyramid")
+    parser.add_argument("--csv", default=COMPLAINTS_CSV)
+    parser.add_argument("--out", default=TILES_PATH)
+    args = parser.parse_args()
+    build_tiles(args.csv, args.out)
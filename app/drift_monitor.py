@@ -0,0 +1,354 @@
+"""
+Streaming input-drift monitor for predict_two_stage().
+
+Every prediction updates a constant-size summary of the current window:
+fixed-bin histograms for hour, weekday, month, latitude, longitude and the
+Stage 1 crime probability, and a count-min sketch per categorical input
+(borough, precinct, age group, gender, race, place) and for the predicted
+crime type, so neither traffic volume nor unseen values grow memory.
+
+A background thread closes the window every DRIFT_CHECK_SECONDS and compares
+it with the training profile: PSI for every feature plus a binned KS
+statistic for the histograms. The outputs (crime probability and type) are
+compared with the output reference: the active models' predictions on a
+sample of training incidents, written by the profiling step. Every serve.py
+worker runs its own monitor, so each writes data/drift/latest-<pid>.json
+(replaced atomically) and appends PID-tagged lines to
+data/drift/history.jsonl; features above PSI_ALERT are logged.
+
+Build the training profile and output reference once, and again after a
+model update (from the app/ directory):
+    python drift_monitor.py --csv ../nypd-data/NYPD_Complaint_Data_Historic.csv
+    python drift_monitor.py --benchmark        # per-request overhead
+"""
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from complaints import COMPLAINTS_CSV, iter_complaints
+
+DRIFT_DIR = "./data/drift"
+PROFILE_PATH = "./data/drift/training_profile.json"
+OUTPUT_REFERENCE_PATH = "./data/drift/output_reference.json"
+
+ENABLED = os.environ.get("SAFETYSCOPE_DRIFT_MONITOR", "1") == "1"
+DRIFT_CHECK_SECONDS = float(os.environ.get("SAFETYSCOPE_DRIFT_CHECK_SECONDS", "300"))
+MIN_SAMPLES = 200  # a window with fewer predictions is carried over to the next check
+
+PSI_WARN = 0.1
+PSI_ALERT = 0.25
+
+# name -> (low, high, bins); values outside the range fall into the end bins
+HISTOGRAMS = {
+    "hour": (0, 24, 24),
+    "weekday": (0, 7, 7),
+    "month": (1, 13, 12),
+    "latitude": (40.49, 40.92, 32),
+    "longitude": (-74.26, -73.69, 32),
+    "crime_probability": (0, 1, 20),
+}
+SKETCHES = ("borough", "precinct", "age_group", "gender", "race", "place", "crime_type")
+OUTPUT_FEATURES = ("crime_probability", "crime_type")
+
+CMS_WIDTH = 512
+CMS_SEEDS = (0x9E3779B9, 0x85EBCA6B, 0xC2B2AE35, 0x27D4EB2F)
+
+# Training columns -> monitored features
+PROFILE_COLUMNS = ["CMPLNT_FR_DT", "CMPLNT_FR_TM", "BORO_NM", "ADDR_PCT_CD", "VIC_AGE_GROUP", "VIC_SEX",
+                   "VIC_RACE", "Latitude", "Longitude"]
+PROFILE_CATEGORICALS = {"BORO_NM": "borough", "ADDR_PCT_CD": "precinct", "VIC_AGE_GROUP": "age_group",
+                        "VIC_SEX": "gender", "VIC_RACE": "race"}
+MIN_VOCABULARY_SHARE = 1e-4  # rarer training values are left out of the vocabulary
+OUTPUT_SAMPLE_ROWS = 5000  # training incidents scored for the output reference
+SAMPLE_AGES = {"<18": 16, "18-24": 21, "25-44": 35, "45-64": 55, "65+": 70}
+SAMPLE_PLACES = ["In park", "In public housing", "In station"]
+
+
+def bin_index(value, low, high, bins):
+    i = int((value - low) * bins / (high - low))
+    return 0 if i < 0 else bins - 1 if i >= bins else i
+
+
+class CountMinSketch:
+    """Fixed-size frequency sketch; estimates never undercount"""
+
+    def __init__(self, width=CMS_WIDTH, seeds=CMS_SEEDS):
+        self.width = width
+        self.seeds = seeds
+        self.rows = [[0] * width for _ in seeds]
+        self.total = 0
+
+    def add(self, key):
+        data = str(key).encode()
+        for row, seed in zip(self.rows, self.seeds):
+            row[zlib.crc32(data, seed) % self.width] += 1
+        self.total += 1
+
+    def estimate(self, key):
+        data = str(key).encode()
+        return min(row[zlib.crc32(data, seed) % self.width] for row, seed in zip(self.rows, self.seeds))
+
+
+class Window:
+    """Histograms and sketches of the predictions seen since the last check"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.n = 0
+        self.histograms = {name: [0] * bins for name, (_, _, bins) in HISTOGRAMS.items()}
+        self.sketches = {name: CountMinSketch() for name in SKETCHES}
+
+    def counts(self, name, vocabulary=None):
+        """Counts of a histogram, or sketch estimates over `vocabulary` plus an 'other' bucket"""
+        if name in self.histograms:
+            return np.array(self.histograms[name], dtype=np.float64)
+        sketch = self.sketches[name]
+        estimates = np.array([sketch.estimate(value) for value in vocabulary], dtype=np.float64)
+        estimates = np.minimum(estimates, sketch.total)
+        return np.append(estimates, max(sketch.total - estimates.sum(), 0))
+
+
+def psi(expected, actual, eps=1e-4):
+    """Population stability index between two count vectors"""
+    p = np.maximum(expected / max(expected.sum(), 1), eps)
+    q = np.maximum(actual / max(actual.sum(), 1), eps)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def binned_ks(expected, actual):
+    """Largest CDF gap between two histograms over the same ordered bins"""
+    p = np.cumsum(expected) / max(expected.sum(), 1)
+    q = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.max(np.abs(p - q)))
+
+
+def status(value):
+    return "alert" if value >= PSI_ALERT else "warn" if value >= PSI_WARN else "ok"
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data, **kwargs):
+    """Write through a temporary file and rename, so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(path + ".tmp", path)
+
+
+class DriftMonitor:
+    """Per-request observe() into the current window; check() compares it with the reference"""
+
+    def __init__(self, profile_path=PROFILE_PATH, output_reference_path=OUTPUT_REFERENCE_PATH, drift_dir=DRIFT_DIR):
+        self.profile = load_json(profile_path) or {"histograms": {}, "categoricals": {}}
+        self.output_reference_path = output_reference_path
+        self.output_reference = load_json(output_reference_path)
+        self.drift_dir = drift_dir
+        self.window = Window()
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def observe(self, weekday, month, hour, latitude, longitude, borough, precinct, age_group, gender, race,
+                place, crime_probability=None, crime_type=None):
+        """Record one prediction; a handful of integer increments under a lock"""
+        with self._lock:
+            window = self.window
+            histograms, sketches = window.histograms, window.sketches
+            window.n += 1
+            for name, value in (("hour", hour), ("weekday", weekday), ("month", month),
+                                ("latitude", latitude), ("longitude", longitude)):
+                low, high, bins = HISTOGRAMS[name]
+                histograms[name][bin_index(value, low, high, bins)] += 1
+            if crime_probability is not None:
+                histograms["crime_probability"][bin_index(crime_probability / 100, *HISTOGRAMS["crime_probability"])] += 1
+            for name, value in (("borough", borough), ("precinct", precinct), ("age_group", age_group),
+                                ("gender", gender), ("race", race), ("place", place), ("crime_type", crime_type)):
+                sketches[name].add(value)
+
+    def compare(self, window, name, reference):
+        """PSI (and KS for histograms) of one feature against its reference counts"""
+        if name in HISTOGRAMS:
+            expected = np.array(reference, dtype=np.float64)
+            actual = window.counts(name)
+            if not actual.sum():
+                return None
+            return {"psi": round(psi(expected, actual), 4), "ks": round(binned_ks(expected, actual), 4)}
+        vocabulary = list(reference)
+        expected = np.append(np.array([reference[v] for v in vocabulary], dtype=np.float64), 0)
+        actual = window.counts(name, vocabulary)
+        if not actual.sum():
+            return None
+        return {"psi": round(psi(expected, actual), 4), "unseen_share": round(actual[-1] / actual.sum(), 4)}
+
+    @staticmethod
+    def output_counts(window):
+        """Output distributions of a window, in the output reference's format"""
+        return {
+            "histograms": {"crime_probability": window.histograms["crime_probability"]},
+            "categoricals": {"crime_type": {v: window.sketches["crime_type"].estimate(v)
+                                            for v in ("DRUGS/ALCOHOL", "PERSONAL", "PROPERTY", "SEXUAL", "None")}},
+        }
+
+    def check(self):
+        """Close the current window (if it has enough predictions) and report drift against the references"""
+        with self._lock:
+            if self.window.n < MIN_SAMPLES:
+                return None
+            window, self.window = self.window, Window()
+
+        features = {}
+        for source in (self.profile, self.output_reference or {}):
+            for kind in ("histograms", "categoricals"):
+                for name, reference in source.get(kind, {}).items():
+                    result = self.compare(window, name, reference)
+                    if result is not None:
+                        result["status"] = status(result["psi"])
+                        features[name] = result
+        report = {
+            "pid": os.getpid(),
+            "window_start": datetime.datetime.fromtimestamp(window.started).isoformat(timespec="seconds"),
+            "window_end": datetime.datetime.now().isoformat(timespec="seconds"),
+            "n": window.n,
+            "features": features,
+            "alerts": sorted(name for name, result in features.items() if result["status"] == "alert"),
+        }
+        self.last_report = report
+        write_json(os.path.join(self.drift_dir, f"latest-{os.getpid()}.json"), report, indent=2)
+        # One write() per line on an O_APPEND descriptor, so lines from several workers never interleave
+        fd = os.open(os.path.join(self.drift_dir, "history.jsonl"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(report) + "\n").encode())
+        finally:
+            os.close(fd)
+        if report["alerts"]:
+            print(f"WARNING: Input drift (PSI >= {PSI_ALERT}) in {', '.join(report['alerts'])} "
+                  f"over the last {window.n} predictions")
+        return report
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"WARNING: Drift check failed: {e}")
+
+    def start(self, interval=DRIFT_CHECK_SECONDS):
+        """Start the scheduled checks (once per process)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, args=(interval,), daemon=True, name="drift-monitor")
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def build_profile(csv_path=COMPLAINTS_CSV, profile_path=PROFILE_PATH):
+    """Histograms and categorical counts of the training data, in the monitor's bins"""
+    histograms = {name: np.zeros(bins, dtype=np.int64) for name, (_, _, bins) in HISTOGRAMS.items()
+                  if name not in OUTPUT_FEATURES}
+    categoricals = {name: {} for name in PROFILE_CATEGORICALS.values()}
+    columns = {"hour": "hour", "weekday": "weekday", "month": "month", "latitude": "Latitude", "longitude": "Longitude"}
+    n_rows = 0
+    for chunk in iter_complaints(csv_path, columns=PROFILE_COLUMNS):
+        for name, column in columns.items():
+            low, high, bins = HISTOGRAMS[name]
+            values = chunk[column].values.astype(np.float64)
+            if name in ("latitude", "longitude"):
+                values = values[(values >= low) & (values < high)]  # (0, 0) and other bad geocodes
+            idx = np.clip(((values - low) * bins / (high - low)).astype(np.int64), 0, bins - 1)
+            histograms[name] += np.bincount(idx, minlength=bins)
+        for column, name in PROFILE_CATEGORICALS.items():
+            values = chunk[column].fillna("UNKNOWN").astype(str).str.upper()
+            for value, count in values.value_counts().items():
+                categoricals[name][value] = categoricals[name].get(value, 0) + int(count)
+        n_rows += len(chunk)
+
+    # Drop data-entry noise (e.g. negative age groups) from the vocabularies; it counts as 'other'
+    for name, counts in categoricals.items():
+        total = sum(counts.values())
+        categoricals[name] = {v: c for v, c in counts.items() if c >= total * MIN_VOCABULARY_SHARE}
+    profile = {"n": n_rows, "histograms": {name: h.tolist() for name, h in histograms.items()},
+               "categoricals": categoricals}
+    write_json(profile_path, profile)
+    print(f"✓ Training profile from {n_rows:,} incidents -> {profile_path}")
+    return n_rows
+
+
+def build_output_reference(csv_path=COMPLAINTS_CSV, output_reference_path=OUTPUT_REFERENCE_PATH, n_rows=None,
+                           sample_rows=OUTPUT_SAMPLE_ROWS, seed=0):
+    """
+    Crime probability and crime type distributions of the active models on a sample of training incidents,
+    gated like predict_two_stage() (Stage 2 only at or above CRIME_THRESHOLD; places rotate over the app's
+    options). `n_rows` (from build_profile) sets the sampling rate.
+    """
+    import pandas as pd
+    import service
+    models = service.registry.active
+    share = min(1.0, sample_rows / n_rows) if n_rows else 1.0
+    sample = pd.concat([chunk.sample(frac=share, random_state=seed)
+                        for chunk in iter_complaints(csv_path, columns=PROFILE_COLUMNS)], ignore_index=True)
+    sample = sample[sample["VIC_AGE_GROUP"].isin(SAMPLE_AGES)].head(sample_rows)
+
+    window = Window()
+    for i, row in enumerate(sample.itertuples(index=False)):
+        date, hour = pd.Timestamp(row.date).date(), int(row.hour)
+        borough, age, gender = row.BORO_NM.title(), SAMPLE_AGES[row.VIC_AGE_GROUP], row.VIC_SEX
+        if models.safety_model is not None:
+            stage1 = service.stage1_input(models.safety_model, date, hour, borough, age, gender)
+            crime_proba = float(models.safety_model.predict_proba(stage1)[0][0])  # Class 0 = CRIME
+        else:
+            crime_proba = 0.6  # predict_two_stage's default without Stage 1
+        crime_type = None
+        if crime_proba >= service.CRIME_THRESHOLD:
+            stage2 = service.create_df(date, hour, row.Latitude, row.Longitude, SAMPLE_PLACES[i % len(SAMPLE_PLACES)],
+                                       age, str(row.VIC_RACE), gender, row.ADDR_PCT_CD, borough)
+            crime_type = service.predict(stage2, models)["crime_type"]
+        window.n += 1
+        window.histograms["crime_probability"][bin_index(crime_proba, *HISTOGRAMS["crime_probability"])] += 1
+        window.sketches["crime_type"].add(crime_type)
+
+    reference = DriftMonitor.output_counts(window)
+    reference["model_version"] = models.version
+    write_json(output_reference_path, reference)
+    print(f"✓ Output reference of model {models.version} from {window.n:,} training incidents "
+          f"-> {output_reference_path}")
+
+
+def benchmark(n=100_000):
+    monitor = DriftMonitor(profile_path="", output_reference_path="")
+    rng = np.random.default_rng(0)
+    hours, lats, lons = rng.integers(0, 24, n).tolist(), rng.uniform(40.5, 40.9, n).tolist(), rng.uniform(-74.2, -73.7, n).tolist()
+    start = time.perf_counter()
+    for i in range(n):
+        monitor.observe(i % 7, i % 12 + 1, hours[i], lats[i], lons[i], "MANHATTAN", 14, "25-44", "F", "WHITE",
+                        "In park", 55.0, "PROPERTY")
+    elapsed = time.perf_counter() - start
+    print(f"✓ observe(): {elapsed / n * 1e6:.1f} µs per prediction")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the drift monitor's training profile")
+    parser.add_argument("--csv", default=COMPLAINTS_CSV)
+    parser.add_argument("--out", default=PROFILE_PATH)
+    parser.add_argument("--output-reference", default=OUTPUT_REFERENCE_PATH)
+    parser.add_argument("--benchmark", action="store_true", help="Measure the per-request overhead instead")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+    else:
+        build_output_reference(args.csv, args.output_reference, build_profile(args.csv, args.out))
@@ -0,0 +1,250 @@
+"""
+Threshold and calibration evaluation for the two-stage decision rules.
+
+The held-out data is scored once per model and the probabilities are cached
+under ./data/eval_cache/ (keyed by the dataset file and the active model
+version and file in the registry), so tuning
+CRIME_THRESHOLD / HIGH_RISK_THRESHOLD in service.py and the 40/65 Stage 2
+confidence cut-offs never re-runs inference. Every threshold is evaluated
+in one sorted pass: scores are sorted once and cumulative sums give the
+confusion matrix at every distinct threshold.
+
+Usage (from the app/ directory):
+    python evaluate_thresholds.py --stage1-holdout stage1_holdout.csv --stage2-holdout stage2_holdout.csv
+
+Holdout files (CSV or Parquet):
+    Stage 1: the create_stage1_df() columns plus `unsafe` (1 = crime occurred)
+    Stage 2: the STAGE2_COLUMNS of service.py plus `target` (class code 0-3)
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+EVAL_CACHE_DIR = "./data/eval_cache"
+
+
+def read_table(path):
+    return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+
+
+def cache_key(*paths, version=""):
+    """Key of a cached score file: model version plus names, sizes and mtimes of the dataset and model files"""
+    h = hashlib.sha1(version.encode())
+    for path in paths:
+        stat = os.stat(path)
+        h.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+
+def cached_scores(name, dataset_path, models, model_path, score_fn):
+    """
+    Load cached (scores, labels) or compute them once with score_fn(df, models) and cache them.
+    `models` is the registry's active ModelSet and `model_path` its joblib file for this stage, so a
+    hot-swapped or retrained version never reuses another version's scores.
+    """
+    existing = [p for p in [model_path, os.path.splitext(model_path or "")[0] + ".onnx"] if p and os.path.exists(p)]
+    path = os.path.join(EVAL_CACHE_DIR, f"{name}_{cache_key(dataset_path, *existing, version=models.version)}.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return cached["scores"], cached["labels"]
+    scores, labels = score_fn(read_table(dataset_path), models)
+    os.makedirs(EVAL_CACHE_DIR, exist_ok=True)
+    np.savez(path, scores=scores, labels=labels)
+    return scores, labels
+
+
+def score_stage1(df, models):
+    labels = df.pop("unsafe").values.astype(np.int8)
+    # Same convention as predict_two_stage: class 0 probability is the crime probability
+    scores = models.safety_model.predict_proba(df)[:, 0]
+    return scores.astype(np.float64), labels
+
+
+def score_stage2(df, models):
+    from features import STAGE2_COLUMNS
+    labels = df.pop("target").values.astype(np.int64)
+    proba = models.crime_type_model.predict_proba(df[list(STAGE2_COLUMNS)].values)
+    return proba.astype(np.float64), labels
+
+
+def threshold_sweep(scores, labels):
+    """
+    Confusion matrix, precision, recall, F1 and FPR at every distinct threshold
+    (predict positive when score >= threshold), from one sort and cumulative sums.
+    """
+    order = np.argsort(-scores, kind="mergesort")
+    s, y = scores[order], labels[order].astype(np.int64)
+    tp = np.cumsum(y)
+    fp = np.cumsum(1 - y)
+    # Last position of each run of equal scores: everything up to it is >= that score
+    last = np.r_[np.flatnonzero(np.diff(s)), len(s) - 1]
+    thresholds, tp, fp = s[last], tp[last], fp[last]
+    positives, negatives = int(y.sum()), int(len(y) - y.sum())
+    fn, tn = positives - tp, negatives - fp
+    precision = tp / np.maximum(tp + fp, 1)
+    recall = tp / max(positives, 1)
+    fpr = fp / max(negatives, 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+    return pd.DataFrame({
+        "threshold": thresholds, "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "precision": precision, "recall": recall, "fpr": fpr, "f1": f1,
+    })
+
+
+def at_threshold(sweep, threshold):
+    """Row of the sweep matching `predict positive when score >= threshold`"""
+    eligible = sweep[sweep["threshold"] >= threshold]
+    if eligible.empty:
+        row = sweep.iloc[0].copy()
+        row[["tp", "fp"]] = 0
+        row["fn"] = sweep["tp"].iloc[-1] + sweep["fn"].iloc[-1]
+        row["tn"] = sweep["fp"].iloc[-1] + sweep["tn"].iloc[-1]
+        row[["precision", "recall", "fpr", "f1"]] = 0.0
+        row["threshold"] = threshold
+        return row
+    return eligible.iloc[-1]
+
+
+def roc_auc(sweep):
+    fpr = np.r_[0.0, sweep["fpr"].values]
+    tpr = np.r_[0.0, sweep["recall"].values]
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def calibration_curve(scores, labels, n_bins=10):
+    """Mean predicted vs observed positive rate per equal-width probability bin, and the ECE"""
+    bins = np.minimum((scores * n_bins).astype(np.int64), n_bins - 1)
+    count = np.bincount(bins, minlength=n_bins)
+    predicted = np.bincount(bins, weights=scores, minlength=n_bins) / np.maximum(count, 1)
+    observed = np.bincount(bins, weights=labels, minlength=n_bins) / np.maximum(count, 1)
+    ece = float(np.sum(count * np.abs(predicted - observed)) / max(count.sum(), 1))
+    curve = pd.DataFrame({"bin_start": np.arange(n_bins) / n_bins, "count": count,
+                          "mean_predicted": predicted, "observed_rate": observed})
+    return curve, ece
+
+
+def best_operating_points(sweep, target_precision):
+    best_f1 = sweep.loc[sweep["f1"].idxmax()]
+    best_j = sweep.loc[(sweep["recall"] - sweep["fpr"]).idxmax()]
+    precise = sweep[sweep["precision"] >= target_precision]
+    lowest_precise = precise.iloc[-1] if not precise.empty else None
+    return {
+        "max_f1": float(best_f1["threshold"]),
+        "max_youden_j": float(best_j["threshold"]),
+        f"min_threshold_precision_{target_precision:g}": None if lowest_precise is None
+        else float(lowest_precise["threshold"]),
+    }
+
+
+def confidence_sweep(proba, labels):
+    """
+    Accuracy of the Stage 2 top class above every confidence cut-off (single sorted pass).
+    Returns cut-offs (percent), coverage and accuracy of the predictions at or above each cut-off.
+    """
+    confidence = proba.max(axis=1) * 100
+    correct = (proba.argmax(axis=1) == labels).astype(np.int64)
+    order = np.argsort(-confidence, kind="mergesort")
+    c, ok = confidence[order], np.cumsum(correct[order])
+    last = np.r_[np.flatnonzero(np.diff(c)), len(c) - 1]
+    n = last + 1
+    return pd.DataFrame({"cutoff": c[last], "coverage": n / len(c), "accuracy": ok[last] / n})
+
+
+def band_accuracy(proba, labels, low_cut, high_cut):
+    confidence = proba.max(axis=1) * 100
+    correct = proba.argmax(axis=1) == labels
+    bands = {"LOW": confidence < low_cut,
+             "MEDIUM": (confidence >= low_cut) & (confidence < high_cut),
+             "HIGH": confidence >= high_cut}
+    return {name: {"share": float(mask.mean()), "accuracy": float(correct[mask].mean()) if mask.any() else None}
+            for name, mask in bands.items()}
+
+
+def evaluate_stage1(scores, labels, crime_threshold, high_threshold, target_precision):
+    sweep = threshold_sweep(scores, labels)
+    curve, ece = calibration_curve(scores, labels)
+    auc = roc_auc(sweep)
+    if auc < 0.5:
+        print("WARNING: Stage 1 AUC < 0.5 - the crime class index in service.py may be inverted")
+    report = {"n": int(len(labels)), "roc_auc": auc, "ece": ece,
+              "best": best_operating_points(sweep, target_precision), "current": {}}
+    for name, threshold in (("CRIME_THRESHOLD", crime_threshold), ("HIGH_RISK_THRESHOLD", high_threshold)):
+        row = at_threshold(sweep, threshold)
+        report["current"][name] = {
+            "threshold": threshold,
+            "confusion_matrix": [[int(row["tn"]), int(row["fp"])], [int(row["fn"]), int(row["tp"])]],
+            "precision": float(row["precision"]), "recall": float(row["recall"]), "f1": float(row["f1"]),
+        }
+    report["calibration"] = curve.to_dict(orient="records")
+    return report, sweep
+
+
+def evaluate_stage2(proba, labels, low_cut, high_cut, target_accuracy):
+    sweep = confidence_sweep(proba, labels)
+    accurate = sweep[sweep["accuracy"] >= target_accuracy]
+    predicted = proba.argmax(axis=1)
+    n_classes = proba.shape[1]
+    confusion = np.bincount(labels * n_classes + predicted, minlength=n_classes ** 2).reshape(n_classes, n_classes)
+    return {
+        "n": int(len(labels)),
+        "accuracy": float((predicted == labels).mean()),
+        "confusion_matrix": confusion.tolist(),
+        "current_bands": band_accuracy(proba, labels, low_cut, high_cut),
+        f"min_cutoff_accuracy_{target_accuracy:g}": None if accurate.empty else float(accurate["cutoff"].iloc[-1]),
+    }, sweep
+
+
+def main():
+    import service
+
+    parser = argparse.ArgumentParser(description="Evaluate two-stage decision thresholds on held-out data")
+    parser.add_argument("--stage1-holdout")
+    parser.add_argument("--stage2-holdout")
+    parser.add_argument("--target-precision", type=float, default=0.7, help="Stage 1 precision wanted for HIGH")
+    parser.add_argument("--target-accuracy", type=float, default=0.65, help="Stage 2 accuracy wanted for HIGH")
+    parser.add_argument("--report", default="./data/threshold_report.json")
+    parser.add_argument("--sweep-out", default=None, help="Optional CSV prefix for the full threshold sweeps")
+    args = parser.parse_args()
+
+    report = {}
+    models = service.registry.active  # one snapshot for both stages, as in predict_two_stage
+    report["model_version"] = models.version
+    if args.stage1_holdout:
+        if models.safety_model is None:
+            raise SystemExit(f"Model version {models.version} has no Stage 1 model")
+        scores, labels = cached_scores("stage1", args.stage1_holdout, models, models.stage1_joblib, score_stage1)
+        report["stage1"], sweep = evaluate_stage1(scores, labels, service.CRIME_THRESHOLD,
+                                                  service.HIGH_RISK_THRESHOLD, args.target_precision)
+        if args.sweep_out:
+            sweep.to_csv(f"{args.sweep_out}_stage1.csv", index=False)
+        s1 = report["stage1"]
+        print(f"Stage 1: n={s1['n']:,} AUC={s1['roc_auc']:.3f} ECE={s1['ece']:.3f}")
+        for name, current in s1["current"].items():
+            print(f"  {name}={current['threshold']}: precision={current['precision']:.3f} "
+                  f"recall={current['recall']:.3f} F1={current['f1']:.3f} CM={current['confusion_matrix']}")
+        print(f"  best operating points: {s1['best']}")
+
+    if args.stage2_holdout:
+        proba, labels = cached_scores("stage2", args.stage2_holdout, models, models.stage2_joblib, score_stage2)
+        report["stage2"], sweep = evaluate_stage2(proba, labels, service.STAGE2_MEDIUM_CONFIDENCE,
+                                                  service.STAGE2_HIGH_CONFIDENCE, args.target_accuracy)
+        if args.sweep_out:
+            sweep.to_csv(f"{args.sweep_out}_stage2.csv", index=False)
+        s2 = report["stage2"]
+        print(f"Stage 2: n={s2['n']:,} accuracy={s2['accuracy']:.3f}")
+        print(f"  bands at {service.STAGE2_MEDIUM_CONFIDENCE}/{service.STAGE2_HIGH_CONFIDENCE}: {s2['current_bands']}")
+        print(f"  min cut-off for accuracy >= {args.target_accuracy}: "
+              f"{s2[f'min_cutoff_accuracy_{args.target_accuracy:g}']}")
+
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Per-prediction feature contributions for both stages.
+
+Uses LightGBM's built-in TreeSHAP (`pred_contrib=True`) on the native boosters,
+which costs about as much as a prediction, then sums the contributions of the
+encoded columns back onto the inputs the user actually chose: the Stage 1
+ColumnTransformer outputs (e.g. `cat__BORO_NM_BRONX`) and the 36 one-hot
+columns of create_df() (e.g. `VIC_AGE_GROUP_25-44`) both collapse into
+"Borough", "Age group", and so on.
+
+Contributions are in log-odds: Stage 1 towards the crime class (Class 0),
+Stage 2 towards the predicted crime type. Base value + contributions = raw score.
+
+Example (from the app/ directory):
+    python explain.py --date 2025-07-12 --hour 22 --borough Manhattan --age 30 --gender Female
+"""
+import argparse
+import datetime
+import functools
+import time
+
+import joblib
+import numpy as np
+
+import service
+from complaints import CRIME_TYPES
+from features import STAGE1_COLUMNS
+
+# Stage 1 input columns (create_stage1_df) -> user-facing input
+STAGE1_GROUPS = {
+    "BORO_NM": "Borough",
+    "hour": "Hour",
+    "is_night": "Hour",
+    "weekday": "Day of week",
+    "is_weekend": "Day of week",
+    "month": "Month",
+    "VIC_SEX": "Gender",
+    "VIC_AGE_GROUP": "Age group",
+    "SUSP_SEX": "Suspect (unknown)",
+    "SUSP_AGE_GROUP": "Suspect (unknown)",
+}
+
+# Stage 2 columns (STAGE2_COLUMNS) -> user-facing input; one-hot columns are matched by prefix
+STAGE2_GROUPS = {
+    "year": "Date",
+    "month": "Month",
+    "day": "Date",
+    "hour": "Hour",
+    "Latitude": "Location",
+    "Longitude": "Location",
+    "COMPLETED": "Completed",
+    "ADDR_PCT_CD": "Precinct",
+    "IN_PARK": "Place",
+    "IN_PUBLIC_HOUSING": "Place",
+    "IN_STATION": "Place",
+    "BORO_NM_": "Borough",
+    "VIC_AGE_GROUP_": "Age group",
+    "VIC_RACE_": "Race",
+    "VIC_SEX_": "Gender",
+}
+
+
+def group_matrix(feature_names, groups):
+    """
+    0/1 matrix (n_features x n_labels) summing encoded features into input groups.
+    A feature belongs to the group whose key equals it or is its longest prefix.
+    """
+    labels = list(dict.fromkeys(groups.values()))
+    keys = sorted(groups, key=len, reverse=True)
+    matrix = np.zeros((len(feature_names), len(labels)))
+    for i, name in enumerate(feature_names):
+        key = next((k for k in keys if name == k or (name.startswith(k) and
+                                                      (k.endswith("_") or name[len(k)] == "_"))), None)
+        if key is None:
+            raise ValueError(f"No input group for feature {name!r}")
+        matrix[i, labels.index(groups[key])] = 1
+    return matrix, labels
+
+
+@functools.lru_cache(maxsize=2)  # the active model set and the one it replaced
+def load_stage1(models):
+    """
+    (preprocessor, booster, group matrix, labels) of a model set's Stage 1 pipeline, or None.
+    The ONNX model has no pred_contrib, so the joblib pipeline is loaded when service uses ONNX.
+    """
+    pipeline = models.safety_model if hasattr(models.safety_model, "booster_") or hasattr(models.safety_model,
+                                                                                            "steps") else None
+    if pipeline is None:
+        try:
+            pipeline = joblib.load(models.stage1_joblib)
+        except (FileNotFoundError, AttributeError, ModuleNotFoundError, ImportError) as e:
+            print(f"WARNING: Stage 1 explanations unavailable: {e}")
+            return None
+    if getattr(pipeline, "takes_codes", False):
+        # stage1_native.NativeStage1Model: one coded column per input, transform() encodes the frame
+        matrix, labels = group_matrix(list(STAGE1_COLUMNS), STAGE1_GROUPS)
+        return pipeline, pipeline.booster_, matrix, labels
+    preprocessor, classifier = pipeline[:-1], pipeline.steps[-1][1]
+    # "cat__BORO_NM_BRONX" -> "BORO_NM_BRONX"
+    names = [name.split("__", 1)[-1] for name in preprocessor.get_feature_names_out()]
+    matrix, labels = group_matrix(names, STAGE1_GROUPS)
+    return preprocessor, classifier.booster_, matrix, labels
+
+
+@functools.lru_cache(maxsize=2)  # the active model set and the one it replaced
+def load_stage2(models):
+    """(booster, group matrix, labels) of a model set's Stage 2 classifier, or None"""
+    model = models.crime_type_model if hasattr(models.crime_type_model, "booster_") else None
+    if model is None:
+        try:
+            model = joblib.load(models.stage2_joblib)
+        except (FileNotFoundError, AttributeError, ModuleNotFoundError, ImportError) as e:
+            print(f"WARNING: Stage 2 explanations unavailable: {e}")
+            return None
+    matrix, labels = group_matrix(list(service.STAGE2_COLUMNS), STAGE2_GROUPS)
+    return getattr(model, "booster_", model), matrix, labels
+
+
+def explain_stage1_batch(stage1_df, models=None):
+    """
+    Stage 1 contributions for a create_stage1_df()/create_stage1_batch_df() frame.
+    Returns (base values (n,), contributions (n, n_labels), labels) towards the crime class, or None.
+    """
+    loaded = load_stage1(models or service.registry.active)
+    if loaded is None:
+        return None
+    preprocessor, booster, matrix, labels = loaded
+    X = preprocessor.transform(stage1_df)
+    if hasattr(X, "toarray"):
+        X = X.toarray()
+    contrib = booster.predict(np.asarray(X, dtype=np.float64), pred_contrib=True)
+    # The booster scores Class 1; Class 0 is the crime class (see predict_two_stage)
+    contrib = -contrib
+    return contrib[:, -1], contrib[:, :-1] @ matrix, labels
+
+
+def explain_stage2_batch(stage2_data, classes=None, models=None):
+    """
+    Stage 2 contributions for a create_df()/create_df_batch() array, towards `classes`
+    (one class code per row, default: the predicted class).
+    Returns (classes (n,), base values (n,), contributions (n, n_labels), labels), or None.
+    """
+    loaded = load_stage2(models or service.registry.active)
+    if loaded is None:
+        return None
+    booster, matrix, labels = loaded
+    X = np.asarray(stage2_data, dtype=np.float64)
+    n, n_features = X.shape
+    contrib = booster.predict(X, pred_contrib=True).reshape(n, -1, n_features + 1)
+    if classes is None:
+        # Raw class scores are the row sums; their argmax is the predicted class
+        classes = contrib.sum(axis=2).argmax(axis=1)
+    picked = contrib[np.arange(n), classes]
+    return classes, picked[:, -1], picked[:, :-1] @ matrix, labels
+
+
+def as_ranked(base, contributions, labels):
+    """One explanation as a dict with contributions sorted by absolute size"""
+    order = np.argsort(-np.abs(contributions))
+    return {
+        "base_value": round(float(base), 4),
+        "contributions": [(labels[i], round(float(contributions[i]), 4)) for i in order],
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def explain_stage1(models, date, hour, borough, age, gender):
+    explained = explain_stage1_batch(service.create_stage1_df(date, hour, borough, age, gender), models)
+    if explained is None:
+        return None
+    base, contributions, labels = explained
+    result = as_ranked(base[0], contributions[0], labels)
+    result["target"] = "CRIME"
+    return result
+
+
+@functools.lru_cache(maxsize=4096)
+def explain_stage2(models, date, hour, latitude, longitude, place, age, race, gender, precinct, borough):
+    explained = explain_stage2_batch(
+        service.create_df(date, hour, latitude, longitude, place, age, race, gender, precinct, borough),
+        models=models
+    )
+    if explained is None:
+        return None
+    classes, base, contributions, labels = explained
+    result = as_ranked(base[0], contributions[0], labels)
+    result["target"] = CRIME_TYPES.get(int(classes[0]), ("UNKNOWN", []))[0]
+    return result
+
+
+def explain_two_stage(models, stage2, date, hour, latitude, longitude, place, age, race, gender, precinct, borough):
+    """
+    Explanations of one predict_two_stage() call, from the model set that made the prediction: Stage 1 always
+    (when available), Stage 2 when the prediction ran it (`stage2`, i.e. status 'CRIME RISK'). Cached per
+    model set and input; a swapped-out model set drops out of the caches as its entries are evicted.
+    """
+    stage1 = None
+    if models.safety_model is not None:
+        stage1 = explain_stage1(models, date, int(hour), borough, int(age), gender)
+    stage2 = explain_stage2(models, date, int(hour), latitude, longitude, place, int(age), race, gender, precinct,
+                            borough) if stage2 else None
+    return {"stage1": stage1, "stage2": stage2, "model_version": models.version}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explain one two-stage prediction")
+    parser.add_argument("--date", default=datetime.date.today().isoformat())
+    parser.add_argument("--hour", type=int, default=22)
+    parser.add_argument("--lat", type=float, default=40.7580)
+    parser.add_argument("--lon", type=float, default=-73.9855)
+    parser.add_argument("--place", default="In park")
+    parser.add_argument("--age", type=int, default=30)
+    parser.add_argument("--race", default="WHITE")
+    parser.add_argument("--gender", default="Female")
+    parser.add_argument("--precinct", type=int, default=14)
+    parser.add_argument("--borough", default="Manhattan")
+    args = parser.parse_args()
+
+    inputs = (datetime.date.fromisoformat(args.date), args.hour, args.lat, args.lon, args.place, args.age,
+              args.race, args.gender, args.precinct, args.borough)
+    models = service.registry.active
+    explain_two_stage(models, True, *inputs)  # load the boosters
+    explain_stage1.cache_clear()
+    explain_stage2.cache_clear()
+    start = time.perf_counter()
+    explanation = explain_two_stage(models, True, *inputs)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    for stage in ("stage1", "stage2"):
+        result = explanation[stage]
+        if result is None:
+            continue
+        print(f"{stage} -> {result['target']} (base {result['base_value']:+.3f} log-odds)")
+        for label, value in result["contributions"]:
+            print(f"  {label:<20} {value:+.4f}")
+    print(f"✓ Explained in {elapsed_ms:.2f} ms (uncached)")
@@ -0,0 +1,58 @@
+"""
+Feature layouts shared by serving (service.py) and the training scripts.
+
+Kept free of model loading so training jobs and worker processes can import
+it without pulling in service.py and its registry.
+"""
+import numpy as np
+import pandas as pd
+
+# Stage 1 input columns in create_stage1_df() order, split as in the model1.ipynb ColumnTransformer
+STAGE1_COLUMNS = ["BORO_NM", "hour", "weekday", "month", "is_weekend", "is_night", "VIC_SEX", "VIC_AGE_GROUP",
+                  "SUSP_SEX", "SUSP_AGE_GROUP"]
+STAGE1_NUM_COLS = ["hour", "weekday", "month", "is_weekend", "is_night"]
+STAGE1_CAT_COLS = ["BORO_NM", "VIC_SEX", "VIC_AGE_GROUP", "SUSP_SEX", "SUSP_AGE_GROUP"]
+
+# Fixed integer codes of the Stage 1 categoricals for the native-categorical model (stage1_native.py).
+# Append new values at the end only: codes are baked into trained models. Unknown values encode as -1,
+# which LightGBM treats as missing.
+SEX_VOCAB = ["M", "F", "U", "D", "E"]
+AGE_GROUP_VOCAB = ["<18", "18-24", "25-44", "45-64", "65+", "UNKNOWN"]
+STAGE1_VOCAB = {
+    "BORO_NM": ["BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND", "UNKNOWN"],
+    "VIC_SEX": SEX_VOCAB,
+    "VIC_AGE_GROUP": AGE_GROUP_VOCAB,
+    "SUSP_SEX": SEX_VOCAB,
+    "SUSP_AGE_GROUP": AGE_GROUP_VOCAB,
+}
+STAGE1_CODES = {column: {value: code for code, value in enumerate(vocab)} for column, vocab in STAGE1_VOCAB.items()}
+# Positions of the categoricals in STAGE1_COLUMNS (LightGBM categorical_feature)
+STAGE1_CAT_INDEX = [STAGE1_COLUMNS.index(column) for column in STAGE1_CAT_COLS]
+
+
+def encode_stage1(df):
+    """int32 array (n x STAGE1_COLUMNS) of a create_stage1_df()-style frame, categoricals as STAGE1_VOCAB codes"""
+    codes = np.empty((len(df), len(STAGE1_COLUMNS)), dtype=np.int32)
+    for i, column in enumerate(STAGE1_COLUMNS):
+        if column in STAGE1_VOCAB:
+            codes[:, i] = pd.Categorical(df[column], categories=STAGE1_VOCAB[column]).codes
+        else:
+            codes[:, i] = df[column].to_numpy()
+    return codes
+
+
+def stage1_codes(boro_nm, hour, weekday, month, vic_sex, vic_age_group):
+    """One encoded Stage 1 row for the served inputs (suspect unknown), without building a DataFrame"""
+    return np.array([[STAGE1_CODES["BORO_NM"].get(boro_nm, -1), hour, weekday, month, int(weekday >= 5),
+                      int(hour >= 20 or hour <= 6), STAGE1_CODES["VIC_SEX"].get(vic_sex, -1),
+                      STAGE1_CODES["VIC_AGE_GROUP"].get(vic_age_group, -1), STAGE1_CODES["SUSP_SEX"]["U"],
+                      STAGE1_CODES["SUSP_AGE_GROUP"]["UNKNOWN"]]], dtype=np.int32)
+
+# Stage 2 feature layout (one-hot columns as produced by pd.get_dummies in Modeling.ipynb)
+STAGE2_COLUMNS = np.array(['year', 'month', 'day', 'hour', 'Latitude', 'Longitude','COMPLETED','ADDR_PCT_CD', 'IN_PARK', 'IN_PUBLIC_HOUSING',
+                    'IN_STATION', 'BORO_NM_BRONX', 'BORO_NM_BROOKLYN', 'BORO_NM_MANHATTAN', 'BORO_NM_QUEENS',
+                    'BORO_NM_STATEN ISLAND', 'BORO_NM_UNKNOWN', 'VIC_AGE_GROUP_18-24', 'VIC_AGE_GROUP_25-44',
+                    'VIC_AGE_GROUP_45-64', 'VIC_AGE_GROUP_65+', 'VIC_AGE_GROUP_-18', 'VIC_AGE_GROUP_UNKNOWN',
+                    'VIC_RACE_AMERICAN INDIAN/ALASKAN NATIVE', 'VIC_RACE_ASIAN / PACIFIC ISLANDER', 'VIC_RACE_BLACK',
+                    'VIC_RACE_BLACK HISPANIC', 'VIC_RACE_OTHER', 'VIC_RACE_UNKNOWN', 'VIC_RACE_WHITE',
+                    'VIC_RACE_WHITE HISPANIC', 'VIC_SEX_D', 'VIC_SEX_E', 'VIC_SEX_F', 'VIC_SEX_M', 'VIC_SEX_U'])
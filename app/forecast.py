@@ -0,0 +1,223 @@
+"""
+Per-precinct incident-count forecasts for the coming days.
+
+A nightly batch job counts complaints per day x precinct x hour, fits a
+Poisson-objective LightGBM on the last HISTORY_DAYS of history and writes
+the expected counts for the `--days` days after the last complaint in the
+CSV (or from `--start`, with a warning when that leaves a gap the lagged
+rates cannot cover) as a dense float32 array (days x precinct x hour), like
+the crime cube. Each run writes its array
+under a new name (forecast-<build time>.npy) and then replaces
+./data/forecast.json, which holds the metadata and names the array. The
+JSON replace is the only switch-over, so a reader never pairs one night's
+array with another night's start date. The app memory-maps the array, so
+the results panel reads a precinct's forecast with an array slice instead
+of running a model per click.
+
+Features of a (day, precinct, hour) cell: precinct (categorical), hour,
+weekday, month, and the precinct's recent rate at that hour and overall over
+the RATE_DAYS ending at least `--days` days earlier, so every forecast day
+only uses data that exists when the job runs. The last `--days` days of
+history are held out to compare the model's Poisson deviance with the
+recent-rate baseline before the final fit on all days.
+
+Run nightly (from the app/ directory), e.g. from cron:
+    python forecast.py --csv ../nypd-data/NYPD_Complaint_Data_Historic.csv --days 7
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from complaints import COMPLAINTS_CSV, iter_complaints
+from crime_cube import N_PRECINCTS
+
+FORECAST_PATH = "./data/forecast.json"  # metadata, naming the current array
+KEEP_ARRAYS = 2  # the current array and the one before it, which a running app may still have mapped
+FORECAST_COLUMNS = ["CMPLNT_FR_DT", "CMPLNT_FR_TM", "ADDR_PCT_CD"]
+
+HISTORY_START = datetime.date(2006, 1, 1)  # first year of the complaint dataset
+HISTORY_DAYS = 730
+RATE_DAYS = 28
+DEFAULT_DAYS = 7
+
+LGBM_PARAMS = {"objective": "poisson", "n_estimators": 300, "learning_rate": 0.05, "num_leaves": 63,
+               "min_child_samples": 50, "subsample": 0.8, "subsample_freq": 1, "verbose": -1}
+FEATURES = ["precinct", "hour", "weekday", "month", "hour_rate", "precinct_rate"]
+
+
+def array_paths(forecast_path):
+    """Forecast arrays next to forecast_path, oldest first"""
+    directory = os.path.dirname(forecast_path) or "."
+    prefix = os.path.splitext(os.path.basename(forecast_path))[0] + "-"
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith(prefix) and name.endswith(".npy"))
+
+
+def daily_counts(csv_path=COMPLAINTS_CSV):
+    """(first date, int32 counts indexed [day, precinct, hour]) from HISTORY_START to the last complaint"""
+    n_days = (datetime.date.today() - HISTORY_START).days + 1
+    counts = np.zeros((n_days, N_PRECINCTS, 24), dtype=np.int32)
+    start = np.datetime64(HISTORY_START, "D")
+    for chunk in iter_complaints(csv_path, columns=FORECAST_COLUMNS):
+        day = (chunk["date"].values.astype("datetime64[D]") - start).astype(np.int64)
+        precinct = chunk["ADDR_PCT_CD"].values.astype(np.int64)
+        keep = (day >= 0) & (day < n_days) & (precinct >= 0) & (precinct < N_PRECINCTS)
+        np.add.at(counts, (day[keep], precinct[keep], chunk["hour"].values[keep].astype(np.int64)), 1)
+    last = np.flatnonzero(counts.reshape(n_days, -1).any(axis=1))
+    if len(last) == 0:
+        raise ValueError(f"No dated complaints in {csv_path}")
+    return HISTORY_START, counts[:last[-1] + 1]
+
+
+def rates(counts, lag):
+    """
+    Mean daily count per (day, precinct, hour) and per (day, precinct) over the RATE_DAYS ending `lag`
+    days before each day (NaN where there is not enough history). The arrays run `lag` days past the
+    last day of counts, so they also cover the days being forecast.
+    """
+    cumulative = np.concatenate([np.zeros((1,) + counts.shape[1:]), np.cumsum(counts, axis=0)])
+    n = len(counts) + lag
+    end = np.arange(n) - lag + 1  # exclusive end of each day's window in `cumulative`
+    valid = end - RATE_DAYS >= 0
+    hour_rate = np.full((n,) + counts.shape[1:], np.nan, dtype=np.float32)
+    hour_rate[valid] = (cumulative[end[valid]] - cumulative[end[valid] - RATE_DAYS]) / RATE_DAYS
+    return hour_rate, hour_rate.sum(axis=2) / 24
+
+
+def feature_frame(days, dates, precincts, hour_rate, precinct_rate):
+    """Rows for every (day, active precinct, hour); `days` index the rate arrays, `dates` are their dates"""
+    d, p, h = (axis.ravel() for axis in np.meshgrid(np.arange(len(days)), np.arange(len(precincts)), np.arange(24),
+                                                  indexing="ij"))
+    dates = pd.DatetimeIndex(dates)
+    return pd.DataFrame({
+        "precinct": pd.Categorical(precincts[p], categories=precincts),
+        "hour": h.astype(np.int8),
+        "weekday": dates.weekday.values[d].astype(np.int8),
+        "month": dates.month.values[d].astype(np.int8),
+        "hour_rate": hour_rate[days[d], precincts[p], h],
+        "precinct_rate": precinct_rate[days[d], precincts[p]],
+    })[FEATURES]
+
+
+def poisson_deviance(y, mu):
+    mu = np.maximum(mu, 1e-9)
+    return float(2 * np.mean(np.where(y > 0, y * np.log(np.where(y > 0, y, 1) / mu), 0) - (y - mu)))
+
+
+def build_forecast(csv_path=COMPLAINTS_CSV, days=DEFAULT_DAYS, start=None, forecast_path=FORECAST_PATH):
+    from lightgbm import LGBMRegressor
+    began = time.perf_counter()
+    first, counts = daily_counts(csv_path)
+    data_end = first + datetime.timedelta(days=len(counts) - 1)
+    start = start or data_end + datetime.timedelta(days=1)
+    gap = (start - data_end).days
+    if gap > 1:
+        # The rates are lagged by `days`, so later forecast days have no rate window of their own
+        print(f"WARNING: Forecast starts {gap} days after the data ends ({data_end}); days after "
+              f"{data_end + datetime.timedelta(days=days)} reuse the latest rate window")
+    hour_rate, precinct_rate = rates(counts, lag=days)
+
+    train_days = np.arange(max(len(counts) - HISTORY_DAYS, days + RATE_DAYS), len(counts))
+    precincts = np.flatnonzero(counts[train_days].sum(axis=(0, 2)) > 0)
+    dates = [first + datetime.timedelta(days=int(d)) for d in train_days]
+    X = feature_frame(train_days, dates, precincts, hour_rate, precinct_rate)
+    y = counts[train_days][:, precincts, :].ravel().astype(np.float32)
+    print(f"Training on {len(train_days)} days x {len(precincts)} precincts x 24 hours ({len(y):,} rows) "
+          f"up to {data_end}")
+
+    # Holdout: the last `days` days, against the recent-rate baseline
+    holdout = np.repeat(np.arange(len(train_days)) >= len(train_days) - days, len(precincts) * 24)
+    model = LGBMRegressor(**LGBM_PARAMS).fit(X[~holdout], y[~holdout])
+    deviance = poisson_deviance(y[holdout], model.predict(X[holdout]))
+    baseline = poisson_deviance(y[holdout], X["hour_rate"].values[holdout])
+    print(f"  holdout Poisson deviance {deviance:.4f} (recent-rate baseline {baseline:.4f})")
+
+    model = LGBMRegressor(**LGBM_PARAMS).fit(X, y)
+    forecast_dates = [start + datetime.timedelta(days=i) for i in range(days)]
+    # Same lag as in training; days further past the end of the data use the latest window
+    forecast_days = np.minimum([(d - first).days for d in forecast_dates], len(hour_rate) - 1)
+    X_next = feature_frame(forecast_days, forecast_dates, precincts, hour_rate, precinct_rate)
+    expected = np.zeros((days, N_PRECINCTS, 24), dtype=np.float32)
+    expected[:, precincts, :] = model.predict(X_next).reshape(days, len(precincts), 24)
+
+    # The array gets a new name; replacing the metadata then switches readers over in one step
+    os.makedirs(os.path.dirname(forecast_path) or ".", exist_ok=True)
+    built_at = datetime.datetime.now()
+    array_path = f"{os.path.splitext(forecast_path)[0]}-{built_at:%Y%m%d-%H%M%S}.npy"
+    np.save(array_path, expected)
+    with open(forecast_path + ".tmp", "w") as f:
+        json.dump({"array": os.path.basename(array_path), "start": start.isoformat(), "days": days,
+                   "data_end": data_end.isoformat(), "history_days": len(train_days),
+                   "precincts": precincts.tolist(), "holdout_deviance": deviance, "baseline_deviance": baseline,
+                   "built_at": built_at.isoformat(timespec="seconds")}, f)
+    os.replace(forecast_path + ".tmp", forecast_path)
+    for old in array_paths(forecast_path)[:-KEEP_ARRAYS]:
+        os.remove(old)
+    print(f"✓ {days}-day forecast from {start} for {len(precincts)} precincts in "
+          f"{time.perf_counter() - began:.0f}s -> {array_path}")
+
+
+class Forecast:
+    """Read-only, memory-mapped forecast table indexed [day, precinct, hour]"""
+
+    def __init__(self, forecast_path=FORECAST_PATH):
+        with open(forecast_path) as f:
+            self.metadata = json.load(f)
+        array_path = os.path.join(os.path.dirname(forecast_path), self.metadata["array"])
+        self.expected = np.load(array_path, mmap_mode="r")
+        self.start = datetime.date.fromisoformat(self.metadata["start"])
+        self.days = self.metadata["days"]
+        if self.expected.shape[0] != self.days:
+            raise ValueError(f"{array_path} has {self.expected.shape[0]} days, metadata says {self.days}")
+
+    def _day(self, date):
+        day = (date - self.start).days
+        return day if 0 <= day < self.days else None
+
+    def expected_count(self, precinct, date, hour):
+        """Expected incidents in a precinct during one hour, or None outside the forecast window"""
+        day = self._day(date)
+        precinct = int(float(precinct))
+        if day is None or not 0 <= precinct < N_PRECINCTS:
+            return None
+        return float(self.expected[day, precinct, int(hour) % 24])
+
+    def hourly(self, precinct, date):
+        """24 expected hourly counts for a precinct on one day, or None outside the window"""
+        day = self._day(date)
+        precinct = int(float(precinct))
+        if day is None or not 0 <= precinct < N_PRECINCTS:
+            return None
+        return np.asarray(self.expected[day, precinct])
+
+    def daily_totals(self, precinct):
+        """{date: expected incidents} over the forecast window, empty for an unknown precinct"""
+        precinct = int(float(precinct))
+        if not 0 <= precinct < N_PRECINCTS:
+            return {}
+        totals = np.asarray(self.expected[:, precinct]).sum(axis=1)
+        return {self.start + datetime.timedelta(days=i): float(total) for i, total in enumerate(totals)}
+
+
+def load_forecast(forecast_path=FORECAST_PATH):
+    """Load the forecast table, returning None when it has not been built"""
+    if not os.path.exists(forecast_path):
+        return None
+    return Forecast(forecast_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast incident counts per precinct and hour")
+    parser.add_argument("--csv", default=COMPLAINTS_CSV)
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument("--start", default=None, help="First forecast day (YYYY-MM-DD, default: the day after the data ends)")
+    parser.add_argument("--out", default=FORECAST_PATH)
+    args = parser.parse_args()
+    build_forecast(args.csv, args.days, datetime.date.fromisoformat(args.start) if args.start else None, args.out)
@@ -0,0 +1,57 @@
+"""
+Vectorized precinct / borough lookup.
+
+The shapefiles are read once per process and queried with a spatial join,
+so resolving hundreds of points costs about the same as resolving one.
+"""
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+from pyproj import Transformer
+
+PRECINCT_SHAPEFILE = './shapes/geo_export_84578745-538d-401a-9cb5-34022c705879.shp'
+BOROUGH_SHAPEFILE = './borough/nybb.shp'
+
+
+@lru_cache(maxsize=None)
+def load_precincts():
+    return gpd.read_file(PRECINCT_SHAPEFILE)[['precinct', 'geometry']]
+
+
+@lru_cache(maxsize=None)
+def load_boroughs():
+    return gpd.read_file(BOROUGH_SHAPEFILE)[['BoroName', 'geometry']]
+
+
+@lru_cache(maxsize=None)
+def wgs84_to_ny_feet():
+    return Transformer.from_crs("epsg:4326", "epsg:2263", always_xy=True)
+
+
+def _join(points, polygons, column):
+    joined = gpd.sjoin(points, polygons, how='left', predicate='within')
+    # Points on a shared boundary match twice; keep one match per point
+    joined = joined[~joined.index.duplicated(keep='first')]
+    return joined[column].reindex(points.index).values
+
+
+def resolve_precincts_boroughs(latitudes, longitudes):
+    """
+    Resolve precinct and borough for arrays of coordinates in one spatial join each.
+    Returns two object arrays; entries are None for points outside NYC.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+
+    # Precinct polygons are in WGS84 lon/lat, borough polygons in EPSG:2263 feet
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(longitudes, latitudes), crs=load_precincts().crs)
+    precincts = _join(points, load_precincts(), 'precinct')
+
+    x, y = wgs84_to_ny_feet().transform(longitudes, latitudes)
+    points_ft = gpd.GeoDataFrame(geometry=gpd.points_from_xy(x, y), crs=load_boroughs().crs)
+    boroughs = _join(points_ft, load_boroughs(), 'BoroName')
+
+    precincts = np.array([p if p == p else None for p in precincts], dtype=object)
+    boroughs = np.array([b if isinstance(b, str) else None for b in boroughs], dtype=object)
+    return precincts, boroughs
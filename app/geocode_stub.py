@@ -0,0 +1,108 @@
+"""
+Local stand-in for the Nominatim /search endpoint.
+
+Answers in the same JSON format as Nominatim with deterministic coordinates
+inside NYC (derived from a hash of the query), so the batch geocoder and the
+load tests can run without network access or the public rate limit.
+
+Usage (from the app/ directory):
+    python geocode_stub.py --port 8765 --latency 0.05 --fail-rate 0.1
+    python batch_geocode.py venues.txt --endpoint http://127.0.0.1:8765/search
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Manhattan / Brooklyn / Queens core, so most stub results land inside a precinct
+STUB_BOUNDS = (40.63, -74.02, 40.80, -73.88)
+
+
+def stub_coordinates(query):
+    """Deterministic lat/lon for a query string"""
+    digest = hashlib.sha256(query.strip().lower().encode()).digest()
+    u = int.from_bytes(digest[:4], "big") / 2 ** 32
+    v = int.from_bytes(digest[4:8], "big") / 2 ** 32
+    south, west, north, east = STUB_BOUNDS
+    return south + u * (north - south), west + v * (east - west)
+
+
+def make_handler(latency=0.0, fail_rate=0.0, not_found=(), fail_first=0, fail_status=429, retry_after="0",
+                 malformed=()):
+    """
+    fail_rate: random share of requests answered with 429. fail_first: the first N requests for every query
+    are answered with fail_status (and Retry-After for 429). malformed: queries answered with a broken JSON body.
+    """
+    attempts = {}
+    attempts_lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/search":
+                self.send_error(404)
+                return
+            if latency:
+                time.sleep(latency)
+            query = parse_qs(url.query).get("q", [""])[0]
+            with attempts_lock:
+                attempts[query] = attempts.get(query, 0) + 1
+                attempt = attempts[query]
+            if attempt <= fail_first:
+                self.send_response(fail_status)
+                if fail_status == 429:
+                    self.send_header("Retry-After", retry_after)
+                self.end_headers()
+                return
+            if fail_rate and random.random() < fail_rate:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            if query in malformed:
+                body = b'[{"lat": '
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            results = []
+            if query and query not in not_found:
+                lat, lon = stub_coordinates(query)
+                results = [{"lat": f"{lat:.7f}", "lon": f"{lon:.7f}", "display_name": query}]
+            body = json.dumps(results).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    StubHandler.attempts = attempts  # requests seen per query, for tests
+    return StubHandler
+
+
+def start_stub_server(port=0, latency=0.0, fail_rate=0.0, not_found=(), **failures):
+    """Start the stub in a background thread; returns (server, search_url). `failures`: see make_handler"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, fail_rate, set(not_found), **failures))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/search"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Nominatim stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.latency, args.fail_rate))
+    print(f"✓ Geocoder stub on http://127.0.0.1:{args.port}/search")
+    server.serve_forever()
@@ -0,0 +1,140 @@
+"""
+Spatial index of historical complaints for "incidents near me" queries.
+
+Complaint coordinates are projected to EPSG:2263 (feet, same as
+lon_lat_to_utm in main.py) and indexed with a scikit-learn KDTree. The tree
+and the per-incident attribute columns are written once to disk and
+memory-mapped at startup, so every app process shares the same pages.
+
+Build once from the complaint CSV (from the app/ directory):
+    python incident_index.py --csv ../nypd-data/NYPD_Complaint_Data_Historic.csv
+"""
+import argparse
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+from complaints import CATEGORY_NAMES, COMPLAINTS_CSV, iter_complaints
+from geo_lookup import wgs84_to_ny_feet
+
+INDEX_DIR = "./data/incident_index"
+
+FEET_PER_METER = 1 / 0.3048006096012192
+EPOCH = np.datetime64("1970-01-01", "D")
+
+INDEX_COLUMNS = ["CMPLNT_FR_DT", "CMPLNT_FR_TM", "OFNS_DESC", "Latitude", "Longitude"]
+ATTRIBUTES = ["days", "hour", "weekday", "category", "offense"]
+
+
+def build_index(csv_path=COMPLAINTS_CSV, index_dir=INDEX_DIR, leaf_size=64):
+    """Project complaint coordinates, build the KD-tree and persist it with its attributes"""
+    parts = []
+    for chunk in iter_complaints(csv_path, columns=INDEX_COLUMNS):
+        x, y = wgs84_to_ny_feet().transform(chunk["Longitude"].values, chunk["Latitude"].values)
+        parts.append(pd.DataFrame({
+            "x": x, "y": y,
+            "days": (chunk["date"].values.astype("datetime64[D]") - EPOCH).astype(np.int32),
+            "hour": chunk["hour"].values,
+            "weekday": chunk["weekday"].values,
+            "category": chunk["category"].values,
+            "offense": chunk["OFNS_DESC"].fillna("UNKNOWN").values,
+        }))
+    df = pd.concat(parts, ignore_index=True)
+    df = df[np.isfinite(df["x"]) & np.isfinite(df["y"])]
+
+    offense_codes, offenses = pd.factorize(df["offense"])
+
+    os.makedirs(index_dir, exist_ok=True)
+    tree = KDTree(df[["x", "y"]].values, leaf_size=leaf_size)
+    joblib.dump(tree, os.path.join(index_dir, "tree.joblib"))
+    np.save(os.path.join(index_dir, "days.npy"), df["days"].values.astype(np.int32))
+    np.save(os.path.join(index_dir, "hour.npy"), df["hour"].values.astype(np.int8))
+    np.save(os.path.join(index_dir, "weekday.npy"), df["weekday"].values.astype(np.int8))
+    np.save(os.path.join(index_dir, "category.npy"), df["category"].values.astype(np.int8))
+    np.save(os.path.join(index_dir, "offense.npy"), offense_codes.astype(np.int16))
+    with open(os.path.join(index_dir, "offenses.json"), "w") as f:
+        json.dump(list(offenses), f)
+    print(f"✓ Incident index built for {len(df):,} complaints -> {index_dir}")
+
+
+def to_days(date):
+    return int((np.datetime64(date, "D") - EPOCH).astype(np.int64))
+
+
+class IncidentIndex:
+    """Memory-mapped KD-tree over historical complaints"""
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.tree = joblib.load(os.path.join(index_dir, "tree.joblib"), mmap_mode="r")
+        for name in ATTRIBUTES:
+            setattr(self, name, np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r"))
+        with open(os.path.join(index_dir, "offenses.json")) as f:
+            self.offenses = json.load(f)
+        self.latest_date = (EPOCH + int(self.days.max())).astype(object)
+
+    def _time_mask(self, idx, start=None, end=None, hours=None):
+        mask = np.ones(len(idx), dtype=bool)
+        if start is not None:
+            mask &= self.days[idx] >= to_days(start)
+        if end is not None:
+            mask &= self.days[idx] <= to_days(end)
+        if hours is not None:
+            mask &= np.isin(self.hour[idx], list(hours))
+        return mask
+
+    def radius(self, lat, lon, radius_m, start=None, end=None, hours=None):
+        """
+        Indices of complaints within radius_m meters of (lat, lon), optionally
+        restricted to a date window [start, end] and a set of hours.
+        """
+        x, y = wgs84_to_ny_feet().transform(lon, lat)
+        idx = self.tree.query_radius([[x, y]], r=radius_m * FEET_PER_METER)[0]
+        return idx[self._time_mask(idx, start, end, hours)]
+
+    def nearest(self, lat, lon, k=50, start=None, end=None, hours=None):
+        """
+        Indices and distances (meters) of the k nearest complaints matching the time filters.
+        The search widens until k matches are found or the whole index is covered.
+        """
+        x, y = wgs84_to_ny_feet().transform(lon, lat)
+        n = len(self.days)
+        fetch = min(k, n)
+        while True:
+            dist, idx = self.tree.query([[x, y]], k=fetch)
+            dist, idx = dist[0], idx[0]
+            mask = self._time_mask(idx, start, end, hours)
+            if mask.sum() >= k or fetch == n:
+                return idx[mask][:k], dist[mask][:k] / FEET_PER_METER
+            fetch = min(fetch * 4, n)
+
+    def breakdown(self, idx):
+        """Counts of the given complaints by category, offense and hour"""
+        idx = np.sort(idx)
+        categories = np.asarray(self.category[idx])
+        offense_counts = np.bincount(np.asarray(self.offense[idx]), minlength=len(self.offenses))
+        top = np.argsort(offense_counts)[::-1][:10]
+        return {
+            'total': int(len(idx)),
+            'by_category': {name: int((categories == code).sum()) for code, name in enumerate(CATEGORY_NAMES)},
+            'by_offense': {self.offenses[i]: int(offense_counts[i]) for i in top if offense_counts[i] > 0},
+            'by_hour': np.bincount(np.asarray(self.hour[idx]), minlength=24)[:24].tolist(),
+        }
+
+
+def load_index(index_dir=INDEX_DIR):
+    """Load the incident index, returning None when it has not been built"""
+    if not os.path.exists(os.path.join(index_dir, "tree.joblib")):
+        return None
+    return IncidentIndex(index_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the historical incident KD-tree index")
+    parser.add_argument("--csv", default=COMPLAINTS_CSV)
+    parser.add_argument("--out", default=INDEX_DIR)
+    args = parser.parse_args()
+    build_index(args.csv, args.out)
@@ -0,0 +1,412 @@
+"""
+Load-testing harness.
+
+Simulates concurrent users replaying a realistic request mix: map clicks
+anywhere in NYC, form submissions with varied demographics around popular
+places, and address searches resolved through the local geocoder stub
+(geocode_stub.py). Every simulated user loops request -> response -> think
+time until the run ends.
+
+Targets:
+    service     the prediction functions in-process (serve.predict_request: precinct lookup + two-stage model)
+    http        a running serve.py API (POST /predict, memory from GET /memory)
+    streamlit   the Streamlit script driven through streamlit.testing, one app session per user: a click
+                sets the map's last click and reruns, a form submission fills the profile form and
+                presses submit, a search geocodes the address and then submits the form there
+
+Reports throughput, p50/p95/p99 latency per request kind, the share of
+predictions answered by each admission tier (full, or shed to the cache or
+table tier, see admission.py) and memory over time, and saves the results
+to ./data/loadtest/ for comparison.
+
+Usage (from the app/ directory):
+    python loadtest.py service --users 16 --duration 60 --label before
+    python loadtest.py http --url http://127.0.0.1:8000 --users 64 --duration 120 --label serve-4w
+    python loadtest.py streamlit --users 4 --duration 60
+    python loadtest.py compare data/loadtest/before.json data/loadtest/after.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from geocode_stub import start_stub_server
+from serve import memory_usage
+
+LOADTEST_DIR = "./data/loadtest"
+
+NYC_BOUNDS = (40.50, -74.25, 40.91, -73.70)
+HOTSPOTS = [
+    (40.7580, -73.9855),  # Times Square
+    (40.7829, -73.9654),  # Central Park
+    (40.7061, -73.9969),  # Brooklyn Bridge
+    (40.6892, -73.9814),  # Downtown Brooklyn
+    (40.8296, -73.9262),  # Yankee Stadium
+    (40.7505, -73.9934),  # Penn Station
+    (40.7033, -73.9881),  # DUMBO
+    (40.7440, -73.8480),  # Flushing Meadows
+]
+STREETS = ["Broadway", "5th Avenue", "Atlantic Avenue", "Grand Concourse", "Queens Boulevard",
+           "Flatbush Avenue", "Lexington Avenue", "Victory Boulevard", "Jamaica Avenue", "Canal Street"]
+BOROUGHS = ["Manhattan", "Brooklyn", "Bronx", "Queens", "Staten Island"]
+PLACES = ["In park", "In public housing", "In station"]
+RACES = ["WHITE", "BLACK", "WHITE HISPANIC", "BLACK HISPANIC", "ASIAN / PACIFIC ISLANDER",
+         "AMERICAN INDIAN/ALASKAN NATIVE", "UNKNOWN"]
+GENDERS = ["Male", "Female"]
+
+# Share of each interaction in the simulated traffic
+REQUEST_MIX = {"click": 0.6, "form": 0.3, "search": 0.1}
+
+
+def make_request(rng):
+    """One simulated interaction as a serve.py /predict payload plus its kind"""
+    kind = rng.choices(list(REQUEST_MIX), weights=list(REQUEST_MIX.values()))[0]
+    date = datetime.date.today() + datetime.timedelta(days=rng.randint(0, 30))
+    request = {"kind": kind, "date": date.isoformat(), "hour": rng.randint(0, 23),
+               "place": "In park", "age": 30, "race": "UNKNOWN", "gender": "Male"}
+    if kind == "click":
+        south, west, north, east = NYC_BOUNDS
+        request["lat"], request["lon"] = rng.uniform(south, north), rng.uniform(west, east)
+    else:
+        lat, lon = rng.choice(HOTSPOTS)
+        request["lat"], request["lon"] = lat + rng.gauss(0, 0.005), lon + rng.gauss(0, 0.005)
+        request.update(place=rng.choice(PLACES), age=rng.randint(12, 85),
+                       race=rng.choice(RACES), gender=rng.choice(GENDERS))
+    if kind == "search":
+        request["query"] = f"{rng.randint(1, 999)} {rng.choice(STREETS)}, {rng.choice(BOROUGHS)}, NY"
+    return request
+
+
+def geocode_params(query):
+    return {"q": query, "format": "json", "limit": 1}
+
+
+def prediction_outcome(result):
+    """'ok' for a full prediction, 'degraded_<tier>' for one shed by admission.py"""
+    return f"degraded_{result.get('tier')}" if result.get("degraded") else "ok"
+
+
+class Recorder:
+    """Collects (end time, kind, latency, outcome) per request and memory samples"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.requests = []
+        self.memory = []
+
+    def record(self, kind, started, outcome):
+        now = time.perf_counter()
+        self.requests.append((now - self.start, kind, (now - started) * 1000, outcome))
+
+    def sample_memory(self, usage):
+        if usage:
+            self.memory.append({"t": round(time.perf_counter() - self.start, 2), **usage})
+
+
+def memory_sampler(recorder, read_memory, interval, stop):
+    while not stop.wait(interval):
+        try:
+            recorder.sample_memory(read_memory())
+        except OSError:
+            pass
+
+
+# --- Targets ---------------------------------------------------------------
+
+def run_service(args, recorder, deadline):
+    """Closed-loop users in threads calling the prediction path in-process"""
+    import requests
+    import serve
+
+    serve.preload()
+    sys.modules["service"].DEBUG = False  # its per-prediction prints would dominate the run
+
+    def user(user_id):
+        rng = random.Random(args.seed + user_id)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            request = make_request(rng)
+            started = time.perf_counter()
+            try:
+                if request["kind"] == "search":
+                    response = session.get(args.geocoder, params=geocode_params(request["query"]), timeout=10)
+                    response.raise_for_status()
+                    found = response.json()
+                    if not found:
+                        recorder.record(request["kind"], started, "not_found")
+                        continue
+                    request["lat"], request["lon"] = float(found[0]["lat"]), float(found[0]["lon"])
+                outcome = prediction_outcome(serve.predict_request(request))
+            except serve.OutsideNYC:
+                outcome = "outside"
+            except Exception:  # bad geocoder answer, failed prediction
+                outcome = "error"
+            recorder.record(request["kind"], started, outcome)
+            if args.think:
+                time.sleep(rng.expovariate(1 / args.think))
+
+    serve.predict_request(make_request(random.Random(args.seed)) | {"lat": 40.7580, "lon": -73.9855})
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user, range(args.users)))
+
+
+async def run_http_async(args, recorder, deadline):
+    import aiohttp
+
+    async def user(session, user_id):
+        rng = random.Random(args.seed + user_id)
+        while time.perf_counter() < deadline:
+            request = make_request(rng)
+            started = time.perf_counter()
+            try:
+                if request["kind"] == "search":
+                    async with session.get(args.geocoder, params=geocode_params(request["query"])) as response:
+                        found = await response.json(content_type=None)
+                    if not found:
+                        recorder.record(request["kind"], started, "not_found")
+                        continue
+                    request["lat"], request["lon"] = float(found[0]["lat"]), float(found[0]["lon"])
+                async with session.post(f"{args.url}/predict", json=request) as response:
+                    body = await response.json(content_type=None)
+                    if response.status == 200:
+                        outcome = prediction_outcome(body)
+                    elif response.status == 400 and body.get("reason") == "outside_nyc":
+                        outcome = "outside"
+                    else:
+                        outcome = f"http_{response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                outcome = "error"
+            recorder.record(request["kind"], started, outcome)
+            if args.think:
+                await asyncio.sleep(rng.expovariate(1 / args.think))
+
+    connector = aiohttp.TCPConnector(limit=args.users)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+        await asyncio.gather(*[user(session, i) for i in range(args.users)])
+
+
+def run_http(args, recorder, deadline):
+    asyncio.run(run_http_async(args, recorder, deadline))
+
+
+def find_widget(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+def streamlit_click(app, request):
+    """Rerun as after a click on the main map: st_folium returns the clicked point"""
+    app.session_state["main_map"] = {"last_clicked": {"lat": request["lat"], "lng": request["lon"]}, "zoom": 14}
+    app.run()
+
+
+def streamlit_submit(app, request):
+    """Fill the profile form shown for the clicked location and press submit (one more rerun)"""
+    if app.exception or not any(button.label.endswith("Generate Safety Analysis") for button in app.button):
+        return  # no form: the location is outside NYC
+    date = datetime.date.fromisoformat(request["date"])
+    find_widget(app.radio, "gender_select").set_value(request["gender"])
+    race = find_widget(app.selectbox, "race_select")
+    race.set_value(request["race"] if request["race"] in race.options else "OTHER")
+    find_widget(app.slider, "age_slider").set_value(request["age"])
+    find_widget(app.date_input, "date_select").set_value(date)
+    find_widget(app.time_input, "time_select").set_value(datetime.time(request["hour"]))
+    find_widget(app.radio, "place_select").set_value(request["place"])
+    next(button for button in app.button if button.label.endswith("Generate Safety Analysis")).click()
+    app.run()
+
+
+def run_streamlit(args, recorder, deadline):
+    """
+    One AppTest session per user, driven like the browser: a click is a rerun with a new map click,
+    a form submission clicks a location and submits the profile form, a search geocodes the address
+    first. Degraded answers are not visible from the rendered page, so every answer counts as 'ok'.
+    """
+    import requests
+    from streamlit.testing.v1 import AppTest
+
+    import service
+    service.DEBUG = False  # the app scripts run in this process
+
+    def user(user_id):
+        rng = random.Random(args.seed + user_id)
+        session = requests.Session()
+        app = AppTest.from_file(args.script, default_timeout=60)
+        app.run()  # first page load, not timed
+        while time.perf_counter() < deadline:
+            request = make_request(rng)
+            started = time.perf_counter()
+            try:
+                if request["kind"] == "search":
+                    response = session.get(args.geocoder, params=geocode_params(request["query"]), timeout=10)
+                    response.raise_for_status()
+                    found = response.json()
+                    if not found:
+                        recorder.record(request["kind"], started, "not_found")
+                        continue
+                    request["lat"], request["lon"] = float(found[0]["lat"]), float(found[0]["lon"])
+                streamlit_click(app, request)
+                if request["kind"] != "click":
+                    streamlit_submit(app, request)
+                outcome = "error" if app.exception else "ok"
+            except (RuntimeError, StopIteration, requests.RequestException):  # script timeout, missing widget
+                outcome = "error"
+            recorder.record(request["kind"], started, outcome)
+            if args.think:
+                time.sleep(rng.expovariate(1 / args.think))
+
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user, range(args.users)))
+
+
+TARGETS = {"service": run_service, "http": run_http, "streamlit": run_streamlit}
+
+
+def http_memory(url):
+    with urllib.request.urlopen(f"{url}/memory", timeout=5) as response:
+        report = json.load(response)
+    return {"rss_mb": report["total_rss_mb"], "pss_mb": report["total_pss_mb"]}
+
+
+# --- Report ----------------------------------------------------------------
+
+def latency_stats(latencies):
+    if not len(latencies):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"count": int(len(latencies)), "mean_ms": round(float(np.mean(latencies)), 2),
+            "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(np.max(latencies)), 2)}
+
+
+def summarize(recorder, elapsed, interval):
+    t = np.array([r[0] for r in recorder.requests])
+    kinds = np.array([r[1] for r in recorder.requests])
+    latency = np.array([r[2] for r in recorder.requests])
+    outcomes = np.array([r[3] for r in recorder.requests])
+    degraded = np.char.startswith(outcomes.astype(str), "degraded_") if len(outcomes) else np.zeros(0, dtype=bool)
+    answered = np.isin(outcomes, ["ok", "outside", "not_found"]) | degraded
+
+    summary = {"requests": int(len(t)), "errors": int((~answered).sum()),
+               "throughput_rps": round(len(t) / elapsed, 2), **latency_stats(latency[answered])}
+    summary["outcomes"] = {str(o): int(n) for o, n in zip(*np.unique(outcomes, return_counts=True))}
+    summary["by_kind"] = {kind: latency_stats(latency[answered & (kinds == kind)]) for kind in REQUEST_MIX}
+    # Admission tier of every prediction: full ("ok") or shed to a degraded tier
+    predicted = (outcomes == "ok") | degraded
+    tiers = np.where(degraded, np.char.replace(outcomes.astype(str), "degraded_", ""), "full")[predicted]
+    summary["tiers"] = {str(tier): {"count": int(n), "share": round(n / max(predicted.sum(), 1), 4),
+                                    **latency_stats(latency[predicted][tiers == tier])}
+                        for tier, n in zip(*np.unique(tiers, return_counts=True))}
+
+    timeline = []
+    buckets = (t // interval).astype(np.int64) if len(t) else np.array([], dtype=np.int64)
+    for bucket in range(int(np.ceil(elapsed / interval))):
+        in_bucket = buckets == bucket
+        point = {"t": round((bucket + 1) * interval, 2), "rps": round(in_bucket.sum() / interval, 2),
+                 "p95_ms": round(float(np.percentile(latency[in_bucket], 95)), 2) if in_bucket.any() else None}
+        samples = [m for m in recorder.memory if bucket * interval <= m["t"] < (bucket + 1) * interval]
+        if samples:
+            point["rss_mb"] = samples[-1]["rss_mb"]
+            point["pss_mb"] = samples[-1].get("pss_mb")
+        timeline.append(point)
+    return summary, timeline
+
+
+def print_summary(summary, timeline):
+    print(f"{summary['requests']:,} requests, {summary['errors']:,} errors, {summary['throughput_rps']} req/s")
+    print(f"{'kind':>8} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, stats in [("all", summary), *summary["by_kind"].items()]:
+        if stats.get("count"):
+            print(f"{kind:>8} {stats['count']:>7} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    if set(summary["tiers"]) - {"full"}:
+        print("Admission tiers: " + ", ".join(f"{tier} {stats['share']:.1%} (p95 {stats['p95_ms']} ms)"
+                                              for tier, stats in summary["tiers"].items()))
+    memory = [point for point in timeline if "rss_mb" in point]
+    if memory:
+        print(f"Memory RSS {memory[0]['rss_mb']} MB -> {memory[-1]['rss_mb']} MB "
+              f"(peak {max(point['rss_mb'] for point in memory)} MB)")
+
+
+def compare(paths):
+    runs = []
+    for path in paths:
+        with open(path) as f:
+            runs.append(json.load(f))
+    metrics = ["throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors"]
+    print(f"{'metric':>15}" + "".join(f"{run['label']:>16}" for run in runs))
+    for metric in metrics:
+        values = [run["summary"].get(metric) for run in runs]
+        row = f"{metric:>15}" + "".join(f"{value:>16}" for value in values)
+        if values[0] and None not in values:
+            row += f"   ({(values[-1] - values[0]) / values[0] * 100:+.1f}%)"
+        print(row)
+    for run in runs:
+        peak = max((point["rss_mb"] for point in run["timeline"] if "rss_mb" in point), default=None)
+        print(f"{run['label']}: {run['target']} x {run['config']['users']} users, peak RSS {peak} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent SafetyScope users")
+    parser.add_argument("target", choices=[*TARGETS, "compare"])
+    parser.add_argument("results", nargs="*", help="Result files to compare")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between requests (seconds)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="serve.py base URL (http target)")
+    parser.add_argument("--script", default="main.py", help="Streamlit script (streamlit target)")
+    parser.add_argument("--geocoder", default=None, help="Geocoder search URL (default: in-process stub)")
+    parser.add_argument("--geocode-latency", type=float, default=0.05, help="Latency of the in-process stub")
+    parser.add_argument("--interval", type=float, default=1.0, help="Timeline / memory sampling interval")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--out", default=LOADTEST_DIR)
+    args = parser.parse_args()
+
+    if args.target == "compare":
+        compare(args.results)
+        return
+
+    stub = None
+    if args.geocoder is None:
+        stub, args.geocoder = start_stub_server(latency=args.geocode_latency)
+
+    recorder = Recorder()
+    read_memory = (lambda: http_memory(args.url)) if args.target == "http" else (lambda: memory_usage("self"))
+    stop = threading.Event()
+    sampler = threading.Thread(target=memory_sampler, args=(recorder, read_memory, args.interval, stop), daemon=True)
+
+    print(f"Running {args.target} load test: {args.users} users for {args.duration:g}s ...")
+    sampler.start()
+    started = time.perf_counter()
+    TARGETS[args.target](args, recorder, started + args.duration)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if stub is not None:
+        stub.shutdown()
+
+    summary, timeline = summarize(recorder, elapsed, args.interval)
+    print_summary(summary, timeline)
+
+    label = args.label or f"{args.target}_{datetime.datetime.now():%Y%m%d_%H%M%S}"
+    result = {
+        "label": label, "target": args.target, "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("results", "out", "label")},
+        "python": sys.version.split()[0], "summary": summary, "timeline": timeline,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{label}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"✓ Results saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
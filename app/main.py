@@ -1,13 +1,24 @@
+import json
+import os
+import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
 import folium
+from folium.plugins import HeatMap
 from streamlit_folium import st_folium
-from datetime import datetime
+from datetime import datetime, timedelta
 import service as service
-import geopandas as gpd
-from shapely.geometry import Point
 from pyproj import Transformer
 import requests
+import crime_cube
+import geo_lookup
+import incident_index
+import playback
+import route as route_scoring
+import density_tiles
+import forecast
+import admission
+import precinct_layer
 
 def get_coordinates(destination):
     base_url = "https://nominatim.openstreetmap.org/search"
@@ -41,24 +52,140 @@ def lon_lat_to_utm(lon, lat):
     utm_x, utm_y = transformer.transform(lon, lat)
     return utm_x, utm_y
 
-shapefile = './shapes/geo_export_84578745-538d-401a-9cb5-34022c705879.shp'
-borough_sh = './borough/nybb.shp'
-
 def get_precinct_and_borough(lat, lon):
-    precinct_gdf = gpd.read_file(shapefile)
-    borough_gdf = gpd.read_file(borough_sh)
-    point = Point(lon, lat)
-    point2 = Point(lon_lat_to_utm(lon, lat))
-    precinct = None
-    borough = None
-    for _, row in precinct_gdf.iterrows():
-        if row['geometry'].contains(point):
-            precinct = row['precinct']
-    for _, row in borough_gdf.iterrows():
-        if row['geometry'].contains(point2):
-            borough = row['BoroName']
-            break
-    return precinct, borough
+    precincts, boroughs = geo_lookup.resolve_precincts_boroughs([lat], [lon])
+    return precincts[0], boroughs[0]
+
+def parse_location(text):
+    """Accept either 'lat, lon' or an address to geocode"""
+    parts = text.split(",")
+    if len(parts) == 2:
+        try:
+            return float(parts[0]), float(parts[1])
+        except ValueError:
+            pass
+    return get_coordinates(text)
+
+@st.cache_resource
+def load_crime_cube():
+    return crime_cube.load_cube()
+
+@st.cache_resource
+def load_forecast_table(modified):
+    return forecast.load_forecast()
+
+def load_forecast():
+    """The forecast table, reloaded when the nightly job replaces it"""
+    path = forecast.FORECAST_PATH
+    return load_forecast_table(os.path.getmtime(path) if os.path.exists(path) else None)
+
+@st.cache_resource
+def load_density_tiles():
+    return density_tiles.load_tiles()
+
+def add_density_layer(base_map, view):
+    """Add the incident density cells visible in the current map view"""
+    tiles = load_density_tiles()
+    if tiles is None:
+        st.info("Incident density layer not built yet. Run `python density_tiles.py` first.")
+        return
+    bounds = (view or {}).get('bounds') or {}
+    south_west = bounds.get('_southWest') or {'lat': 40.47739894, 'lng': -74.25909008}
+    north_east = bounds.get('_northEast') or {'lat': 40.91617849, 'lng': -73.70018092}
+    zoom = (view or {}).get('zoom') or 11
+    cells = tiles.visible_cells(zoom, south_west['lat'], south_west['lng'], north_east['lat'], north_east['lng'])
+    layer = folium.FeatureGroup(name="Incident density")
+    HeatMap(cells, radius=18, blur=15, min_opacity=0.3).add_to(layer)
+    layer.add_to(base_map)
+    folium.LayerControl().add_to(base_map)
+
+@st.cache_resource
+def load_precinct_layer():
+    return precinct_layer.load_layer()
+
+@st.cache_resource
+def load_incident_index():
+    return incident_index.load_index()
+
+@st.cache_resource
+def load_playback(period):
+    return playback.Playback(period)
+
+# serve.py streams playback frames to the browser (GET /playback/...)
+PLAYBACK_API_URL = os.environ.get("SAFETYSCOPE_API_URL", "http://127.0.0.1:8000")
+
+PLAYBACK_PLAYER = """
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<script src="https://unpkg.com/leaflet.heat@0.2.0/dist/leaflet-heat.js"></script>
+<div style="font-family: sans-serif; color: #ddd; margin-bottom: 4px;">
+  <button id="toggle">Pause</button> <span id="label">Loading frames...</span>
+</div>
+<div id="map" style="height: 420px;"></div>
+<script>
+const config = __CONFIG__;
+const map = L.map("map", {minZoom: 11, maxZoom: 15}).setView([40.704467, -73.892246], 11);
+L.tileLayer("https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png",
+            {attribution: "&copy; OpenStreetMap &copy; CARTO"}).addTo(map);
+const heat = L.heatLayer([], {radius: 12, maxOpacity: 0.8}).addTo(map);
+const label = document.getElementById("label");
+const base = `${config.api}/playback/${config.period}`;
+const pages = new Map();  // page number -> promise of a page, only the current one and the next are kept
+let cells, t = config.start, playing = true;
+
+function page(p) {
+  if (!pages.has(p)) {
+    pages.set(p, fetch(`${base}/frames?start=${p * config.pageFrames}&count=${config.pageFrames}`)
+      .then(response => response.json()));
+  }
+  return pages.get(p);
+}
+
+async function tick() {
+  if (!playing) return;
+  const p = Math.floor(t / config.pageFrames);
+  const data = await page(p);
+  const next = (p + 1) * config.pageFrames < cells.n_frames ? p + 1 : 0;
+  page(next);  // prefetch while this page plays
+  for (const key of pages.keys()) if (key !== p && key !== next) pages.delete(key);
+  const frame = data.frames[t - data.start];
+  heat.setLatLngs(frame.cells.map((cell, i) =>
+    [cells.lat[cell], cells.lon[cell], Math.min(frame.counts[i] / cells.scale, 1)]));
+  label.textContent = `${frame.label} (frame ${t + 1} of ${cells.n_frames})`;
+  t = (t + 1) % cells.n_frames;
+  setTimeout(tick, 1000 / config.fps);
+}
+
+document.getElementById("toggle").onclick = event => {
+  playing = !playing;
+  event.target.textContent = playing ? "Pause" : "Play";
+  tick();
+};
+fetch(base).then(response => response.json()).then(data => { cells = data; tick(); })
+  .catch(() => { label.textContent = `Playback frames unavailable: start serve.py at ${config.api}`; });
+</script>
+"""
+
+def playback_player(period, start, fps):
+    """HTML map that plays a period from frame `start`, fetching pages of frames from serve.py as it goes"""
+    config = {"api": PLAYBACK_API_URL, "period": period, "start": start, "fps": fps,
+              "pageFrames": playback.PAGE_FRAMES}
+    return PLAYBACK_PLAYER.replace("__CONFIG__", json.dumps(config))
+
+@st.cache_resource
+def start_model_watcher():
+    """One watcher per server process: new model versions in ./model/ are swapped in live"""
+    return service.registry.start()
+
+@st.cache_resource
+def start_drift_monitor():
+    """Scheduled drift checks of this server process's predictions"""
+    return service.monitor.start() if service.monitor is not None else None
+
+@st.cache_resource
+def start_audit_log():
+    """Background writer of this server process's prediction audit log"""
+    return service.audit.start() if service.audit is not None else None
 
 def generate_base_map(default_location=[40.704467, -73.892246], default_zoom_start=11, min_zoom=11, max_zoom=15):
     base_map = folium.Map(
@@ -344,6 +471,10 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize session state
+start_model_watcher()
+start_drift_monitor()
+start_audit_log()
+
 if 'location_selected' not in st.session_state:
     st.session_state.location_selected = False
 if 'show_prediction' not in st.session_state:
@@ -465,9 +596,99 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Route mode: score every point along a path between two places
+with st.expander("Route Mode: score the way between two places"):
+    with st.form(key='route_form'):
+        col_origin, col_destination = st.columns(2)
+        with col_origin:
+            origin_text = st.text_input("Origin (address or 'lat, lon')")
+        with col_destination:
+            destination_text = st.text_input("Destination (address or 'lat, lon')")
+        col_r1, col_r2, col_r3 = st.columns(3)
+        with col_r1:
+            route_date = st.date_input("Date", value=datetime.now().date(), key="route_date")
+            route_time = st.time_input("Time", value=datetime.now().time(), key="route_time")
+        with col_r2:
+            route_gender = st.radio("Gender", options=["Male", "Female"], horizontal=True, key="route_gender")
+            route_age = st.number_input("Age", 0, 120, 30, key="route_age")
+        with col_r3:
+            route_race = st.selectbox("Ethnic Background", ['WHITE', 'BLACK', 'ASIAN / PACIFIC ISLANDER', 'WHITE HISPANIC',
+                                      'BLACK HISPANIC', 'AMERICAN INDIAN/ALASKAN NATIVE', 'OTHER'], key="route_race")
+            route_place = st.selectbox("Destination Type", ["In park", "In public housing", "In station"], key="route_place")
+        route_submit = st.form_submit_button("🧭 Score Route")
+
+    if route_submit:
+        origin = parse_location(origin_text) if origin_text else None
+        destination = parse_location(destination_text) if destination_text else None
+        if not origin or not destination:
+            st.error("❌ Could not locate the origin or destination")
+        else:
+            with st.spinner('Scoring route...'):
+                st.session_state.route = route_scoring.score_route(
+                    [origin, destination], route_date, route_time.hour, route_place,
+                    route_age, route_race, route_gender
+                )
+
+    if st.session_state.get('route'):
+        scored_route = st.session_state.route
+        if scored_route['peak_segment'] is None:
+            st.warning("No part of this route lies within NYC precincts")
+        else:
+            peak = scored_route['segments'][scored_route['peak_segment']]
+            st.markdown(f"""
+            <div class="location-info">
+                <strong>Route length:</strong> {scored_route['length_ft'] / 5280:.2f} mi
+                ({scored_route['n_scored']} of {len(scored_route['points'])} sample points scored)<br>
+                <strong>Peak risk:</strong> {peak['risk_level']}
+                {f"({peak['crime_probability']:.1f}%)" if peak['crime_probability'] is not None else ''}
+                near {peak['start'][0]:.5f}, {peak['start'][1]:.5f}
+                {f"- most likely {peak['crime_type']}" if peak['crime_type'] else ''}
+            </div>
+            """, unsafe_allow_html=True)
+
+# Incident playback: the browser streams precomputed frames page by page from serve.py
+playback_periods = playback.available_periods()
+if playback_periods:
+    with st.expander("Incident Playback: watch incidents unfold over time"):
+        col_period, col_speed = st.columns(2)
+        with col_period:
+            period = st.selectbox("Frame length", playback_periods, key="playback_period")
+        with col_speed:
+            fps = st.select_slider("Frames per second", options=[1, 2, 4, 8, 12], value=4, key="playback_fps")
+        frames = load_playback(period)
+        first = st.slider("Start frame", 0, max(frames.n_frames - 1, 0), 0, key="playback_start",
+                          help=f"Frames are fetched {playback.PAGE_FRAMES} at a time while the animation plays")
+        st.caption(f"From {frames.label(first)}, {frames.n_frames - first:,} frames "
+                   f"(frames are served by serve.py at {PLAYBACK_API_URL})")
+        components.html(playback_player(period, first, fps), height=470)
+
 # Render the map
+show_density = st.checkbox("Show historical incident density", value=False)
+show_precincts = st.checkbox("Show precinct risk", value=False)
+if show_precincts:
+    col_p1, col_p2, col_p3 = st.columns(3)
+    with col_p1:
+        precinct_hour = st.slider("Hour", 0, 23, datetime.now().hour, key="precinct_hour")
+    with col_p2:
+        precinct_gender = st.radio("Gender", options=["Male", "Female"], horizontal=True, key="precinct_gender")
+    with col_p3:
+        precinct_age = st.number_input("Age", 0, 120, 30, key="precinct_age")
 base_map = generate_base_map()
 base_map.add_child(folium.LatLngPopup())
+if show_precincts:
+    precincts_layer = load_precinct_layer()
+    if precincts_layer is None:
+        st.info("Precinct layer not built yet. Run `python precinct_layer.py` first.")
+    else:
+        # Geometry is pre-serialized per zoom tier; only the risk colors depend on hour and profile
+        precinct_layer.add_precinct_layer(base_map, precincts_layer,
+                                          (st.session_state.get("main_map") or {}).get('zoom'),
+                                          datetime.now().date(), precinct_hour, precinct_age, precinct_gender)
+if show_density:
+    # Only the cells in the last reported view/zoom are sent to the browser
+    add_density_layer(base_map, st.session_state.get("main_map"))
+if st.session_state.get('route'):
+    route_scoring.add_route_layer(base_map, st.session_state.route)
 
 map = st_folium(base_map, height=500, width=None, key="main_map")
 
@@ -501,6 +722,31 @@ if map and map.get('last_clicked'):
         </div>
         """, unsafe_allow_html=True)
 
+        # Historical incidents around the clicked point (KD-tree radius query)
+        nearby_index = load_incident_index()
+        if nearby_index is not None:
+            with st.expander("📜 Historical incidents near this location"):
+                col_radius, col_period = st.columns(2)
+                with col_radius:
+                    radius_m = st.select_slider("Radius", options=[100, 250, 500, 1000], value=250,
+                                                format_func=lambda r: f"{r} m")
+                with col_period:
+                    years = st.select_slider("Period", options=[1, 2, 5, 10, 20], value=5,
+                                             format_func=lambda y: f"Last {y} years of data")
+                end = nearby_index.latest_date
+                start = end - timedelta(days=365 * years)
+                nearby = nearby_index.breakdown(nearby_index.radius(lat, lon, radius_m, start=start, end=end))
+                st.markdown(f"**{nearby['total']:,} complaints** within {radius_m} m between {start} and {end}")
+                col_category, col_offense = st.columns(2)
+                with col_category:
+                    st.markdown("**By category**")
+                    st.table({'Incidents': nearby['by_category']})
+                with col_offense:
+                    st.markdown("**Top offenses**")
+                    st.table({'Incidents': nearby['by_offense']})
+                st.markdown("**By hour of day**")
+                st.bar_chart(nearby['by_hour'], height=200)
+
         # User information form
         st.markdown("""
         <div class="form-section">
@@ -663,9 +909,9 @@ if map and map.get('last_clicked'):
                 st.error("❌ Please select a time for your visit")
             else:
                 with st.spinner('AI is analyzing crime patterns...'):
-                    # Call TWO-STAGE prediction system
-                    result = service.predict_two_stage(
-                        date, hour, lat, lon, place, age, race, gender, precinct, borough
+                    # Call TWO-STAGE prediction system (answers from a cheaper tier when overloaded)
+                    result = admission.predict(
+                        date, hour, lat, lon, place, age, race, gender, precinct, borough, explain=True
                     )
                     
                     # Extract prediction data
@@ -674,7 +920,9 @@ if map and map.get('last_clicked'):
                     crime_list = result.get('crime_list', [])
                     confidence = result['confidence']
                     risk_level = result['risk_level']
-                    probabilities = result['probabilities']
+                    # None for the degraded table tier, which skips Stage 2
+                    probabilities = result['probabilities'] or dict.fromkeys(
+                        ['DRUGS/ALCOHOL', 'PERSONAL', 'PROPERTY', 'SEXUAL'], 0)
                     
                     # Risk level styling
                     risk_colors = {
@@ -773,7 +1021,7 @@ if map and map.get('last_clicked'):
                             <div style="background: rgba(255,255,255,0.25); padding: 1.5rem; 
                                         border-radius: 15px; text-align: center; margin: 1rem 0; 
                                         border: 2px solid rgba(255,255,255,0.4);">
-                                <h3 style="margin: 0;">Most Likely Crime Type: {crime_emoji.get(crime_type, '')} {crime_type}</h3>
+                                <h3 style="margin: 0;">Most Likely Crime Type: {crime_emoji.get(crime_type, '')} {crime_type or 'not estimated'}</h3>
                                 <p style="font-size: 1.1rem; margin-top: 0.5rem;">"""
                         
                         # Add crime probability if available (from Stage 1)
@@ -861,6 +1109,76 @@ if map and map.get('last_clicked'):
                         st.warning("Exercise caution in this area. Stay vigilant!")
                     else:
                         st.error("High risk area detected. Consider alternative locations or take extra precautions!")
+                    st.caption(f"Model version: {result['model_version']}")
+                    if result.get('degraded'):
+                        st.caption("⚡ High load: this answer was served from the "
+                                   f"{'recent results cache' if result['tier'] == 'cache' else 'precomputed Stage 1 risk table'}")
+
+                    # Why this prediction: per-input contributions from LightGBM's TreeSHAP, computed with
+                    # the models that made the prediction (not shown for degraded answers)
+                    explanation = result.get('explanation')
+                    if explanation is not None and not result.get('degraded'):
+                        with st.expander("🔍 Why this prediction?"):
+                            for stage, title in (("stage1", "Crime risk (Stage 1)"), ("stage2", "Crime type (Stage 2)")):
+                                stage_explanation = explanation[stage]
+                                if stage_explanation is None:
+                                    continue
+                                st.markdown(f"**{title}** - contributions towards {stage_explanation['target']} (log-odds)")
+                                st.markdown("\n".join(
+                                    f"- {'🔺' if value > 0 else '🔻'} {label}: {value:+.3f}"
+                                    for label, value in stage_explanation['contributions'] if value != 0
+                                ))
+                            if explanation["stage1"] is None and explanation["stage2"] is None:
+                                st.info("Explanations need the joblib models (`model/best_lgbm.joblib`, `model/lgbm.joblib`).")
+
+                    # Historical incidents from the precomputed crime cube
+                    cube = load_crime_cube()
+                    if cube is not None:
+                        weekday = date.weekday()
+                        at_this_time = cube.counts_by_category(precinct, hour=hour, weekday=weekday)
+                        this_month = cube.counts_by_category(precinct, hour=hour, weekday=weekday, month=date.month)
+                        all_times = cube.counts_by_category(precinct)
+                        rows = ''.join([
+                            f"<tr><td>{name}</td><td>{at_this_time[name]:,}</td>"
+                            f"<td>{this_month[name]:,}</td><td>{all_times[name]:,}</td></tr>"
+                            for name in at_this_time
+                        ])
+                        st.markdown(f"""
+                        <div class="location-info">
+                            <h3 style="text-align: center; margin-bottom: 1rem;">Historical Incidents in Precinct {precinct}</h3>
+                            <p style="text-align: center;">
+                                Reported complaints {cube.metadata['first_year']}-{cube.metadata['last_year']}
+                                ({cube.n_years} years) on {date.strftime("%A")}s at {hour:02d}:00
+                            </p>
+                            <table style="width: 100%; color: white;">
+                                <tr><th>Category</th><th>This hour & weekday</th>
+                                    <th>...in {date.strftime("%B")}</th><th>All times</th></tr>
+                                {rows}
+                            </table>
+                        </div>
+                        """, unsafe_allow_html=True)
+                        st.bar_chart(cube.hourly_profile(precinct, weekday=weekday), height=200)
+
+                    # Expected incidents from the nightly forecast table
+                    table = load_forecast()
+                    if table is not None:
+                        expected = table.expected_count(precinct, date, hour)
+                        totals = table.daily_totals(precinct)
+                        at_hour = (f"<b>{expected:.2f}</b> expected incidents at {hour:02d}:00 on "
+                                   f"{date.strftime('%A %d %B')}" if expected is not None else
+                                   f"{date.strftime('%d %B')} is outside the forecast window")
+                        st.markdown(f"""
+                        <div class="location-info">
+                            <h3 style="text-align: center; margin-bottom: 1rem;">Forecast for Precinct {precinct}</h3>
+                            <p style="text-align: center;">{at_hour}</p>
+                            <p style="text-align: center;">
+                                {table.days} days from {table.start.strftime('%d %B %Y')}: {sum(totals.values()):.0f} expected incidents
+                                (data through {table.metadata['data_end']})
+                            </p>
+                        </div>
+                        """, unsafe_allow_html=True)
+                        st.bar_chart(pd.Series(totals.values(), index=[d.strftime("%a %d") for d in totals],
+                                               name="Expected incidents"), height=200)
     else:
         st.markdown("""
         <div class="warning-banner">
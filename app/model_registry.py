@@ -0,0 +1,266 @@
+"""
+Versioned model registry with hot reload.
+
+New model versions are dropped into ./model/ next to the original files:
+    best_lgbm_<version>.joblib / best_lgbm_<version>.onnx   (Stage 1)
+    lgbm_<version>.joblib / lgbm_<version>.onnx             (Stage 2)
+A version may ship one or both stages; a missing stage is carried over from
+the active version. The unversioned best_lgbm/lgbm files are version "base".
+
+A background thread polls the directory. Once a new version's files have
+stopped changing between two polls it is loaded, validated on a synthetic
+batch and warmed up off the request path, then swapped in with a single
+reference assignment. Requests read `registry.active` once, so each one
+uses a consistent model pair and none of them waits for a load.
+"""
+import datetime
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import onnx_backend
+
+MODEL_DIR = "./model"
+STAGE1_NAME = "best_lgbm"
+STAGE2_NAME = "lgbm"
+BASE_VERSION = "base"
+
+# Prefer the ONNX exports (see onnx_export.py) when onnxruntime is installed:
+# they load independently of the scikit-learn version and are faster per call.
+USE_ONNX = os.environ.get("SAFETYSCOPE_USE_ONNX", "1") == "1"
+POLL_SECONDS = float(os.environ.get("SAFETYSCOPE_MODEL_POLL_SECONDS", "10"))
+WARMUP_ROUNDS = 20
+
+VERSION_PATTERN = re.compile(rf"^(?P<stage>{STAGE1_NAME}|{STAGE2_NAME})_(?P<version>[\w.-]+)\.(?P<ext>joblib|onnx)$")
+
+# One consistent set of models; stage*_joblib are the native models' paths (used by explain.py)
+ModelSet = namedtuple("ModelSet", ["version", "safety_model", "crime_type_model", "stage1_joblib", "stage2_joblib"])
+
+
+def load_stage1(joblib_path, onnx_path):
+    """Stage 1 safety model, preferring the ONNX export; None when it cannot be loaded"""
+    model = onnx_backend.load_onnx_model(onnx_backend.OnnxStage1Model, onnx_path) if USE_ONNX else None
+    if model is not None:
+        print(f"✓ Stage 1 model ({os.path.basename(onnx_path)}) loaded with onnxruntime")
+        return model
+    try:
+        model = joblib.load(joblib_path)
+        print(f"✓ Stage 1 model ({os.path.basename(joblib_path)}) loaded successfully")
+        return model
+    except FileNotFoundError:
+        print(f"WARNING: {os.path.basename(joblib_path)} not found. Using fallback mode (Stage 2 only).")
+    except (AttributeError, ModuleNotFoundError, ImportError) as e:
+        print(f"WARNING: Could not load {os.path.basename(joblib_path)} due to version mismatch: {e}")
+        print("This is likely a scikit-learn version incompatibility.")
+        print("Run `python onnx_export.py` in a matching environment to use the ONNX backend instead.")
+        print("Using fallback mode (Stage 2 only).")
+    return None
+
+
+def load_stage2(joblib_path, onnx_path):
+    """Stage 2 crime type model, preferring the ONNX export"""
+    model = onnx_backend.load_onnx_model(onnx_backend.OnnxStage2Model, onnx_path) if USE_ONNX else None
+    if model is not None:
+        print(f"✓ Stage 2 model ({os.path.basename(onnx_path)}) loaded with onnxruntime")
+        return model
+    return joblib.load(joblib_path)
+
+
+def scan_versions(model_dir=MODEL_DIR):
+    """{version: {stage: {ext: path}}} of the versioned artifacts in model_dir"""
+    versions = {}
+    for name in os.listdir(model_dir):
+        match = VERSION_PATTERN.match(name)
+        if match:
+            stages = versions.setdefault(match["version"], {})
+            stages.setdefault(match["stage"], {})[match["ext"]] = os.path.join(model_dir, name)
+    return versions
+
+
+def signature(stages):
+    """(path, size, mtime) of every file of a version; unchanged between polls = fully written"""
+    files = sorted(path for paths in stages.values() for path in paths.values())
+    return tuple((path, os.path.getsize(path), os.path.getmtime(path)) for path in files)
+
+
+def synthetic_batch():
+    """Stage 1 frame and Stage 2 array covering every borough and hour with a fixed profile"""
+    import service
+    date = datetime.date(2025, 7, 12)
+    boroughs = ["Manhattan", "Brooklyn", "Bronx", "Queens", "Staten Island"]
+    latitudes = np.array([40.7580, 40.6782, 40.8448, 40.7282, 40.5795])
+    longitudes = np.array([-73.9855, -73.9442, -73.8648, -73.7949, -74.1502])
+    precincts = [14, 78, 48, 112, 120]
+    stage1 = pd.concat([service.create_stage1_batch_df(date, hour, boroughs, 30, "Female")
+                        for hour in range(24)], ignore_index=True)
+    stage2 = np.vstack([service.create_df_batch(date, hour, latitudes, longitudes, "In park", 30, "WHITE",
+                                                "Female", precincts, boroughs) for hour in range(24)])
+    return stage1, stage2
+
+
+def check_probabilities(name, proba, n_rows, n_classes):
+    proba = np.asarray(proba)
+    if proba.shape != (n_rows, n_classes):
+        raise ValueError(f"{name}: expected probabilities of shape {(n_rows, n_classes)}, got {proba.shape}")
+    if not np.all(np.isfinite(proba)) or proba.min() < 0 or proba.max() > 1:
+        raise ValueError(f"{name}: probabilities outside [0, 1]")
+    if not np.allclose(proba.sum(axis=1), 1, atol=1e-3):
+        raise ValueError(f"{name}: probabilities do not sum to 1")
+
+
+def validate(models, reference=None):
+    """
+    Raise ValueError if a model set gives malformed predictions on the synthetic batch.
+    Returns the share of identical labels compared with `reference` (for the log).
+    """
+    from complaints import CRIME_TYPES
+    stage1, stage2 = synthetic_batch()
+    agreement = {}
+    if models.safety_model is not None:
+        proba = models.safety_model.predict_proba(stage1)
+        check_probabilities("Stage 1", proba, len(stage1), 2)
+        if reference is not None and reference.safety_model is not None:
+            previous = reference.safety_model.predict_proba(stage1)
+            agreement["stage1"] = float(np.mean(np.argmax(proba, 1) == np.argmax(previous, 1)))
+    proba = models.crime_type_model.predict_proba(stage2)
+    check_probabilities("Stage 2", proba, len(stage2), len(CRIME_TYPES))
+    if reference is not None:
+        previous = reference.crime_type_model.predict_proba(stage2)
+        agreement["stage2"] = float(np.mean(np.argmax(proba, 1) == np.argmax(previous, 1)))
+    return agreement
+
+
+def warm_up(models, rounds=WARMUP_ROUNDS):
+    """Run single-row and batch predictions so the first real requests don't pay lazy initialisation"""
+    stage1, stage2 = synthetic_batch()
+    for i in range(rounds):
+        if models.safety_model is not None:
+            models.safety_model.predict_proba(stage1.iloc[i % len(stage1):i % len(stage1) + 1])
+        models.crime_type_model.predict_proba(stage2[i % len(stage2):i % len(stage2) + 1])
+    if models.safety_model is not None:
+        models.safety_model.predict_proba(stage1)
+    models.crime_type_model.predict_proba(stage2)
+
+
+class ModelRegistry:
+    """Holds the active ModelSet and swaps in new versions found in model_dir"""
+
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = model_dir
+        self._active = None
+        self._seen = {}  # version -> signature already loaded or rejected
+        self._pending = {}  # version -> signature seen on the previous poll
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.history = []  # (timestamp, version, event)
+
+    @property
+    def active(self):
+        return self._active
+
+    def _log(self, version, event):
+        self.history.append((time.time(), version, event))
+        print(f"Model registry: {version} {event}")
+
+    def _path(self, stages, stage, ext):
+        if stages is None:
+            return os.path.join(self.model_dir, f"{stage}.{ext}")
+        return stages.get(stage, {}).get(ext, "")
+
+    def load(self, version, stages=None, base=None):
+        """Load a version (stages=None: the unversioned base files); missing stages come from `base`"""
+        safety_model, stage1_joblib = (base.safety_model, base.stage1_joblib) if base else (None, None)
+        crime_type_model, stage2_joblib = (base.crime_type_model, base.stage2_joblib) if base else (None, None)
+        if stages is None or STAGE1_NAME in stages:
+            stage1_joblib = self._path(stages, STAGE1_NAME, "joblib")
+            safety_model = load_stage1(stage1_joblib, self._path(stages, STAGE1_NAME, "onnx"))
+            if safety_model is None and stages is not None:
+                raise ValueError(f"Stage 1 of version {version} could not be loaded")
+        if stages is None or STAGE2_NAME in stages:
+            stage2_joblib = self._path(stages, STAGE2_NAME, "joblib")
+            crime_type_model = load_stage2(stage2_joblib, self._path(stages, STAGE2_NAME, "onnx"))
+        return ModelSet(version, safety_model, crime_type_model, stage1_joblib, stage2_joblib)
+
+    def load_initial(self):
+        """Load the newest versioned artifacts at startup, or the base files if there are none"""
+        base = self.load(BASE_VERSION)
+        versions = scan_versions(self.model_dir)
+        for version, stages in versions.items():
+            self._seen[version] = signature(stages)
+        self._active = base
+        if versions:
+            newest = max(versions, key=lambda v: max(mtime for _, _, mtime in self._seen[v]))
+            try:
+                self._active = self.load(newest, versions[newest], base)
+            except Exception as e:
+                self._log(newest, f"rejected: {e}")
+        self._log(self._active.version, "active")
+        return self._active
+
+    def swap(self, version, stages):
+        """Load, validate and warm up a version off the request path, then make it active"""
+        with self._swap_lock:
+            current = self._active
+            try:
+                candidate = self.load(version, stages, current)
+                agreement = validate(candidate, current)
+                warm_up(candidate)
+            except Exception as e:
+                self._log(version, f"rejected: {e}")
+                return False
+            self._active = candidate  # atomic: requests see either the old or the new set
+            self._log(version, f"active (label agreement with {current.version}: {agreement})")
+            return True
+
+    def reload(self, version):
+        """Manually (re)activate a version present in model_dir, e.g. to roll back"""
+        versions = scan_versions(self.model_dir)
+        if version not in versions:
+            raise ValueError(f"Unknown model version: {version}")
+        return self.swap(version, versions[version])
+
+    def check(self):
+        """One poll: swap in the newest version whose files have been stable since the last poll"""
+        versions = scan_versions(self.model_dir)
+        ready = []
+        for version, stages in versions.items():
+            current = signature(stages)
+            if self._seen.get(version) == current:
+                continue
+            if self._pending.get(version) == current:
+                ready.append((max(mtime for _, _, mtime in current), version, current))
+            else:
+                self._pending[version] = current
+        if not ready:
+            return False
+        _, version, current = max(ready)
+        for _, ready_version, ready_signature in ready:
+            self._seen[ready_version] = ready_signature
+            self._pending.pop(ready_version, None)
+        return self.swap(version, versions[version])
+
+    def _watch(self, poll_seconds):
+        while not self._stop.wait(poll_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"WARNING: Model registry poll failed: {e}")
+
+    def start(self, poll_seconds=POLL_SECONDS):
+        """Start the background watcher (once per process)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, args=(poll_seconds,), daemon=True,
+                                            name="model-registry")
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
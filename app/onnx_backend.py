@@ -0,0 +1,96 @@
+import os
+import numpy as np
+
+# onnxruntime is optional: without it service.py keeps using the joblib models
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+STAGE1_ONNX_PATH = "./model/best_lgbm.onnx"
+STAGE2_ONNX_PATH = "./model/lgbm.onnx"
+
+# Thread settings (override with env vars). Single-row requests are fastest on
+# one intra-op thread; raise it for large batch scoring jobs.
+INTRA_OP_THREADS = int(os.environ.get("ORT_INTRA_OP_THREADS", "1"))
+INTER_OP_THREADS = int(os.environ.get("ORT_INTER_OP_THREADS", "1"))
+
+
+def make_session(path, intra_op_threads=None, inter_op_threads=None):
+    """Create a CPU onnxruntime session with tuned thread settings"""
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads or INTRA_OP_THREADS
+    options.inter_op_num_threads = inter_op_threads or INTER_OP_THREADS
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class OnnxStage1Model:
+    """
+    ONNX version of the Stage 1 sklearn Pipeline.
+    Takes the same DataFrame as create_stage1_df() and exposes predict/predict_proba
+    so it can be used as a drop-in replacement for safety_model.
+    """
+
+    def __init__(self, path=STAGE1_ONNX_PATH, **session_kwargs):
+        self.session = make_session(path, **session_kwargs)
+        # One graph input per DataFrame column, named after the column
+        self.inputs = [(i.name, i.type) for i in self.session.get_inputs()]
+        self.outputs = [o.name for o in self.session.get_outputs()]
+
+    def _feed(self, df):
+        feed = {}
+        for name, input_type in self.inputs:
+            values = df[name].values.reshape(-1, 1)
+            if input_type == "tensor(string)":
+                feed[name] = values.astype(str).astype(object)
+            else:
+                feed[name] = values.astype(np.float32)
+        return feed
+
+    def predict_proba(self, df):
+        label, proba = self.session.run(self.outputs, self._feed(df))
+        return np.asarray(proba)
+
+    def predict(self, df):
+        label, proba = self.session.run(self.outputs, self._feed(df))
+        return np.asarray(label)
+
+
+class OnnxStage2Model:
+    """
+    ONNX version of the Stage 2 LightGBM classifier.
+    Takes the 2D feature array produced by create_df().
+    """
+
+    def __init__(self, path=STAGE2_ONNX_PATH, **session_kwargs):
+        self.session = make_session(path, **session_kwargs)
+        self.input_name = self.session.get_inputs()[0].name
+        self.outputs = [o.name for o in self.session.get_outputs()]
+
+    def _feed(self, data):
+        return {self.input_name: np.asarray(data, dtype=np.float32)}
+
+    def predict_proba(self, data):
+        label, proba = self.session.run(self.outputs, self._feed(data))
+        return np.asarray(proba)
+
+    def predict(self, data):
+        label, proba = self.session.run(self.outputs, self._feed(data))
+        return np.asarray(label)
+
+
+def load_onnx_model(model_cls, path):
+    """Load an ONNX model, returning None when onnxruntime or the file is missing"""
+    if not ONNX_AVAILABLE:
+        return None
+    if not os.path.exists(path):
+        return None
+    try:
+        return model_cls(path)
+    except Exception as e:
+        print(f"WARNING: Could not load {path} with onnxruntime: {e}")
+        return None
@@ -0,0 +1,144 @@
+"""
+Export the Stage 1 and Stage 2 models to ONNX and check parity with joblib.
+
+Usage (from the app/ directory):
+    python onnx_export.py
+    python onnx_export.py --stage1 ./model/best_lgbm.joblib --stage2 ./model/lgbm.joblib
+
+The exported files are picked up automatically by service.py when onnxruntime
+is installed, which avoids the scikit-learn version mismatch on load.
+"""
+import argparse
+import datetime
+import itertools
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from lightgbm import LGBMClassifier
+from onnxmltools.convert import convert_lightgbm
+from onnxmltools.convert.lightgbm.operator_converters.LightGbm import convert_lightgbm as lgbm_converter
+from skl2onnx import convert_sklearn, update_registered_converter
+from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+from sklearn.preprocessing import OneHotEncoder
+
+import onnx_backend
+from service import create_df, create_stage1_df
+
+STAGE2_N_FEATURES = 36
+PARITY_ATOL = 1e-4
+
+BOROUGHS = ["Manhattan", "Brooklyn", "Bronx", "Queens", "Staten Island"]
+PLACES = ["In park", "In public housing", "In station"]
+
+# Let skl2onnx convert an LGBMClassifier sitting at the end of a sklearn Pipeline
+update_registered_converter(
+    LGBMClassifier, "LightGbmLGBMClassifier",
+    calculate_linear_classifier_output_shapes, lgbm_converter,
+    options={"nocl": [True, False], "zipmap": [True, False, "columns"]}
+)
+
+
+def stage1_initial_types(pipeline):
+    """Build one ONNX input per column of the Stage 1 ColumnTransformer"""
+    preprocessor = pipeline.steps[0][1]
+    initial_types = []
+    for name, transformer, columns in preprocessor.transformers:
+        if transformer == "drop":
+            continue
+        tensor_type = StringTensorType if isinstance(transformer, OneHotEncoder) else FloatTensorType
+        for column in columns:
+            initial_types.append((column, tensor_type([None, 1])))
+    return initial_types
+
+
+def export_stage1(model_path, onnx_path):
+    pipeline = joblib.load(model_path)
+    onx = convert_sklearn(
+        pipeline,
+        initial_types=stage1_initial_types(pipeline),
+        options={id(pipeline): {"zipmap": False}},
+        target_opset={"": 15, "ai.onnx.ml": 3}
+    )
+    with open(onnx_path, "wb") as f:
+        f.write(onx.SerializeToString())
+    print(f"✓ Stage 1 exported to {onnx_path}")
+    return pipeline
+
+
+def export_stage2(model_path, onnx_path):
+    model = joblib.load(model_path)
+    onx = convert_lightgbm(
+        model,
+        initial_types=[("input", FloatTensorType([None, STAGE2_N_FEATURES]))],
+        zipmap=False,
+        target_opset=15
+    )
+    with open(onnx_path, "wb") as f:
+        f.write(onx.SerializeToString())
+    print(f"✓ Stage 2 exported to {onnx_path}")
+    return model
+
+
+def parity_inputs():
+    """Grid of realistic requests covering every borough, hour and profile"""
+    dates = [datetime.date(2025, 1, 6), datetime.date(2025, 7, 12)]
+    ages = [16, 21, 30, 50, 70]
+    genders = ["Male", "Female"]
+    stage1_rows, stage2_rows = [], []
+    for date, hour, borough, age, gender in itertools.product(dates, range(24), BOROUGHS, ages, genders):
+        place = PLACES[hour % len(PLACES)]
+        stage1_rows.append(create_stage1_df(date, hour, borough, age, gender))
+        stage2_rows.append(create_df(date, hour, 40.75, -73.98, place, age, "WHITE", gender, 14, borough))
+    return pd.concat(stage1_rows, ignore_index=True), np.vstack(stage2_rows).astype(np.float64)
+
+
+def compare(name, reference, candidate, data):
+    expected = reference.predict_proba(data)
+    actual = candidate.predict_proba(data)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    labels_match = bool(np.array_equal(reference.predict(data), candidate.predict(data)))
+
+    # Single-row latency, the shape of an interactive request
+    start = time.perf_counter()
+    for i in range(200):
+        reference.predict_proba(data[i:i + 1])
+    joblib_ms = (time.perf_counter() - start) * 1000 / 200
+    start = time.perf_counter()
+    for i in range(200):
+        candidate.predict_proba(data[i:i + 1])
+    onnx_ms = (time.perf_counter() - start) * 1000 / 200
+
+    ok = max_diff <= PARITY_ATOL and labels_match
+    print(f"{name}: max |Δp| = {max_diff:.2e}, labels match = {labels_match}, "
+          f"single-row latency joblib {joblib_ms:.2f} ms vs onnx {onnx_ms:.2f} ms "
+          f"{'✓' if ok else '✗'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Stage 1 and Stage 2 models to ONNX")
+    parser.add_argument("--stage1", default="./model/best_lgbm.joblib")
+    parser.add_argument("--stage2", default="./model/lgbm.joblib")
+    parser.add_argument("--stage1-out", default=onnx_backend.STAGE1_ONNX_PATH)
+    parser.add_argument("--stage2-out", default=onnx_backend.STAGE2_ONNX_PATH)
+    parser.add_argument("--skip-check", action="store_true", help="Do not run the parity check")
+    args = parser.parse_args()
+
+    stage1 = export_stage1(args.stage1, args.stage1_out)
+    stage2 = export_stage2(args.stage2, args.stage2_out)
+
+    if args.skip_check:
+        return 0
+
+    stage1_data, stage2_data = parity_inputs()
+    ok = compare("Stage 1", stage1, onnx_backend.OnnxStage1Model(args.stage1_out), stage1_data)
+    ok &= compare("Stage 2", stage2, onnx_backend.OnnxStage2Model(args.stage2_out), stage2_data)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
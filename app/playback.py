@@ -0,0 +1,219 @@
+"""
+Time-sliced incident playback.
+
+Incidents are aggregated into Web Mercator cells (density_tiles grid at
+PLAYBACK_ZOOM) for every hour, day or month. Frames are stored in a compact
+binary file: every KEYFRAME_INTERVAL-th frame is a sparse keyframe and the
+frames in between only hold the cells whose count changed since the previous
+frame (delta encoding), unless the plain sparse frame is smaller, which is
+common for sparse hourly data. Each frame block is zlib-compressed and
+located through an offsets table, so the app reads and decodes only the
+frames being viewed instead of inlining every incident as GeoJSON.
+
+serve.py streams the frames to the app's playback map in pages of
+PAGE_FRAMES by time index (GET /playback/<period>/frames?start=..), and the
+map fetches the next page while the current one plays, so a full year
+animates without a cap on the points sent over the whole animation.
+
+Build once from the complaint CSV (from the app/ directory):
+    python playback.py --period day --start 2019 --end 2021
+"""
+import argparse
+import json
+import mmap
+import os
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from complaints import COMPLAINTS_CSV, iter_complaints
+from density_tiles import CELL_BITS, grid_to_lon_lat, lon_lat_to_grid
+
+PLAYBACK_DIR = "./data/playback"
+PLAYBACK_ZOOM = 13
+KEYFRAME_INTERVAL = 24
+PAGE_FRAMES = 24  # frames per request of the playback map
+SCALE_PERCENTILE = 99.5  # cell count drawn at full intensity, so one outlier cell doesn't wash out the rest
+PERIODS = ("hour", "day", "month")
+
+KEYFRAME, DELTA = 0, 1
+
+PLAYBACK_COLUMNS = ["CMPLNT_FR_DT", "CMPLNT_FR_TM", "Latitude", "Longitude"]
+EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def frame_number(chunk, period):
+    """Absolute frame number of each incident (hours/days since epoch, or months since year 0)"""
+    days = (chunk["date"].values.astype("datetime64[D]") - EPOCH).astype(np.int64)
+    if period == "hour":
+        return days * 24 + chunk["hour"].values.astype(np.int64)
+    if period == "day":
+        return days
+    return chunk["year"].values.astype(np.int64) * 12 + chunk["month"].values.astype(np.int64) - 1
+
+
+def frame_label(number, period):
+    if period == "month":
+        return f"{number // 12}-{number % 12 + 1:02d}"
+    if period == "day":
+        return str(EPOCH + int(number))
+    day = EPOCH + int(number // 24)
+    return f"{day} {number % 24:02d}:00"
+
+
+def paths(period, playback_dir=PLAYBACK_DIR):
+    base = os.path.join(playback_dir, f"playback_{period}")
+    return base + ".bin", base + ".npz", base + ".json"
+
+
+def encode_block(kind, cell_ids, values):
+    """zlib block: kind, count, delta-coded cell ids (uint32), values (int32)"""
+    header = np.array([kind, len(cell_ids)], dtype=np.uint32).tobytes()
+    ids = np.diff(cell_ids, prepend=0).astype(np.uint32).tobytes()
+    return zlib.compress(header + ids + values.astype(np.int32).tobytes())
+
+
+def decode_block(block):
+    raw = zlib.decompress(block)
+    kind, n = (int(v) for v in np.frombuffer(raw[:8], dtype=np.uint32))
+    cell_ids = np.cumsum(np.frombuffer(raw[8:8 + 4 * n], dtype=np.uint32), dtype=np.int64)
+    values = np.frombuffer(raw[8 + 4 * n:], dtype=np.int32)
+    return kind, cell_ids, values
+
+
+def build_playback(period, csv_path=COMPLAINTS_CSV, playback_dir=PLAYBACK_DIR, start_year=None, end_year=None):
+    """Aggregate incidents per period and cell, then write the delta-encoded frame file"""
+    level = PLAYBACK_ZOOM + CELL_BITS
+    parts = []
+    for chunk in iter_complaints(csv_path, columns=PLAYBACK_COLUMNS):
+        if start_year is not None:
+            chunk = chunk[chunk["year"] >= start_year]
+        if end_year is not None:
+            chunk = chunk[chunk["year"] <= end_year]
+        if chunk.empty:
+            continue
+        ix, iy = lon_lat_to_grid(chunk["Longitude"].values, chunk["Latitude"].values, level)
+        part = pd.DataFrame({"frame": frame_number(chunk, period), "cell": ix << 32 | iy})
+        parts.append(part.groupby(["frame", "cell"]).size())
+    counts = pd.concat(parts).groupby(level=[0, 1]).sum().sort_index()
+
+    frames = counts.index.get_level_values(0).values
+    cell_keys = counts.index.get_level_values(1).values
+    cells, cell_ids = np.unique(cell_keys, return_inverse=True)
+    values = counts.values.astype(np.int32)
+
+    first_frame, last_frame = int(frames.min()), int(frames.max())
+    n_frames = last_frame - first_frame + 1
+    bounds = np.searchsorted(frames, np.arange(first_frame, last_frame + 2))
+
+    bin_path, index_path, meta_path = paths(period, playback_dir)
+    os.makedirs(playback_dir, exist_ok=True)
+    offsets = np.zeros(n_frames + 1, dtype=np.int64)
+    previous = np.zeros(len(cells), dtype=np.int32)
+    with open(bin_path, "wb") as f:
+        for t in range(n_frames):
+            current = np.zeros(len(cells), dtype=np.int32)
+            lo, hi = bounds[t], bounds[t + 1]
+            current[cell_ids[lo:hi]] = values[lo:hi]
+            ids = np.flatnonzero(current)
+            block = encode_block(KEYFRAME, ids, current[ids])
+            if t % KEYFRAME_INTERVAL:
+                # The delta covers cells that emptied as well, so it can be larger than the frame itself
+                ids = np.flatnonzero(current != previous)
+                delta = encode_block(DELTA, ids, current[ids] - previous[ids])
+                block = min(block, delta, key=len)
+            f.write(block)
+            offsets[t + 1] = offsets[t] + len(block)
+            previous = current
+
+    np.savez(index_path, cells=cells, offsets=offsets)
+    with open(meta_path, "w") as f:
+        json.dump({"period": period, "first_frame": first_frame, "n_frames": n_frames,
+                   "level": level, "max_count": int(values.max()),
+                   "scale": float(np.percentile(values, SCALE_PERCENTILE))}, f)
+    size_mb = offsets[-1] / 1024 / 1024
+    print(f"✓ Playback ({period}) with {n_frames:,} frames over {len(cells):,} cells, {size_mb:.1f} MB -> {bin_path}")
+
+
+class Playback:
+    """Random access to delta-encoded frames; sequential reads apply one delta per frame"""
+
+    def __init__(self, period, playback_dir=PLAYBACK_DIR):
+        bin_path, index_path, meta_path = paths(period, playback_dir)
+        with open(meta_path) as f:
+            self.metadata = json.load(f)
+        with np.load(index_path) as index:
+            self.cells = index["cells"]
+            self.offsets = index["offsets"]
+        self._file = open(bin_path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        lon, lat = grid_to_lon_lat(self.cells >> 32, self.cells & 0xFFFFFFFF, self.metadata["level"])
+        self.lat, self.lon = lat, lon
+        self._cached_t, self._cached_frame = None, None
+        self._lock = threading.Lock()
+
+    @property
+    def n_frames(self):
+        return self.metadata["n_frames"]
+
+    def label(self, t):
+        return frame_label(self.metadata["first_frame"] + t, self.metadata["period"])
+
+    def _apply(self, t, frame):
+        kind, ids, values = decode_block(self._data[self.offsets[t]:self.offsets[t + 1]])
+        if kind == KEYFRAME:
+            frame[:] = 0
+            frame[ids] = values
+        else:
+            frame[ids] += values
+        return frame
+
+    def frame(self, t):
+        """Dense per-cell counts of frame t"""
+        with self._lock:
+            return self._frame(t)
+
+    def _frame(self, t):
+        if self._cached_t is not None and self._cached_t <= t and t - self._cached_t < KEYFRAME_INTERVAL:
+            start, frame = self._cached_t + 1, self._cached_frame.copy()
+        else:
+            start, frame = t - t % KEYFRAME_INTERVAL, np.zeros(len(self.cells), dtype=np.int32)
+        for i in range(start, t + 1):
+            frame = self._apply(i, frame)
+        self._cached_t, self._cached_frame = t, frame
+        return frame.copy()
+
+    def cells_lat_lon(self):
+        """The period's cells as {"lat": [...], "lon": [...]}, indexed by the cell ids of page()"""
+        return {"lat": np.round(self.lat, 6).tolist(), "lon": np.round(self.lon, 6).tolist(),
+                "n_frames": self.n_frames, "scale": self.metadata.get("scale", self.metadata["max_count"])}
+
+    def page(self, start, count=PAGE_FRAMES):
+        """
+        Frames start..start+count-1 (clipped to the period) as sparse [cell ids] / [counts] lists with labels.
+        Consecutive pages decode one block per frame thanks to the frame cache.
+        """
+        start = max(0, min(int(start), self.n_frames))
+        frames = []
+        for t in range(start, min(start + max(int(count), 0), self.n_frames)):
+            frame = self.frame(t)
+            ids = np.flatnonzero(frame)
+            frames.append({"label": self.label(t), "cells": ids.tolist(), "counts": frame[ids].tolist()})
+        return {"start": start, "frames": frames}
+
+
+def available_periods(playback_dir=PLAYBACK_DIR):
+    return [period for period in PERIODS if os.path.exists(paths(period, playback_dir)[0])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build delta-encoded incident playback frames")
+    parser.add_argument("--period", choices=PERIODS, default="day")
+    parser.add_argument("--csv", default=COMPLAINTS_CSV)
+    parser.add_argument("--out", default=PLAYBACK_DIR)
+    parser.add_argument("--start", type=int, default=None, help="First year to include")
+    parser.add_argument("--end", type=int, default=None, help="Last year to include")
+    args = parser.parse_args()
+    build_playback(args.period, args.csv, args.out, args.start, args.end)
@@ -0,0 +1,175 @@
+"""
+Precinct risk choropleth for the main map.
+
+The precinct shapefile (1.6 MB) is simplified once per detail tier with a
+topology-preserving coverage simplification (neighbouring precincts keep a
+shared border, no gaps or overlaps), snapped to a coordinate grid and
+written as compact GeoJSON strings (./data/precinct_layer/z<zoom>.geojson).
+At run time the string for the current zoom is embedded in the map as is,
+without being parsed or re-serialized; only the small precinct -> color and
+tooltip table is recomputed when the hour or profile changes, from one
+service.predict_two_stage_batch call over the precincts' interior points.
+
+Build once (from the app/ directory):
+    python precinct_layer.py
+"""
+import argparse
+import functools
+import json
+import os
+
+import numpy as np
+from branca.element import MacroElement
+from jinja2 import Template
+
+import service
+from route import RISK_COLORS
+
+LAYER_DIR = "./data/precinct_layer"
+
+# Lowest zoom of each detail tier -> (simplification tolerance, grid size) in degrees.
+# Tolerances are about one screen pixel at the tier's lowest zoom.
+DETAIL_TIERS = {
+    11: (5e-4, 1e-4),
+    13: (1.2e-4, 1e-5),
+    15: (3e-5, 1e-5),
+}
+
+
+def simplify(geometries, tolerance):
+    """Simplify polygons as a coverage when shapely supports it, so shared borders stay shared"""
+    import shapely
+    if hasattr(shapely, "coverage_simplify"):
+        return shapely.coverage_simplify(geometries, tolerance)
+    return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+
+def serialize(precincts, geometries, grid_size):
+    """Compact GeoJSON FeatureCollection with coordinates rounded to the grid"""
+    import shapely
+    digits = int(round(-np.log10(grid_size)))
+    geometries = shapely.set_precision(geometries, grid_size)
+    features = []
+    for precinct, geometry in zip(precincts, geometries):
+        shape = json.loads(shapely.to_geojson(geometry))
+        features.append({"type": "Feature", "properties": {"p": int(precinct)},
+                         "geometry": {"type": shape["type"], "coordinates": round_coordinates(shape["coordinates"],
+                                                                                            digits)}})
+    return json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":"))
+
+
+def round_coordinates(coordinates, digits):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, digits) for value in coordinates]
+    return [round_coordinates(part, digits) for part in coordinates]
+
+
+def build_layer(layer_dir=LAYER_DIR):
+    """Write one GeoJSON string per detail tier plus the precincts' interior points"""
+    import geo_lookup
+    precincts = geo_lookup.load_precincts()
+    numbers = precincts["precinct"].astype(int).values
+    geometries = precincts.geometry.values
+
+    os.makedirs(layer_dir, exist_ok=True)
+    for zoom, (tolerance, grid_size) in DETAIL_TIERS.items():
+        geojson = serialize(numbers, simplify(geometries, tolerance), grid_size)
+        with open(os.path.join(layer_dir, f"z{zoom}.geojson"), "w") as f:
+            f.write(geojson)
+        print(f"✓ Zoom {zoom}+: {len(geojson) / 1e3:,.0f} kB")
+
+    points = precincts.geometry.representative_point()
+    _, boroughs = geo_lookup.resolve_precincts_boroughs(points.y.values, points.x.values)
+    with open(os.path.join(layer_dir, "precincts.json"), "w") as f:
+        json.dump([{"precinct": int(p), "lat": round(float(pt.y), 6), "lon": round(float(pt.x), 6), "borough": b}
+                   for p, pt, b in zip(numbers, points, boroughs) if b is not None], f)
+    print(f"✓ Precinct layer ({len(numbers)} precincts) -> {layer_dir}")
+
+
+class PrecinctLayer:
+    """Pre-serialized precinct geometry per detail tier and one interior point per precinct"""
+
+    def __init__(self, layer_dir=LAYER_DIR):
+        self.tiers = {}
+        for zoom in DETAIL_TIERS:
+            with open(os.path.join(layer_dir, f"z{zoom}.geojson")) as f:
+                self.tiers[zoom] = f.read()
+        with open(os.path.join(layer_dir, "precincts.json")) as f:
+            points = json.load(f)
+        self.precincts = np.array([p["precinct"] for p in points])
+        self.latitudes = np.array([p["lat"] for p in points])
+        self.longitudes = np.array([p["lon"] for p in points])
+        self.boroughs = np.array([p["borough"] for p in points], dtype=object)
+
+    def geometry(self, zoom):
+        """GeoJSON string of the most detailed tier at or below `zoom`"""
+        tiers = [tier for tier in DETAIL_TIERS if tier <= (zoom or min(DETAIL_TIERS))]
+        return self.tiers[max(tiers) if tiers else min(DETAIL_TIERS)]
+
+
+def load_layer(layer_dir=LAYER_DIR):
+    """Load the precinct layer, returning None when it has not been built"""
+    if not os.path.exists(os.path.join(layer_dir, "precincts.json")):
+        return None
+    return PrecinctLayer(layer_dir)
+
+
+@functools.lru_cache(maxsize=256)
+def risk_styles(layer, model_version, date, hour, age, gender, race="UNKNOWN", place=None):
+    """
+    {precinct: [fill color, tooltip]} for one time and profile, from one batch prediction.
+    model_version is part of the cache key so a hot-swapped model is picked up.
+    """
+    result = service.predict_two_stage_batch(date, hour, layer.latitudes, layer.longitudes, place, age, race, gender,
+                                             layer.precincts, layer.boroughs)
+    styles = {}
+    for i, precinct in enumerate(layer.precincts):
+        level = result["risk_level"][i]
+        tooltip = f"Precinct {precinct}: {level} risk"
+        if result["crime_probability"] is not None:
+            tooltip += f" ({result['crime_probability'][i]:.0f}%)"
+        if result["crime_type"][i]:
+            tooltip += f" - most likely {result['crime_type'][i]}"
+        styles[str(precinct)] = [RISK_COLORS.get(level, "#94a3b8"), tooltip]
+    return styles
+
+
+class PrecinctChoropleth(MacroElement):
+    """Leaflet GeoJSON layer from a pre-serialized string, styled by a precinct -> [color, tooltip] table"""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }}_styles = {{ this.styles }};
+        var {{ this.get_name() }} = L.geoJson({{ this.geometry }}, {
+            style: function(feature) {
+                var style = {{ this.get_name() }}_styles[feature.properties.p];
+                return {color: "#94a3b8", weight: 0.8, fillColor: style ? style[0] : "#94a3b8",
+                        fillOpacity: style ? {{ this.opacity }} : 0};
+            },
+            onEachFeature: function(feature, layer) {
+                var style = {{ this.get_name() }}_styles[feature.properties.p];
+                if (style) { layer.bindTooltip(style[1], {sticky: true}); }
+            }
+        }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, geometry, styles, opacity=0.35):
+        super().__init__()
+        self._name = "PrecinctChoropleth"
+        self.geometry = geometry
+        self.styles = json.dumps(styles, separators=(",", ":"))
+        self.opacity = opacity
+
+
+def add_precinct_layer(base_map, layer, zoom, date, hour, age, gender):
+    """Add the precinct risk choropleth at the detail of the current zoom"""
+    styles = risk_styles(layer, service.registry.active.version, date, int(hour), int(age), gender)
+    PrecinctChoropleth(layer.geometry(zoom), styles).add_to(base_map)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the simplified precinct choropleth geometry")
+    parser.add_argument("--out", default=LAYER_DIR)
+    args = parser.parse_args()
+    build_layer(args.out)
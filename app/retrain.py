@@ -0,0 +1,267 @@
+"""
+Model refresh: full retrain or incremental update of either stage.
+
+--mode update continues boosting the active LightGBM model (`init_model`),
+i.e. the version model/registry.json says the app serves, for UPDATE_ROUNDS trees on the months ingested since its last training run
+only; the Stage 1 preprocessor is kept as fitted. The most recent
+HOLDOUT_MONTHS are held out: the update is published only if its holdout
+log loss stays within MAX_LOSS_INCREASE of the current model's.
+
+The update falls back to a full retrain on all months when
+  - the new months have drifted from the REFERENCE_MONTHS before them
+    (PSI >= MAX_DRIFT_PSI on any input, see drift_monitor.psi),
+  - the update's holdout loss crosses the threshold above, or
+  - the current model cannot be continued (not LightGBM, classes changed).
+A native-categorical Stage 1 model (stage1_native.py) is continued on its
+integer codes and retrained as the same kind of model.
+
+Models are published as versioned files (best_lgbm_<version>.joblib /
+lgbm_<version>.joblib) in ./model/, where the registry of a running app
+validates and swaps them in (see model_registry.py). The last trained month
+of each stage is kept in ./data/training/state.json.
+
+Usage (from the app/ directory):
+    python retrain.py --stage 2 --mode full --csv ../final_data.csv
+    python retrain.py --stage 2 --mode update
+    python retrain.py --stage 1 --mode update --since 2025-01
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import drift_monitor
+import model_registry
+import training
+from complaints import COMPLAINTS_CSV
+from features import STAGE2_COLUMNS
+
+STATE_PATH = "./data/training/state.json"
+HOLDOUT_MONTHS = 1
+REFERENCE_MONTHS = 12  # months before the new data that drift is measured against
+UPDATE_ROUNDS = int(os.environ.get("SAFETYSCOPE_UPDATE_ROUNDS", "50"))
+MAX_LOSS_INCREASE = 0.02  # relative holdout log loss increase tolerated for an update
+MAX_DRIFT_PSI = drift_monitor.PSI_ALERT
+
+STAGES = {
+    "1": {"name": model_registry.STAGE1_NAME, "csv": COMPLAINTS_CSV},
+    "2": {"name": model_registry.STAGE2_NAME, "csv": training.STAGE2_CSV},
+}
+
+
+def load_state():
+    return drift_monitor.load_json(STATE_PATH) or {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    with open(STATE_PATH, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def load_data(stage, csv_path, since=None):
+    """(X, y, month keys) of a stage's training data, from month key `since` on"""
+    if stage == "1":
+        return training.load_stage1_data(csv_path, since=since)
+    X, y = training.load_stage2_data(csv_path)
+    months = training.stage2_months(X)
+    if since is not None:
+        keep = months >= since
+        X, y, months = X[keep], y[keep], months[keep]
+    return X, y, months
+
+
+def take(X, rows):
+    return X[rows].reset_index(drop=True) if isinstance(X, pd.DataFrame) else X[rows]
+
+
+def current_model(stage):
+    """(version, fitted joblib model) the registry would serve for a stage: newest version, else base (or None)"""
+    name = STAGES[stage]["name"]
+    versions = [(os.path.getmtime(paths[name]["joblib"]), version, paths[name]["joblib"])
+                for version, paths in model_registry.scan_versions().items() if "joblib" in paths.get(name, {})]
+    if versions:
+        _, version, path = max(versions)
+    else:
+        version, path = model_registry.BASE_VERSION, os.path.join(model_registry.MODEL_DIR, f"{name}.joblib")
+    if not os.path.exists(path):
+        return None, None
+    return version, joblib.load(path)
+
+
+def holdout_loss(model, X, y):
+    from sklearn.metrics import log_loss
+    proba = model.predict_proba(X)
+    return float(log_loss(y, proba, labels=model.classes_))
+
+
+def input_counts(stage, X):
+    """{input: counts per value} of the inputs whose distribution is checked for drift"""
+    if stage == "1":
+        return {column: X[column].value_counts() for column in ["BORO_NM", "hour", "weekday", "VIC_SEX",
+                                                                  "VIC_AGE_GROUP"]}
+    columns = list(STAGE2_COLUMNS)
+    counts = {"hour": pd.Series(X[:, columns.index("hour")]).value_counts(),
+              "precinct": pd.Series(X[:, columns.index("ADDR_PCT_CD")]).value_counts()}
+    for prefix in ("BORO_NM_", "VIC_AGE_GROUP_", "VIC_RACE_", "VIC_SEX_"):
+        group = [i for i, column in enumerate(columns) if column.startswith(prefix)]
+        counts[prefix.rstrip("_")] = pd.Series(X[:, group].sum(axis=0), index=[columns[i] for i in group])
+    return counts
+
+
+def drift(stage, reference, new):
+    """PSI per input between the reference months and the new months"""
+    expected, actual = input_counts(stage, reference), input_counts(stage, new)
+    report = {}
+    for column in expected:
+        values = expected[column].index.union(actual[column].index)
+        report[column] = drift_monitor.psi(expected[column].reindex(values, fill_value=0).to_numpy(np.float64),
+                                           actual[column].reindex(values, fill_value=0).to_numpy(np.float64))
+    return report
+
+
+def continue_training(stage, model, X, y, rounds=UPDATE_ROUNDS):
+    """A copy of `model` with `rounds` more trees boosted on (X, y); the Stage 1 preprocessor is reused"""
+    from sklearn.base import clone
+    from sklearn.pipeline import Pipeline
+    if stage == "1" and getattr(model, "takes_codes", False):
+        return continue_native(model, X, y, rounds)
+    if stage == "1":
+        preprocessor, classifier = model[:-1], model.steps[-1][1]
+        X = preprocessor.transform(X)
+    else:
+        classifier = model
+    if not hasattr(classifier, "booster_"):
+        raise ValueError(f"{type(classifier).__name__} cannot be trained incrementally")
+    if not np.array_equal(np.unique(y), classifier.classes_):
+        raise ValueError(f"new months have classes {np.unique(y).tolist()}, model has {classifier.classes_.tolist()}")
+    updated = clone(classifier).set_params(n_estimators=rounds)
+    updated.fit(X, y, init_model=classifier.booster_)
+    if stage == "1":
+        return Pipeline(model.steps[:-1] + [(model.steps[-1][0], updated)])
+    return updated
+
+
+def continue_native(model, X, y, rounds=UPDATE_ROUNDS):
+    """continue_training() for a stage1_native.NativeStage1Model: boosted on its int32 codes"""
+    import stage1_native
+    from features import STAGE1_CAT_INDEX, STAGE1_COLUMNS
+    if not np.array_equal(np.unique(y), model.classes_):
+        raise ValueError(f"new months have classes {np.unique(y).tolist()}, model has {model.classes_.tolist()}")
+    updated = stage1_native.make_native_classifier().set_params(n_estimators=rounds)
+    updated.fit(model.transform(X), y, feature_name=STAGE1_COLUMNS, categorical_feature=STAGE1_CAT_INDEX,
+                init_model=model.booster_)
+    return stage1_native.NativeStage1Model(updated)
+
+
+def train_full(stage, X, y, current=None):
+    """A model of the current model's kind (one-hot pipeline or native categorical for Stage 1) trained from scratch"""
+    if stage == "1" and getattr(current, "takes_codes", False):
+        import stage1_native
+        return stage1_native.train_native(X, y)
+    model = training.make_stage1_pipeline() if stage == "1" else training.make_stage2_model()
+    return model.fit(X, y)
+
+
+def publish(stage, model, mode):
+    """Write a versioned artifact for the registry to pick up; returns the version"""
+    version = f"{mode}-{datetime.datetime.now():%Y%m%d-%H%M%S}"
+    path = os.path.join(model_registry.MODEL_DIR, f"{STAGES[stage]['name']}_{version}.joblib")
+    # Written under a name the registry ignores, then renamed, so it never sees a partial file
+    joblib.dump(model, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    print(f"✓ Published Stage {stage} model {version} -> {path}")
+    return version
+
+
+def retrain(stage, mode="update", csv_path=None, since=None):
+    """Run one refresh of a stage; returns a summary dict (also recorded in the state file)"""
+    csv_path = csv_path or STAGES[stage]["csv"]
+    state = load_state()
+    stage_state = state.get(f"stage{stage}", {})
+    start = time.perf_counter()
+    summary = {"stage": stage, "requested_mode": mode}
+
+    if mode == "update":
+        if since is None:
+            if "trained_through" not in stage_state:
+                raise ValueError(f"No training state for Stage {stage}: run --mode full first or pass --since")
+            since = training.parse_month(stage_state["trained_through"]) + 1
+        X, y, months = load_data(stage, csv_path, since=since - REFERENCE_MONTHS)
+    else:
+        X, y, months = load_data(stage, csv_path)
+
+    holdout_start = months.max() - HOLDOUT_MONTHS + 1
+    holdout = months >= holdout_start
+    X_holdout, y_holdout = take(X, holdout), y[holdout]
+    summary["holdout"] = f"{training.month_name(holdout_start)}..{training.month_name(months.max())}"
+    print(f"Stage {stage}: {len(y):,} rows, holdout {summary['holdout']} ({holdout.sum():,} rows)")
+
+    current_version, current = current_model(stage)
+    if current is None and mode == "update":
+        raise ValueError(f"No Stage {stage} model in {model_registry.MODEL_DIR} to update")
+    current_loss = holdout_loss(current, X_holdout, y_holdout) if current is not None else None
+    summary.update(current_version=current_version, current_loss=current_loss)
+    if current is not None:
+        print(f"  current model {current_version}: holdout log loss {current_loss:.4f}")
+
+    model, fallback = None, None
+    if mode == "update":
+        new = (months >= since) & ~holdout
+        if not new.any():
+            print(f"✓ Stage {stage}: no new months before the holdout since {training.month_name(since)}")
+            return summary
+        reference = months < since
+        psi = drift(stage, take(X, reference), take(X, new)) if reference.any() else {"none": 0.0}
+        summary["drift"] = psi
+        worst = max(psi, key=psi.get)
+        print(f"  {new.sum():,} new rows from {training.month_name(since)}; max PSI {psi[worst]:.3f} ({worst})")
+        if psi[worst] >= MAX_DRIFT_PSI:
+            fallback = f"drift in {worst} (PSI {psi[worst]:.3f})"
+        else:
+            try:
+                model = continue_training(stage, current, take(X, new), y[new])
+                loss = holdout_loss(model, X_holdout, y_holdout)
+                print(f"  updated model (+{UPDATE_ROUNDS} trees): holdout log loss {loss:.4f}")
+                if loss > current_loss * (1 + MAX_LOSS_INCREASE):
+                    fallback, model = f"holdout loss {loss:.4f} > {current_loss:.4f} + {MAX_LOSS_INCREASE:.0%}", None
+            except ValueError as e:
+                fallback = str(e)
+        if fallback:
+            print(f"WARNING: Falling back to a full retrain: {fallback}")
+            X, y, months = load_data(stage, csv_path)
+            holdout = months >= holdout_start
+
+    if model is None:
+        model = train_full(stage, take(X, ~holdout), y[~holdout], current)
+    loss = holdout_loss(model, X_holdout, y_holdout)
+    summary.update(mode="update" if fallback is None and mode == "update" else "full", fallback=fallback, loss=loss)
+    if summary["mode"] == "full" and current is not None and loss > current_loss * (1 + MAX_LOSS_INCREASE):
+        print(f"WARNING: Retrained Stage {stage} model is worse on the holdout ({loss:.4f} vs {current_loss:.4f}); "
+              f"keeping {current_version}")
+        return summary
+
+    summary["version"] = publish(stage, model, summary["mode"])
+    summary["trained_through"] = training.month_name(holdout_start - 1)
+    summary["seconds"] = round(time.perf_counter() - start, 1)
+    state[f"stage{stage}"] = summary
+    save_state(state)
+    print(f"✓ Stage {stage} {summary['mode']} training done in {summary['seconds']:.0f}s "
+          f"(holdout log loss {loss:.4f})")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain or incrementally update a stage's model")
+    parser.add_argument("--stage", choices=sorted(STAGES), required=True)
+    parser.add_argument("--mode", choices=["update", "full"], default="update")
+    parser.add_argument("--csv", default=None, help="Training data (default: complaints CSV / final_data.csv)")
+    parser.add_argument("--since", default=None, help="First new month (YYYY-MM); default: after the last run")
+    args = parser.parse_args()
+
+    retrain(args.stage, args.mode, args.csv, training.parse_month(args.since) if args.since else None)
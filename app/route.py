@@ -0,0 +1,128 @@
+"""
+Route risk scoring between two points.
+
+A route (straight line or a supplied path) is densified into sample points
+every `spacing_ft` feet in EPSG:2263, all points are resolved to
+precinct/borough in one vectorized lookup and scored in one batch with
+service.predict_two_stage_batch.
+"""
+from functools import lru_cache
+
+import folium
+import numpy as np
+from pyproj import Transformer
+
+import service
+from geo_lookup import resolve_precincts_boroughs, wgs84_to_ny_feet
+
+DEFAULT_SPACING_FT = 250
+MAX_POINTS = 1000
+
+RISK_SCORE = {'LOW': 0, 'MEDIUM': 1, 'HIGH': 2}
+RISK_COLORS = {'LOW': '#10b981', 'MEDIUM': '#f59e0b', 'HIGH': '#ef4444'}
+
+
+@lru_cache(maxsize=None)
+def ny_feet_to_wgs84():
+    return Transformer.from_crs("epsg:2263", "epsg:4326", always_xy=True)
+
+
+def densify(path, spacing_ft=DEFAULT_SPACING_FT, max_points=MAX_POINTS):
+    """
+    Interpolate a path of (lat, lon) vertices into evenly spaced sample points.
+    Spacing is widened if needed so the route never exceeds max_points.
+    """
+    lats = np.array([p[0] for p in path], dtype=float)
+    lons = np.array([p[1] for p in path], dtype=float)
+    x, y = wgs84_to_ny_feet().transform(lons, lats)
+
+    # Cumulative distance along the path, in feet
+    distance = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+    length = distance[-1]
+    n_points = int(min(max(np.ceil(length / spacing_ft) + 1, 2), max_points))
+    samples = np.linspace(0.0, length, n_points)
+
+    sample_x = np.interp(samples, distance, x)
+    sample_y = np.interp(samples, distance, y)
+    sample_lon, sample_lat = ny_feet_to_wgs84().transform(sample_x, sample_y)
+    return np.asarray(sample_lat), np.asarray(sample_lon), samples
+
+
+def score_route(path, date, hour, place, age, race, gender, spacing_ft=DEFAULT_SPACING_FT):
+    """
+    Score every sample point of a route and summarise risk per segment.
+
+    Args:
+        path: list of (lat, lon) vertices; two points for a straight-line origin -> destination
+
+    Returns:
+        dict with the sample points, per-segment risk and the peak-risk segment
+    """
+    lats, lons, distance_ft = densify(path, spacing_ft)
+    precincts, boroughs = resolve_precincts_boroughs(lats, lons)
+
+    # Points outside the precinct/borough polygons (e.g. water) are not scored
+    inside = np.array([p is not None and b is not None for p, b in zip(precincts, boroughs)])
+    risk_level = np.full(len(lats), None, dtype=object)
+    crime_probability = np.full(len(lats), np.nan)
+    crime_type = np.full(len(lats), None, dtype=object)
+    model_version = None
+    if inside.any():
+        result = service.predict_two_stage_batch(
+            date, hour, lats[inside], lons[inside], place, age, race, gender,
+            precincts[inside], boroughs[inside]
+        )
+        risk_level[inside] = result['risk_level']
+        crime_type[inside] = result['crime_type']
+        model_version = result['model_version']
+        if result['crime_probability'] is not None:
+            crime_probability[inside] = result['crime_probability']
+
+    score = np.array([RISK_SCORE.get(level, -1) for level in risk_level])
+
+    # A segment takes the worse of its two end points
+    segments = []
+    for i in range(len(lats) - 1):
+        worst = i if score[i] >= score[i + 1] else i + 1
+        segments.append({
+            'start': (float(lats[i]), float(lons[i])),
+            'end': (float(lats[i + 1]), float(lons[i + 1])),
+            'risk_level': risk_level[worst],
+            'crime_probability': None if np.isnan(crime_probability[worst]) else float(crime_probability[worst]),
+            'crime_type': crime_type[worst],
+        })
+
+    scored = [i for i, s in enumerate(segments) if s['risk_level'] is not None]
+    peak = None
+    if scored:
+        peak = max(scored, key=lambda i: (RISK_SCORE[segments[i]['risk_level']],
+                                          segments[i]['crime_probability'] or 0))
+
+    return {
+        'points': list(zip(lats.tolist(), lons.tolist())),
+        'length_ft': float(distance_ft[-1]),
+        'segments': segments,
+        'peak_segment': peak,
+        'n_scored': int(inside.sum()),
+        'model_version': model_version,
+    }
+
+
+def add_route_layer(base_map, route):
+    """Draw a scored route on a folium map, one colored polyline per segment"""
+    layer = folium.FeatureGroup(name="Route risk")
+    for i, segment in enumerate(route['segments']):
+        level = segment['risk_level']
+        tooltip = f"{level or 'Outside NYC'}"
+        if segment['crime_probability'] is not None:
+            tooltip += f" - crime risk {segment['crime_probability']:.1f}%"
+        if segment['crime_type']:
+            tooltip += f" ({segment['crime_type']})"
+        folium.PolyLine(
+            [segment['start'], segment['end']],
+            color=RISK_COLORS.get(level, '#94a3b8'),
+            weight=8 if i == route['peak_segment'] else 5,
+            opacity=0.9,
+            tooltip=tooltip,
+        ).add_to(layer)
+    layer.add_to(base_map)
@@ -0,0 +1,308 @@
+"""
+Pre-fork JSON prediction API.
+
+The parent process loads both models and the precinct/borough geometry
+(including their spatial indexes) once, freezes the garbage collector so
+the loaded objects are not written to again, then forks worker processes
+that all accept on the same listening socket. Workers share the parent's
+pages copy-on-write, so memory no longer grows linearly with workers.
+
+Usage (from the app/ directory, Linux/macOS):
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 4 --no-preload   # each worker loads its own copy, for comparison
+
+Endpoints:
+    POST /predict   {"date": "2025-07-12", "hour": 22, "lat": 40.75, "lon": -73.98,
+                     "place": "In park", "age": 30, "race": "WHITE", "gender": "Female"}
+    GET  /memory    memory report of all workers
+    GET  /health
+    GET  /playback/<period>                        cell coordinates of an incident playback (playback.py)
+    GET  /playback/<period>/frames?start=0&count=24  one page of its frames, for the app's playback map
+"""
+import argparse
+import datetime
+import functools
+import gc
+import importlib
+import json
+import os
+import signal
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+WORKER_PIDS = []
+# Requests one worker handles at once; above admission.MAX_IN_FLIGHT so overload is shed before accepts stall
+WORKER_THREADS = int(os.environ.get("SAFETYSCOPE_WORKER_THREADS", "32"))
+
+
+def memory_usage(pid="self"):
+    """RSS, PSS, shared and private memory in MB, from /proc/<pid>/smaps_rollup (Linux)"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) / 1024
+    except (FileNotFoundError, PermissionError):
+        return None
+    return {
+        "rss_mb": round(fields.get("Rss", 0), 1),
+        "pss_mb": round(fields.get("Pss", 0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1),
+    }
+
+
+def worker_pids():
+    """PIDs of all workers: the parent's children, read from /proc when called in a worker"""
+    if WORKER_PIDS:
+        return WORKER_PIDS
+    parent = os.getppid()
+    try:
+        with open(f"/proc/{parent}/task/{parent}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except (FileNotFoundError, PermissionError):
+        return [os.getpid()]
+
+
+def memory_report(pids):
+    """Per-worker memory plus totals; total PSS is the real footprint, total RSS the naive one"""
+    workers = {str(pid): memory_usage(pid) for pid in pids}
+    known = [usage for usage in workers.values() if usage]
+    return {
+        "workers": workers,
+        "total_rss_mb": round(sum(usage["rss_mb"] for usage in known), 1),
+        "total_pss_mb": round(sum(usage["pss_mb"] for usage in known), 1),
+        "shared_saving_mb": round(sum(usage["rss_mb"] - usage["pss_mb"] for usage in known), 1),
+    }
+
+
+def print_memory_report(pids):
+    report = memory_report(pids)
+    print(f"{'worker':>8} {'RSS MB':>8} {'PSS MB':>8} {'shared':>8} {'private':>8}")
+    for pid, usage in report["workers"].items():
+        if usage:
+            print(f"{pid:>8} {usage['rss_mb']:>8} {usage['pss_mb']:>8} {usage['shared_mb']:>8} {usage['private_mb']:>8}")
+    print(f"Total RSS {report['total_rss_mb']} MB, total PSS {report['total_pss_mb']} MB "
+          f"-> {report['shared_saving_mb']} MB saved by sharing")
+
+
+def preload():
+    """Load models and geometry in the parent so workers inherit them"""
+    service = importlib.import_module("service")
+    geo_lookup = importlib.import_module("geo_lookup")
+    for gdf in (geo_lookup.load_precincts(), geo_lookup.load_boroughs()):
+        gdf.sindex  # build the spatial index before forking
+    geo_lookup.wgs84_to_ny_feet()
+    # Degraded-tier lookup table, built once and shared with the workers. It runs LightGBM on one thread
+    # (admission.crime_proba_single_threaded): forking after its OpenMP pool has started can hang the workers
+    admission = importlib.import_module("admission")
+    admission.controller.build_table(service.registry.active)
+    return service, geo_lookup
+
+
+class WorkerServer(ThreadingMixIn, HTTPServer):
+    """
+    One thread per accepted request, at most WORKER_THREADS at a time per worker. Requests waiting for the
+    models are then visible to admission.py as in-flight predictions instead of queueing unseen in the
+    socket backlog.
+    """
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slots = threading.BoundedSemaphore(WORKER_THREADS)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.slots.release()
+
+
+@functools.lru_cache(maxsize=None)
+def load_playback(period):
+    """Playback frames of a period, or None when they have not been built"""
+    playback = importlib.import_module("playback")
+    return playback.Playback(period) if period in playback.available_periods() else None
+
+
+class OutsideNYC(ValueError):
+    """The requested location is in no precinct or borough; answered with 400 and reason outside_nyc"""
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    def _send(self, status, payload, cross_origin=False):
+        body = json.dumps(payload, default=float).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if cross_origin:
+            # Fetched by the Streamlit page's playback map, which is served from another origin
+            self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_playback(self, url):
+        parts = url.path.strip("/").split("/")  # playback/<period>[/frames]
+        frames = load_playback(parts[1]) if len(parts) in (2, 3) else None
+        if frames is None or (len(parts) == 3 and parts[2] != "frames"):
+            self._send(404, {"error": "not found"}, cross_origin=True)
+            return
+        if len(parts) == 2:
+            self._send(200, frames.cells_lat_lon(), cross_origin=True)
+            return
+        query = parse_qs(url.query)
+        try:
+            start = int(query.get("start", ["0"])[0])
+            count = int(query.get("count", [str(sys.modules["playback"].PAGE_FRAMES)])[0])
+        except ValueError as e:
+            self._send(400, {"error": f"ValueError: {e}"}, cross_origin=True)
+            return
+        self._send(200, frames.page(start, count), cross_origin=True)
+
+    def do_GET(self):
+        if self.path == "/health":
+            service = sys.modules["service"]
+            self._send(200, {"status": "ok", "pid": os.getpid(), "model_version": service.registry.active.version,
+                             "audit": service.audit.stats() if service.audit is not None else None,
+                             "admission": sys.modules["admission"].controller.stats()})
+        elif self.path == "/memory":
+            self._send(200, memory_report(worker_pids()))
+        elif self.path.startswith("/playback/"):
+            self._send_playback(urlsplit(self.path))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        arrived = time.perf_counter()
+        if self.path != "/predict":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            result = predict_request(request, arrived)
+        except OutsideNYC as e:
+            self._send(400, {"error": str(e), "reason": "outside_nyc"})
+            return
+        except (KeyError, ValueError, TypeError) as e:  # missing field, bad value, e.g. "age": null
+            self._send(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            print(f"WARNING: /predict failed: {type(e).__name__}: {e}")
+            self._send(500, {"error": "internal error"})
+            return
+        self._send(200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def predict_request(request, arrived=None):
+    """Resolve the location and run the two-stage prediction (with load shedding) for one JSON request"""
+    admission = sys.modules["admission"]
+    geo_lookup = sys.modules["geo_lookup"]
+    lat, lon = float(request["lat"]), float(request["lon"])
+    precincts, boroughs = geo_lookup.resolve_precincts_boroughs([lat], [lon])
+    if precincts[0] is None or boroughs[0] is None:
+        raise OutsideNYC("location is outside NYC")
+    date = datetime.date.fromisoformat(request["date"])
+    return admission.predict(
+        date, int(request["hour"]), lat, lon, request.get("place", "In park"), int(request["age"]),
+        request.get("race", "UNKNOWN"), request.get("gender", "Male"), precincts[0], boroughs[0], arrived
+    )
+
+
+def stop_worker(server):
+    """
+    SIGTERM in a worker: only ask serve_forever() to return. The handler runs on the main thread, which may
+    be holding the audit log's lock, so the flush happens in run_worker() once the loop has stopped.
+    shutdown() waits for the loop, so it is called from another thread.
+    """
+    threading.Thread(target=server.shutdown, daemon=True, name="worker-shutdown").start()
+
+
+def run_worker(server, preloaded):
+    if not preloaded:
+        preload()
+    # Threads don't survive fork, so every worker runs its own model watcher, drift checks and audit writer
+    service = sys.modules["service"]
+    service.registry.start()
+    if service.monitor is not None:
+        service.monitor.start()
+    if service.audit is not None:
+        service.audit.start()
+    server.serve_forever()
+    # Stopped by SIGTERM (stop_worker): flush the audit log, then exit without running the parent's handlers
+    if service.audit is not None:
+        service.audit.close()
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork SafetyScope prediction API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Load models in every worker instead of once in the parent")
+    parser.add_argument("--report-after", type=float, default=5.0,
+                        help="Seconds after startup to print the memory report (0 to disable)")
+    args = parser.parse_args()
+
+    preloaded = not args.no_preload
+    if preloaded:
+        preload()
+        # Move everything loaded so far out of the GC's reach: collections would
+        # otherwise write to every object header and un-share the pages
+        gc.collect()
+        gc.freeze()
+
+    server = WorkerServer((args.host, args.port), PredictionHandler)
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            WORKER_PIDS.clear()  # a worker only inherits the siblings forked before it
+            signal.signal(signal.SIGTERM, lambda *_: stop_worker(server))
+            run_worker(server, preloaded)
+            os._exit(0)
+        WORKER_PIDS.append(pid)
+    print(f"✓ Serving on http://{args.host}:{args.port} with {args.workers} workers "
+          f"({'shared preloaded models' if preloaded else 'per-worker models'})")
+
+    def shutdown(*_):
+        for pid in WORKER_PIDS:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    if args.report_after:
+        time.sleep(args.report_after)
+        print_memory_report(WORKER_PIDS)
+    try:
+        while True:
+            os.wait()
+    except ChildProcessError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
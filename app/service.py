@@ -1,26 +1,51 @@
-import joblib
 import pandas as pd
 import numpy as np
 import datetime
+import os
+import time
 
-# Stage 1: Safety Classifier - Determines if location is SAFE or has CRIME risk
-try:
-    safety_model = joblib.load("./model/best_lgbm.joblib")
-    STAGE1_AVAILABLE = True
-    print("✓ Stage 1 model (best_lgbm.joblib) loaded successfully")
-except FileNotFoundError:
-    print("WARNING: best_lgbm.joblib not found. Using fallback mode (Stage 2 only).")
-    STAGE1_AVAILABLE = False
-    safety_model = None
-except (AttributeError, ModuleNotFoundError, ImportError) as e:
-    print(f"WARNING: Could not load best_lgbm.joblib due to version mismatch: {e}")
-    print("This is likely a scikit-learn version incompatibility.")
-    print("Using fallback mode (Stage 2 only).")
-    STAGE1_AVAILABLE = False
-    safety_model = None
+import audit_log
+import drift_monitor
+import model_registry
+from complaints import CRIME_TYPES
+from features import STAGE1_CODES, STAGE2_COLUMNS, stage1_codes
 
+# Stage 1: Safety Classifier - Determines if location is SAFE or has CRIME risk
 # Stage 2: Crime Type Classifier - Determines type of crime if Stage 1 predicts CRIME
-crime_type_model = joblib.load("./model/lgbm.joblib")
+# Both live in a registry so new versions dropped into ./model/ are swapped in
+# without a restart (see model_registry.py). Each prediction reads registry.active once.
+registry = model_registry.ModelRegistry()
+registry.load_initial()
+
+# Streaming input-drift monitor (see drift_monitor.py); SAFETYSCOPE_DRIFT_MONITOR=0 disables it
+monitor = drift_monitor.DriftMonitor() if drift_monitor.ENABLED else None
+
+# Non-blocking audit log of every predict_two_stage() call (see audit_log.py); SAFETYSCOPE_AUDIT_LOG=0 disables it
+audit = audit_log.create() if audit_log.ENABLED else None
+
+
+def __getattr__(name):
+    """safety_model, crime_type_model and STAGE1_AVAILABLE always refer to the active model version"""
+    if name == "safety_model":
+        return registry.active.safety_model
+    if name == "crime_type_model":
+        return registry.active.crime_type_model
+    if name == "STAGE1_AVAILABLE":
+        return registry.active.safety_model is not None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Per-prediction DEBUG prints; loadtest.py turns them off (SAFETYSCOPE_DEBUG=0 does too)
+DEBUG = os.environ.get("SAFETYSCOPE_DEBUG", "1") == "1"
+
+# Decision thresholds - tune them with evaluate_thresholds.py on held-out data
+# Stage 1 thresholds on the crime probability (Class 0)
+CRIME_THRESHOLD = 0.5  # below: SAFE
+HIGH_RISK_THRESHOLD = 0.7  # at or above: HIGH, otherwise MEDIUM
+
+# Stage 2 confidence cut-offs (percent) used when Stage 1 is unavailable
+STAGE2_MEDIUM_CONFIDENCE = 40
+STAGE2_HIGH_CONFIDENCE = 65
 
 def map_age_to_group(age):
     """Map age to age group string"""
@@ -78,6 +103,19 @@ def create_stage1_df(date, hour, borough, age, gender):
     return df
 
 
+def create_stage1_codes(date, hour, borough, age, gender):
+    """create_stage1_df() as the int32 code row taken by a native-categorical Stage 1 model (stage1_native.py)"""
+    hour = int(hour) if int(hour) < 24 else 0
+    return stage1_codes(borough.upper(), hour, date.weekday(), date.month, map_gender(gender),
+                        map_age_to_group(int(age)))
+
+
+def stage1_input(safety_model, date, hour, borough, age, gender):
+    """The Stage 1 input a model takes: int32 codes for native-categorical models, else the DataFrame"""
+    if getattr(safety_model, "takes_codes", False):
+        return create_stage1_codes(date, hour, borough, age, gender)
+    return create_stage1_df(date, hour, borough, age, gender)
+
     
 def create_df(date, hour, latitude, longitude, place, age, race, gender, precinct, borough):
 
@@ -93,13 +131,7 @@ def create_df(date, hour, latitude, longitude, place, age, race, gender, precinc
     ADDR_PCT_CD = float(precinct)
     age = int(age)
 
-    columns = np.array(['year', 'month', 'day', 'hour', 'Latitude', 'Longitude','COMPLETED','ADDR_PCT_CD', 'IN_PARK', 'IN_PUBLIC_HOUSING',
-                        'IN_STATION', 'BORO_NM_BRONX', 'BORO_NM_BROOKLYN', 'BORO_NM_MANHATTAN', 'BORO_NM_QUEENS',
-                        'BORO_NM_STATEN ISLAND', 'BORO_NM_UNKNOWN', 'VIC_AGE_GROUP_18-24', 'VIC_AGE_GROUP_25-44',
-                        'VIC_AGE_GROUP_45-64', 'VIC_AGE_GROUP_65+', 'VIC_AGE_GROUP_-18', 'VIC_AGE_GROUP_UNKNOWN',
-                        'VIC_RACE_AMERICAN INDIAN/ALASKAN NATIVE', 'VIC_RACE_ASIAN / PACIFIC ISLANDER', 'VIC_RACE_BLACK',
-                        'VIC_RACE_BLACK HISPANIC', 'VIC_RACE_OTHER', 'VIC_RACE_UNKNOWN', 'VIC_RACE_WHITE',
-                        'VIC_RACE_WHITE HISPANIC', 'VIC_SEX_D', 'VIC_SEX_E', 'VIC_SEX_F', 'VIC_SEX_M', 'VIC_SEX_U'])
+    columns = STAGE2_COLUMNS
 
     data = [[year, month, day, hour, latitude, longitude,completed,ADDR_PCT_CD, in_park, in_public, in_station,
              1 if boro == "BRONX" else 0, 1 if boro == "BROOKLYN" else 0, 1 if boro == "MANHATTAN" else 0,
@@ -115,11 +147,14 @@ def create_df(date, hour, latitude, longitude, place, age, race, gender, precinc
     df = pd.DataFrame(data, columns=columns)
     return df.values
 
-def predict(data):
+def predict(data, models=None):
    """
    Legacy function for Stage 2 crime type prediction only.
    Used when Stage 1 model is not available or for backward compatibility.
    """
+   models = models or registry.active
+   crime_type_model = models.crime_type_model
+
    # Get prediction and probability scores
    pred = crime_type_model.predict(data)[0]
    proba = crime_type_model.predict_proba(data)[0]  # Returns probabilities for each class
@@ -130,37 +165,16 @@ def predict(data):
    # Get max probability to determine overall risk
    max_probability = max(proba) * 100
    
-   # Crime type mapping
-   crime_types = {
-       0: ('DRUGS/ALCOHOL', ['DANGEROUS DRUGS', 'INTOXICATED & IMPAIRED DRIVING',
-             'ALCOHOLIC BEVERAGE CONTROL LAW', 'INTOXICATED/IMPAIRED DRIVING',
-             'UNDER THE INFLUENCE OF DRUGS', 'LOITERING FOR DRUG PURPOSES']),
-       2: ('PROPERTY', ['BURGLARY', 'PETIT LARCENY', 'GRAND LARCENY', 'ROBBERY', 'THEFT-FRAUD', 
-        'GRAND LARCENY OF MOTOR VEHICLE', 'FORGERY', 'JOSTLING', 'ARSON',
-        'PETIT LARCENY OF MOTOR VEHICLE', 'OTHER OFFENSES RELATED TO THEF',
-        "BURGLAR'S TOOLS", 'FRAUDS', 'POSSESSION OF STOLEN PROPERTY',
-        'CRIMINAL MISCHIEF & RELATED OF', 'OFFENSES INVOLVING FRAUD',
-        'FRAUDULENT ACCOSTING', 'THEFT OF SERVICES']),
-       1: ('PERSONAL', ['ASSAULT 3 & RELATED OFFENSES', 'FELONY ASSAULT',
-            'OFFENSES AGAINST THE PERSON', 'HOMICIDE-NEGLIGENT,UNCLASSIFIE',
-            'HOMICIDE-NEGLIGENT-VEHICLE', 'KIDNAPPING & RELATED OFFENSES',
-            'ENDAN WELFARE INCOMP', 'OFFENSES RELATED TO CHILDREN',
-            'CHILD ABANDONMENT/NON SUPPORT', 'KIDNAPPING', 'DANGEROUS WEAPONS',
-            'UNLAWFUL POSS. WEAP. ON SCHOOL']),
-       3: ('SEXUAL', ['SEX CRIMES', 'HARRASSMENT 2', 'RAPE', 'PROSTITUTION & RELATED OFFENSES',
-          'FELONY SEX CRIMES', 'LOITERING/DEVIATE SEX'])
-   }
-   
    # Determine risk level based on confidence
-   if max_probability < 40:
+   if max_probability < STAGE2_MEDIUM_CONFIDENCE:
        risk_level = "LOW"
-   elif max_probability < 65:
+   elif max_probability < STAGE2_HIGH_CONFIDENCE:
        risk_level = "MEDIUM"
    else:
        risk_level = "HIGH"
    
    # Get crime type info
-   crime_name, crime_list = crime_types.get(pred, ('UNKNOWN', []))
+   crime_name, crime_list = CRIME_TYPES.get(pred, ('UNKNOWN', []))
    
    # Return comprehensive prediction data
    return {
@@ -173,11 +187,12 @@ def predict(data):
            'PERSONAL': round(proba[1] * 100, 2),
            'PROPERTY': round(proba[2] * 100, 2),
            'SEXUAL': round(proba[3] * 100, 2) if len(proba) > 3 else 0
-       }
+       },
+       'model_version': models.version
    }
 
 
-def predict_two_stage(date, hour, latitude, longitude, place, age, race, gender, precinct, borough):
+def predict_two_stage(date, hour, latitude, longitude, place, age, race, gender, precinct, borough, explain=False):
     """
     Two-Stage Crime Prediction System
     
@@ -186,34 +201,40 @@ def predict_two_stage(date, hour, latitude, longitude, place, age, race, gender,
     
     Returns:
         dict: Prediction results including safety status, risk level, crime type (if applicable)
+              and the model version that produced them. With explain=True, 'explanation' holds the
+              per-input contributions (explain.py) from the same models, for the stages that ran.
     """
+    started = time.perf_counter()
+    # One snapshot of the active models for the whole request (they may be hot-swapped)
+    models = registry.active
+    safety_model = models.safety_model
+    stage1_available = safety_model is not None
     
     # Stage 1: Safety Classification
-    if STAGE1_AVAILABLE:
+    if stage1_available:
         # Prepare data for Stage 1 model
-        stage1_data = create_stage1_df(date, hour, borough, age, gender)
+        stage1_data = stage1_input(safety_model, date, hour, borough, age, gender)
         
         # Get safety prediction
         safety_proba_array = safety_model.predict_proba(stage1_data)[0]
         safety_prediction = safety_model.predict(stage1_data)[0]
         
         # Debug: Print what the model is predicting
-        print(f"DEBUG - Stage 1 Prediction: {safety_prediction}")
-        print(f"DEBUG - Stage 1 Probabilities: Class 0={safety_proba_array[0]:.3f}, Class 1={safety_proba_array[1]:.3f}")
+        if DEBUG:
+            print(f"DEBUG - Stage 1 Prediction: {safety_prediction}")
+            print(f"DEBUG - Stage 1 Probabilities: Class 0={safety_proba_array[0]:.3f}, Class 1={safety_proba_array[1]:.3f}")
         
         # IMPORTANT: Class labels appear to be INVERTED in this model
         # Based on testing: Class 0 = CRIME, Class 1 = SAFE (opposite of expected)
         # So we use Class 0 probability as crime probability
         crime_probability = safety_proba_array[0] * 100  # Class 0 = CRIME probability
         
-        print(f"DEBUG - Crime Probability (CORRECTED): {crime_probability:.1f}%")
-        
-        # Crime threshold (adjustable)
-        CRIME_THRESHOLD = 0.5
+        if DEBUG:
+            print(f"DEBUG - Crime Probability (CORRECTED): {crime_probability:.1f}%")
         
         # If crime probability (Class 0) is LOW, location is SAFE
         if safety_proba_array[0] < CRIME_THRESHOLD:
-            return {
+            result = {
                 'status': 'SAFE',
                 'risk_level': 'LOW',
                 'crime_probability': round(crime_probability, 2),
@@ -226,8 +247,14 @@ def predict_two_stage(date, hour, latitude, longitude, place, age, race, gender,
                     'PERSONAL': 0,
                     'PROPERTY': 0,
                     'SEXUAL': 0
-                }
+                },
+                'model_version': models.version
             }
+            if explain:
+                result['explanation'] = explain_prediction(models, False, date, hour, latitude, longitude, place,
+                                                           age, race, gender, precinct, borough)
+            return record_prediction(date, hour, latitude, longitude, place, age, race, gender, precinct, borough,
+                                     result, started)
     else:
         # Fallback: If Stage 1 model not available, assume crime risk and go to Stage 2
         safety_proba_array = [0.6, 0.4]  # Default moderate risk (Class 0 = CRIME)
@@ -238,27 +265,135 @@ def predict_two_stage(date, hour, latitude, longitude, place, age, race, gender,
     stage2_data = create_df(date, hour, latitude, longitude, place, age, race, gender, precinct, borough)
     
     # Get crime type prediction
-    stage2_result = predict(stage2_data)
+    stage2_result = predict(stage2_data, models)
     
     # Combine Stage 1 and Stage 2 results
     # Determine overall risk level (using Class 0 = CRIME probability)
-    if STAGE1_AVAILABLE:
-        if safety_proba_array[0] >= 0.7:
+    if stage1_available:
+        if safety_proba_array[0] >= HIGH_RISK_THRESHOLD:
             overall_risk = "HIGH"
-        elif safety_proba_array[0] >= 0.5:
+        elif safety_proba_array[0] >= CRIME_THRESHOLD:
             overall_risk = "MEDIUM"
         else:
             overall_risk = "LOW"
     else:
         overall_risk = stage2_result['risk_level']
     
-    return {
+    result = {
         'status': 'CRIME RISK',
         'risk_level': overall_risk,
-        'crime_probability': round(crime_probability, 2) if STAGE1_AVAILABLE else None,
+        'crime_probability': round(crime_probability, 2) if stage1_available else None,
         'confidence': stage2_result['confidence'],
         'crime_type': stage2_result['crime_type'],
         'crime_list': stage2_result['crime_list'],
         'probabilities': stage2_result['probabilities'],
-        'message': f'Crime risk detected: {crime_probability:.1f}%. Most likely: {stage2_result["crime_type"]}' if STAGE1_AVAILABLE else f'Crime type predicted: {stage2_result["crime_type"]}'
+        'message': f'Crime risk detected: {crime_probability:.1f}%. Most likely: {stage2_result["crime_type"]}' if stage1_available else f'Crime type predicted: {stage2_result["crime_type"]}',
+        'model_version': models.version
+    }
+    if explain:
+        result['explanation'] = explain_prediction(models, True, date, hour, latitude, longitude, place, age, race,
+                                                   gender, precinct, borough)
+    return record_prediction(date, hour, latitude, longitude, place, age, race, gender, precinct, borough, result,
+                             started)
+
+
+def explain_prediction(models, stage2, *inputs):
+    """explain.explain_two_stage() for a prediction made with `models`; imported here as explain.py imports service"""
+    import explain
+    return explain.explain_two_stage(models, stage2, *inputs)
+
+
+def record_prediction(date, hour, latitude, longitude, place, age, race, gender, precinct, borough, result, started):
+    """
+    Feed one predict_two_stage() request and its outcome to the drift monitor and the audit log.
+    Degraded answers (admission.py) are audited only, so an overload episode does not look like output drift.
+    """
+    if monitor is not None and not result.get('degraded'):
+        monitor.observe(date.weekday(), date.month, int(hour) if int(hour) < 24 else 0, latitude, longitude,
+                        borough.upper(), int(precinct), map_age_to_group(int(age)), map_gender(gender), race, place,
+                        result['crime_probability'], result['crime_type'])
+    if audit is not None:
+        audit.log(date, int(hour) if int(hour) < 24 else 0, latitude, longitude, place, age, race, gender, precinct,
+                  borough, result, (time.perf_counter() - started) * 1000)
+    return result
+
+
+def create_stage1_batch_df(date, hour, boroughs, age, gender):
+    """Stage 1 DataFrame for many boroughs sharing the same time and profile"""
+    df = create_stage1_df(date, hour, boroughs[0], age, gender)
+    df = df.loc[df.index.repeat(len(boroughs))].reset_index(drop=True)
+    df["BORO_NM"] = [borough.upper() for borough in boroughs]
+    return df
+
+
+def create_df_batch(date, hour, latitudes, longitudes, place, age, race, gender, precincts, boroughs):
+    """Stage 2 feature array for many locations sharing the same time and profile"""
+    n = len(latitudes)
+    row = create_df(date, hour, latitudes[0], longitudes[0], place, age, race, gender, precincts[0], boroughs[0])
+    data = np.repeat(row.astype(float), n, axis=0)
+    col = {name: i for i, name in enumerate(STAGE2_COLUMNS)}
+
+    data[:, col['Latitude']] = latitudes
+    data[:, col['Longitude']] = longitudes
+    data[:, col['ADDR_PCT_CD']] = np.asarray(precincts, dtype=float)
+
+    boros = np.array([borough.upper() for borough in boroughs])
+    known = ["BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND"]
+    for boro in known:
+        data[:, col[f'BORO_NM_{boro}']] = boros == boro
+    data[:, col['BORO_NM_UNKNOWN']] = ~np.isin(boros, known)
+    return data
+
+
+def predict_two_stage_batch(date, hour, latitudes, longitudes, place, age, race, gender, precincts, boroughs):
+    """
+    Vectorized predict_two_stage for many locations sharing the same time and profile
+    (e.g. the sample points of a route). Each stage runs once over the whole batch.
+
+    Returns:
+        dict of per-location arrays: status, risk_level, crime_probability (None without Stage 1), crime_type,
+        plus the model_version used for the whole batch
+    """
+    models = registry.active
+    safety_model, crime_type_model = models.safety_model, models.crime_type_model
+    stage1_available = safety_model is not None
+    n = len(latitudes)
+    status = np.full(n, 'CRIME RISK', dtype=object)
+    crime_type = np.full(n, None, dtype=object)
+
+    if stage1_available:
+        if getattr(safety_model, "takes_codes", False):
+            stage1_data = np.repeat(create_stage1_codes(date, hour, boroughs[0], age, gender), n, axis=0)
+            stage1_data[:, 0] = [STAGE1_CODES["BORO_NM"].get(borough.upper(), -1) for borough in boroughs]
+        else:
+            stage1_data = create_stage1_batch_df(date, hour, boroughs, age, gender)
+        crime_proba = safety_model.predict_proba(stage1_data)[:, 0]  # Class 0 = CRIME
+        risk_level = np.where(crime_proba >= HIGH_RISK_THRESHOLD, 'HIGH',
+                              np.where(crime_proba >= CRIME_THRESHOLD, 'MEDIUM', 'LOW')).astype(object)
+        at_risk = crime_proba >= CRIME_THRESHOLD
+        status[~at_risk] = 'SAFE'
+        crime_probability = np.round(crime_proba * 100, 2)
+    else:
+        at_risk = np.ones(n, dtype=bool)
+        risk_level = np.full(n, 'LOW', dtype=object)
+        crime_probability = None
+
+    # Stage 2 only for the locations flagged by Stage 1
+    if at_risk.any():
+        stage2_data = create_df_batch(date, hour, latitudes, longitudes, place, age, race, gender,
+                                      precincts, boroughs)[at_risk]
+        proba = crime_type_model.predict_proba(stage2_data)
+        pred = proba.argmax(axis=1)
+        crime_type[at_risk] = [CRIME_TYPES.get(p, ('UNKNOWN', []))[0] for p in pred]
+        if not stage1_available:
+            max_probability = proba.max(axis=1) * 100
+            risk_level = np.where(max_probability >= STAGE2_HIGH_CONFIDENCE, 'HIGH',
+                                  np.where(max_probability >= STAGE2_MEDIUM_CONFIDENCE, 'MEDIUM', 'LOW')).astype(object)
+
+    return {
+        'status': status,
+        'risk_level': risk_level,
+        'crime_probability': crime_probability,
+        'crime_type': crime_type,
+        'model_version': models.version,
     }
@@ -0,0 +1,172 @@
+"""
+Stage 1 with LightGBM's native categorical handling.
+
+The served Stage 1 model is a Pipeline whose ColumnTransformer (StandardScaler
++ OneHotEncoder) runs on a one-row DataFrame per request and costs more than
+the 300 trees behind it. This variant codes BORO_NM, VIC_SEX, VIC_AGE_GROUP,
+SUSP_SEX and SUSP_AGE_GROUP with the fixed vocabulary in features.py
+(STAGE1_VOCAB), keeps the numeric columns as they are (trees don't need
+scaling) and lets LightGBM split on the categories directly. At serve time
+service.py passes it a plain int32 row (create_stage1_codes), which goes
+straight to the booster: no DataFrame, no sklearn transform.
+
+NativeStage1Model keeps the predict/predict_proba interface, with Class 0 =
+crime as before, and still accepts create_stage1_df() frames. The registry
+validation, the admission table and explanations keep working unchanged. It is
+published as a regular Stage 1 version (best_lgbm_native-<timestamp>.joblib)
+that the running app swaps in.
+
+Train both variants on the same months, compare them on the held-out last
+month, and optionally publish (from the app/ directory):
+    python stage1_native.py --since 2023-01
+    python stage1_native.py --since 2023-01 --publish
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import training
+from bakeoff import model_size
+from complaints import COMPLAINTS_CSV
+from features import STAGE1_CAT_INDEX, STAGE1_COLUMNS, STAGE1_VOCAB, encode_stage1
+
+REPORT_PATH = "./data/training/stage1_native.json"
+HOLDOUT_MONTHS = 1
+LATENCY_ROWS = 1000
+
+
+class NativeStage1Model:
+    """Stage 1 classifier on int32 codes (features.encode_stage1); predict_proba column 0 = crime"""
+
+    takes_codes = True  # service.py passes create_stage1_codes() rows instead of DataFrames
+
+    def __init__(self, classifier):
+        self.booster_ = classifier.booster_
+        self.classes_ = classifier.classes_
+        self.vocabulary = {column: list(vocab) for column, vocab in STAGE1_VOCAB.items()}
+
+    def transform(self, X):
+        """int32 codes of a create_stage1_df() frame; arrays are taken as already encoded"""
+        if isinstance(X, pd.DataFrame):
+            if self.vocabulary != STAGE1_VOCAB:
+                raise ValueError("Stage 1 vocabulary changed since this model was trained")
+            return encode_stage1(X)
+        return X
+
+    def predict_proba(self, X):
+        # The binary booster scores classes_[1] (safe)
+        safe = self.booster_.predict(self.transform(X))
+        return np.column_stack([1 - safe, safe])
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def make_native_classifier(threads=-1, seed=42):
+    """Same 300-tree LightGBM as make_stage1_pipeline(), on the coded columns"""
+    from lightgbm import LGBMClassifier
+    return LGBMClassifier(n_estimators=300, n_jobs=threads, random_state=seed, verbose=-1)
+
+
+def train_native(X, y, threads=-1, seed=42):
+    classifier = make_native_classifier(threads, seed)
+    classifier.fit(encode_stage1(X), y, feature_name=STAGE1_COLUMNS, categorical_feature=STAGE1_CAT_INDEX)
+    return NativeStage1Model(classifier)
+
+
+def single_row_latency(predict, rows):
+    """(p50, p95) ms of predict(row) from raw request inputs, as predict_two_stage() calls it"""
+    timings = []
+    for row in rows:
+        start = time.perf_counter()
+        predict(row)
+        timings.append(time.perf_counter() - start)
+    return float(np.percentile(timings, 50)) * 1000, float(np.percentile(timings, 95)) * 1000
+
+
+def evaluate(name, model, X, y, make_input):
+    from sklearn.metrics import accuracy_score, log_loss
+    proba = model.predict_proba(X)
+    rows = [make_input(*inputs) for inputs in request_inputs(X.head(LATENCY_ROWS))]
+    p50, p95 = single_row_latency(model.predict_proba, rows)
+    result = {
+        "model": name,
+        "accuracy": float(accuracy_score(y, model.classes_[proba.argmax(axis=1)])),
+        "log_loss": float(log_loss(y, proba, labels=model.classes_)),
+        "size_mb": model_size(model) / 1e6,
+        "single_row_p50_ms": p50,
+        "single_row_p95_ms": p95,
+    }
+    print(f"  {name:<20} accuracy {result['accuracy']:.4f}  log loss {result['log_loss']:.4f}  "
+          f"{result['size_mb']:.2f} MB  p50 {p50:.3f} ms  p95 {p95:.3f} ms")
+    return result
+
+
+def request_inputs(X):
+    """(date, hour, borough, age, gender) per holdout row, for end-to-end latency of each input path"""
+    ages = {"<18": 16, "18-24": 21, "25-44": 35, "45-64": 55, "65+": 70, "UNKNOWN": 35}
+    for row in X.itertuples(index=False):
+        date = datetime.date(2025, int(row.month), 1)
+        yield date, int(row.hour), row.BORO_NM.title(), ages.get(row.VIC_AGE_GROUP, 35), row.VIC_SEX
+
+
+def compare(csv_path=COMPLAINTS_CSV, since=None, publish=False, seed=42):
+    """Train the pipeline and native variants on the same months and report both on the holdout"""
+    import retrain
+    import service
+    X, y, months = training.load_stage1_data(csv_path, since=since, seed=seed)
+    holdout = months > months.max() - HOLDOUT_MONTHS
+    X_train, y_train = retrain.take(X, ~holdout), y[~holdout]
+    X_holdout, y_holdout = retrain.take(X, holdout), y[holdout]
+    print(f"Stage 1: {(~holdout).sum():,} training rows, holdout {training.month_name(months.max())} "
+          f"({holdout.sum():,} rows)")
+
+    start = time.perf_counter()
+    pipeline = training.make_stage1_pipeline(seed=seed).fit(X_train, y_train)
+    pipeline_fit = time.perf_counter() - start
+    start = time.perf_counter()
+    native = train_native(X_train, y_train, seed=seed)
+    native_fit = time.perf_counter() - start
+
+    results = []
+    current_version, current = retrain.current_model("1")
+    if current is not None:
+        results.append(evaluate(f"current ({current_version})", current, X_holdout, y_holdout,
+                                service.create_stage1_codes if getattr(current, "takes_codes", False)
+                                else service.create_stage1_df))
+    results.append(evaluate("onehot pipeline", pipeline, X_holdout, y_holdout, service.create_stage1_df))
+    results.append(evaluate("native categorical", native, X_holdout, y_holdout, service.create_stage1_codes))
+    results[-2]["fit_s"], results[-1]["fit_s"] = pipeline_fit, native_fit
+
+    baseline, candidate = results[-2], results[-1]
+    report = {
+        "holdout": training.month_name(months.max()),
+        "results": results,
+        "accuracy_change": candidate["accuracy"] - baseline["accuracy"],
+        "latency_p50_reduction": 1 - candidate["single_row_p50_ms"] / baseline["single_row_p50_ms"],
+        "size_reduction": 1 - candidate["size_mb"] / baseline["size_mb"],
+    }
+    print(f"✓ Native categorical vs one-hot pipeline: accuracy {report['accuracy_change']:+.4f}, "
+          f"p50 latency -{report['latency_p50_reduction']:.0%}, size -{report['size_reduction']:.0%}")
+    if publish:
+        report["version"] = retrain.publish("1", native, "native")
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    with open(REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and compare the native-categorical Stage 1 model")
+    parser.add_argument("--csv", default=COMPLAINTS_CSV)
+    parser.add_argument("--since", default=None, help="First training month (YYYY-MM, default: all)")
+    parser.add_argument("--publish", action="store_true", help="Publish the native model as a new Stage 1 version")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    import stage1_native  # so the published model pickles as stage1_native.NativeStage1Model, not __main__
+    stage1_native.compare(args.csv, training.parse_month(args.since) if args.since else None, args.publish, args.seed)
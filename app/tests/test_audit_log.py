@@ -0,0 +1,71 @@
+"""
+audit_log.py keeps well-formed records and drops (and counts) malformed ones.
+
+Run from the app/ directory:
+    python -m unittest discover tests
+"""
+import datetime
+import glob
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyarrow.parquet as pq  # noqa: E402
+
+from audit_log import AuditLog  # noqa: E402
+
+RESULT = {"status": "CRIME", "risk_level": "HIGH", "crime_probability": 0.8, "crime_type": "ROBBERY",
+          "confidence": 61.0, "probabilities": {}, "model_version": "v1"}
+VALID = dict(date=datetime.date(2024, 5, 1), hour=22, latitude=40.75, longitude=-73.99, place="In station",
+             age=30, race="WHITE", gender="F", precinct=14, borough="MANHATTAN", result=RESULT, latency_ms=3.2)
+MALFORMED = {
+    "date string": {"date": "2024-05-01"},
+    "missing precinct": {"precinct": None},
+    "age out of range": {"age": 100000},
+    "non-numeric latitude": {"latitude": "north"},
+    "result not a dict": {"result": None},
+}
+
+
+class AuditLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.audit = AuditLog(audit_dir=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_malformed_records_are_dropped_and_counted(self):
+        for changes in MALFORMED.values():
+            self.audit.log(**VALID)
+            self.audit.log(**{**VALID, **changes})
+        self.assertEqual(self.audit.flush(), len(MALFORMED))
+        self.assertEqual(self.audit.invalid, len(MALFORMED))
+        self.assertEqual(self.audit.failed, 0)
+        self.audit.close()
+
+        files = glob.glob(os.path.join(self.tmp.name, "audit-*.parquet"))
+        self.assertEqual(len(files), 1)
+        table = pq.read_table(files[0])
+        self.assertEqual(table.num_rows, len(MALFORMED))
+        self.assertEqual(set(table.column("precinct").to_pylist()), {14})
+
+    def test_each_malformed_record_raises(self):
+        for name, changes in MALFORMED.items():
+            fields = {**VALID, **changes}
+            record = (0.0,) + tuple(fields[key] for key in VALID)
+            with self.subTest(name), self.assertRaises((TypeError, ValueError, AttributeError, OverflowError)):
+                AuditLog.to_row(record, pid=1)
+
+    def test_all_malformed_batch_writes_no_file(self):
+        self.audit.log(**{**VALID, "precinct": None})
+        self.assertEqual(self.audit.flush(), 0)
+        self.audit.close()
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+batch_geocode.py against the bundled Nominatim stand-in (geocode_stub.py).
+
+Run from the app/ directory:
+    python -m unittest discover tests
+"""
+import datetime
+import email.utils
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_geocode import batch_geocode, parse_retry_after  # noqa: E402
+from geocode_stub import start_stub_server, stub_coordinates  # noqa: E402
+
+QUERIES = [f"{n} Broadway, Manhattan, NY" for n in range(1, 25)]
+FAST = {"rate": 1000.0, "concurrency": 8, "backoff": 0.01, "timeout": 5}
+
+
+def expected(query):
+    lat, lon = stub_coordinates(query)
+    return round(lat, 7), round(lon, 7)
+
+
+class StubTestCase(unittest.TestCase):
+    def start(self, **stub_kwargs):
+        server, url = start_stub_server(**stub_kwargs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, url
+
+    def assertGeocoded(self, queries, results):
+        self.assertEqual(len(results), len(queries))
+        for query, result in zip(queries, results):
+            self.assertIsNotNone(result, query)
+            self.assertAlmostEqual(result[0], expected(query)[0], places=6)
+            self.assertAlmostEqual(result[1], expected(query)[1], places=6)
+
+
+class BatchGeocodeTest(StubTestCase):
+    def test_results_in_input_order(self):
+        # Concurrent requests with latency complete in any order
+        _, url = self.start(latency=0.01)
+        self.assertGeocoded(QUERIES, batch_geocode(QUERIES, endpoint=url, **FAST))
+
+    def test_retries_429_with_retry_after_seconds(self):
+        server, url = self.start(fail_first=2, fail_status=429, retry_after="0")
+        self.assertGeocoded(QUERIES[:5], batch_geocode(QUERIES[:5], endpoint=url, retries=3, **FAST))
+        self.assertEqual([server.RequestHandlerClass.attempts[q] for q in QUERIES[:5]], [3] * 5)
+
+    def test_retries_429_with_retry_after_http_date(self):
+        past = email.utils.format_datetime(datetime.datetime.now(datetime.timezone.utc), usegmt=True)
+        server, url = self.start(fail_first=1, fail_status=429, retry_after=past)
+        self.assertGeocoded(QUERIES[:5], batch_geocode(QUERIES[:5], endpoint=url, retries=2, **FAST))
+        self.assertEqual([server.RequestHandlerClass.attempts[q] for q in QUERIES[:5]], [2] * 5)
+
+    def test_retries_server_errors(self):
+        server, url = self.start(fail_first=2, fail_status=503)
+        self.assertGeocoded(QUERIES[:5], batch_geocode(QUERIES[:5], endpoint=url, retries=3, **FAST))
+        self.assertEqual([server.RequestHandlerClass.attempts[q] for q in QUERIES[:5]], [3] * 5)
+
+    def test_gives_up_after_retries(self):
+        server, url = self.start(fail_first=10, fail_status=500)
+        self.assertEqual(batch_geocode(QUERIES[:3], endpoint=url, retries=2, **FAST), [None] * 3)
+        self.assertEqual([server.RequestHandlerClass.attempts[q] for q in QUERIES[:3]], [3] * 3)
+
+    def test_does_not_retry_client_errors(self):
+        server, url = self.start(fail_first=10, fail_status=403)
+        self.assertEqual(batch_geocode(QUERIES[:3], endpoint=url, retries=3, **FAST), [None] * 3)
+        self.assertEqual([server.RequestHandlerClass.attempts[q] for q in QUERIES[:3]], [1] * 3)
+
+    def test_bad_answers_do_not_abort_the_batch(self):
+        queries = QUERIES[:6]
+        _, url = self.start(malformed={queries[1]}, not_found={queries[4]})
+        results = batch_geocode(queries, endpoint=url, **FAST)
+        self.assertIsNone(results[1])
+        self.assertIsNone(results[4])
+        kept = [i for i in range(len(queries)) if i not in (1, 4)]
+        self.assertGeocoded([queries[i] for i in kept], [results[i] for i in kept])
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+
+    def test_http_date(self):
+        later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30)
+        self.assertAlmostEqual(parse_retry_after(email.utils.format_datetime(later, usegmt=True)), 30, delta=2)
+
+    def test_unusable(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+drift_monitor.py's PSI on identical vs shifted distributions, and the count-min sketch never undercounting.
+
+Run from the app/ directory:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drift_monitor import PSI_ALERT, PSI_WARN, CountMinSketch, binned_ks, psi, status  # noqa: E402
+
+
+class PsiTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.bins = np.linspace(0, 24, 25)
+        self.reference = np.histogram(self.rng.normal(14, 4, 50000), self.bins)[0].astype(np.float64)
+
+    def test_identical_distribution(self):
+        self.assertAlmostEqual(psi(self.reference, self.reference), 0.0)
+        self.assertAlmostEqual(psi(self.reference, self.reference * 3), 0.0)  # scale free
+        self.assertEqual(binned_ks(self.reference, self.reference), 0.0)
+
+    def test_resampled_distribution_is_ok(self):
+        sample = np.histogram(self.rng.normal(14, 4, 5000), self.bins)[0].astype(np.float64)
+        self.assertLess(psi(self.reference, sample), PSI_WARN)
+        self.assertEqual(status(psi(self.reference, sample)), "ok")
+
+    def test_shifted_distribution_alerts(self):
+        shifted = np.histogram(self.rng.normal(20, 4, 5000), self.bins)[0].astype(np.float64)
+        self.assertGreater(psi(self.reference, shifted), PSI_ALERT)
+        self.assertEqual(status(psi(self.reference, shifted)), "alert")
+        self.assertGreater(binned_ks(self.reference, shifted), 0.3)
+
+    def test_empty_bins_stay_finite(self):
+        self.assertTrue(np.isfinite(psi(np.array([10.0, 0.0, 5.0]), np.array([0.0, 10.0, 0.0]))))
+        self.assertEqual(psi(np.zeros(3), np.zeros(3)), 0.0)
+
+
+class CountMinSketchTest(unittest.TestCase):
+    def test_never_undercounts(self):
+        rng = np.random.default_rng(0)
+        keys = rng.zipf(1.5, 20000) % 2000  # skewed, with more distinct keys than the sketch width
+        sketch = CountMinSketch()
+        for key in keys:
+            sketch.add(int(key))
+        counts = np.bincount(keys)
+        for key in np.flatnonzero(counts):
+            self.assertGreaterEqual(sketch.estimate(int(key)), counts[key])
+        self.assertEqual(sketch.total, len(keys))
+        self.assertLessEqual(sketch.estimate(0), len(keys))
+
+
+if __name__ == "__main__":
+    unittest.main()
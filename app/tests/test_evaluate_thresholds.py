@@ -0,0 +1,68 @@
+"""
+evaluate_thresholds.py's one-pass sweeps against a brute-force recompute per threshold.
+
+Run from the app/ directory:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluate_thresholds import at_threshold, confidence_sweep, roc_auc, threshold_sweep  # noqa: E402
+
+
+def confusion(scores, labels, threshold):
+    predicted = scores >= threshold
+    return (int(np.sum(predicted & (labels == 1))), int(np.sum(predicted & (labels == 0))),
+            int(np.sum(~predicted & (labels == 1))), int(np.sum(~predicted & (labels == 0))))
+
+
+class ThresholdSweepTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.labels = rng.integers(0, 2, 500)
+        # Rounded so many scores tie, as with real model outputs
+        self.scores = np.round(np.clip(rng.normal(0.4 + 0.2 * self.labels, 0.2), 0, 1), 2)
+
+    def test_matches_brute_force(self):
+        sweep = threshold_sweep(self.scores, self.labels)
+        self.assertEqual(list(sweep["threshold"]), sorted(set(self.scores), reverse=True))
+        for row in sweep.itertuples():
+            tp, fp, fn, tn = confusion(self.scores, self.labels, row.threshold)
+            self.assertEqual((row.tp, row.fp, row.fn, row.tn), (tp, fp, fn, tn), row.threshold)
+            self.assertAlmostEqual(row.precision, tp / max(tp + fp, 1))
+            self.assertAlmostEqual(row.recall, tp / max(tp + fn, 1))
+            self.assertAlmostEqual(row.fpr, fp / max(fp + tn, 1))
+
+    def test_at_threshold_between_and_above_scores(self):
+        sweep = threshold_sweep(self.scores, self.labels)
+        for threshold in (0.005, 0.333, 0.5, 0.999, 1.5):
+            row = at_threshold(sweep, threshold)
+            self.assertEqual((row["tp"], row["fp"], row["fn"], row["tn"]),
+                             confusion(self.scores, self.labels, threshold), threshold)
+
+    def test_roc_auc_matches_pairwise_ranking(self):
+        positives, negatives = self.scores[self.labels == 1], self.scores[self.labels == 0]
+        wins = (positives[:, None] > negatives[None, :]).sum() + 0.5 * (positives[:, None] == negatives[None, :]).sum()
+        expected = wins / (len(positives) * len(negatives))
+        self.assertAlmostEqual(roc_auc(threshold_sweep(self.scores, self.labels)), expected)
+
+
+class ConfidenceSweepTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(1)
+        proba = rng.dirichlet(np.ones(4), 300).round(2)
+        labels = rng.integers(0, 4, 300)
+        confidence, correct = proba.max(axis=1) * 100, proba.argmax(axis=1) == labels
+        for row in confidence_sweep(proba, labels).itertuples():
+            kept = confidence >= row.cutoff
+            self.assertAlmostEqual(row.coverage, kept.mean())
+            self.assertAlmostEqual(row.accuracy, correct[kept].mean())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+ONNX exports (onnx_export.py) against the joblib models they were exported from.
+
+Skipped unless onnxruntime and both model pairs are present in ./model/.
+Run from the app/ directory:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import onnx_backend  # noqa: E402
+
+STAGE1_JOBLIB = "./model/best_lgbm.joblib"
+STAGE2_JOBLIB = "./model/lgbm.joblib"
+MODEL_FILES = [STAGE1_JOBLIB, STAGE2_JOBLIB, onnx_backend.STAGE1_ONNX_PATH, onnx_backend.STAGE2_ONNX_PATH]
+ATOL = 1e-4  # onnx_export.PARITY_ATOL
+
+
+@unittest.skipUnless(onnx_backend.ONNX_AVAILABLE, "onnxruntime is not installed")
+@unittest.skipUnless(all(os.path.exists(path) for path in MODEL_FILES), "joblib or ONNX model files missing")
+class OnnxParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import joblib
+        import model_registry
+        cls.stage1_data, cls.stage2_data = model_registry.synthetic_batch()
+        cls.stage1_joblib, cls.stage2_joblib = joblib.load(STAGE1_JOBLIB), joblib.load(STAGE2_JOBLIB)
+
+    def assertParity(self, reference, candidate, data):
+        import numpy as np
+        expected, actual = reference.predict_proba(data), candidate.predict_proba(data)
+        self.assertEqual(actual.shape, expected.shape)
+        np.testing.assert_allclose(actual, expected, atol=ATOL, rtol=0)
+
+    def test_stage1(self):
+        self.assertParity(self.stage1_joblib, onnx_backend.OnnxStage1Model(onnx_backend.STAGE1_ONNX_PATH),
+                          self.stage1_data)
+
+    def test_stage2(self):
+        self.assertParity(self.stage2_joblib, onnx_backend.OnnxStage2Model(onnx_backend.STAGE2_ONNX_PATH),
+                          self.stage2_data)
+
+
+if __name__ == "__main__":
+    unittest.main()
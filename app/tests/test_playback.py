@@ -0,0 +1,105 @@
+"""
+playback.py's block encoding and frame file against the counts it was built from.
+
+Run from the app/ directory:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playback  # noqa: E402
+from density_tiles import CELL_BITS, lon_lat_to_grid  # noqa: E402
+
+
+class BlockTest(unittest.TestCase):
+    def test_round_trip(self):
+        for kind in (playback.KEYFRAME, playback.DELTA):
+            ids = np.array([0, 3, 4, 1000, 70000], dtype=np.int64)
+            values = np.array([5, -2, 1, 7, -9], dtype=np.int32)
+            decoded_kind, decoded_ids, decoded_values = playback.decode_block(playback.encode_block(kind, ids, values))
+            self.assertEqual(decoded_kind, kind)
+            np.testing.assert_array_equal(decoded_ids, ids)
+            np.testing.assert_array_equal(decoded_values, values)
+
+    def test_empty_block(self):
+        kind, ids, values = playback.decode_block(
+            playback.encode_block(playback.DELTA, np.array([], dtype=np.int64), np.array([], dtype=np.int32)))
+        self.assertEqual((kind, len(ids), len(values)), (playback.DELTA, 0, 0))
+
+
+class PlaybackFileTest(unittest.TestCase):
+    """A small hourly playback over 3 days: the same busy cells every hour plus scattered incidents"""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        # Steady cells keep consecutive frames alike, so most frames are stored as deltas
+        steady_lat, steady_lon = rng.uniform(40.60, 40.85, 50), rng.uniform(-74.05, -73.80, 50)
+        days, hours = (axis.ravel() for axis in np.meshgrid(np.arange(1, 4), np.arange(24), indexing="ij"))
+        n = 400
+        cls.incidents = pd.DataFrame({
+            "CMPLNT_FR_DT": [f"07/{day:02d}/2021" for day in np.r_[np.repeat(days, 50), rng.integers(1, 4, n)]],
+            "CMPLNT_FR_TM": [f"{hour:02d}:30:00" for hour in np.r_[np.repeat(hours, 50), rng.integers(0, 24, n)]],
+            "Latitude": np.r_[np.tile(steady_lat, len(days)), rng.uniform(40.60, 40.85, n)],
+            "Longitude": np.r_[np.tile(steady_lon, len(days)), rng.uniform(-74.05, -73.80, n)],
+        })
+        cls.tmp = tempfile.TemporaryDirectory()
+        csv_path = os.path.join(cls.tmp.name, "complaints.csv")
+        cls.incidents.to_csv(csv_path, index=False)
+        playback.build_playback("hour", csv_path, cls.tmp.name)
+        cls.frames = playback.Playback("hour", cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.frames._data.close()
+        cls.frames._file.close()
+        cls.tmp.cleanup()
+
+    def expected_frames(self):
+        """{frame: {cell key: count}} straight from the incidents"""
+        level = playback.PLAYBACK_ZOOM + CELL_BITS
+        ix, iy = lon_lat_to_grid(self.incidents["Longitude"].values, self.incidents["Latitude"].values, level)
+        dates = pd.to_datetime(self.incidents["CMPLNT_FR_DT"], format="%m/%d/%Y")
+        hours = self.incidents["CMPLNT_FR_TM"].str[:2].astype(int).values
+        frame = (dates.values.astype("datetime64[D]") - playback.EPOCH).astype(np.int64) * 24 + hours
+        counts = pd.Series(1, index=pd.MultiIndex.from_arrays([frame, ix << 32 | iy])).groupby(level=[0, 1]).sum()
+        return {t: group.droplevel(0).to_dict() for t, group in counts.groupby(level=0)}
+
+    def assertFrame(self, t, expected):
+        frame = self.frames.frame(t)
+        got = {int(self.frames.cells[i]): int(frame[i]) for i in np.flatnonzero(frame)}
+        self.assertEqual(got, expected.get(self.frames.metadata["first_frame"] + t, {}), t)
+
+    def test_sequential_and_random_access(self):
+        kinds = [playback.decode_block(self.frames._data[self.frames.offsets[t]:self.frames.offsets[t + 1]])[0]
+                 for t in range(self.frames.n_frames)]
+        self.assertIn(playback.KEYFRAME, kinds)
+        self.assertIn(playback.DELTA, kinds)
+        expected = self.expected_frames()
+        self.assertEqual(self.frames.n_frames, max(expected) - min(expected) + 1)
+        for t in range(self.frames.n_frames):
+            self.assertFrame(t, expected)
+        for t in np.random.default_rng(1).permutation(self.frames.n_frames):
+            self.assertFrame(int(t), expected)
+
+    def test_page_matches_frames(self):
+        page = self.frames.page(20, 30)
+        self.assertEqual(page["start"], 20)
+        self.assertEqual(len(page["frames"]), 30)
+        for t, sparse in enumerate(page["frames"], start=20):
+            frame = self.frames.frame(t)
+            self.assertEqual(sparse["cells"], np.flatnonzero(frame).tolist())
+            self.assertEqual(sparse["counts"], frame[frame > 0].tolist())
+            self.assertEqual(sparse["label"], self.frames.label(t))
+        self.assertEqual(len(self.frames.page(self.frames.n_frames - 2, 24)["frames"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
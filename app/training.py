@@ -0,0 +1,149 @@
+"""
+Training data preparation and model definitions shared by the model scripts
+(bakeoff.py, retrain.py).
+
+Reproduces research/model1.ipynb for Stage 1 (complaints as crime rows plus
+as many synthetic "safe" rows, StandardScaler + OneHotEncoder + 300-tree
+LightGBM) and the encoding of research/Modeling.ipynb for Stage 2 so models
+trained here are drop-in replacements for the served ones: OFNS_DESC
+categories label-encoded in CATEGORY_NAMES order (ADMINISTRATIVE/OTHER
+dropped), COMPLETED as 1/0, pd.get_dummies on the categorical columns, and
+the columns reindexed to STAGE2_COLUMNS.
+
+Rows carry a month key (year * 12 + month - 1) so callers can train on a
+range of months and hold out the most recent ones.
+"""
+import numpy as np
+import pandas as pd
+
+from complaints import CATEGORY_NAMES, COMPLAINTS_CSV, iter_complaints
+from features import STAGE1_CAT_COLS, STAGE1_COLUMNS, STAGE1_NUM_COLS, STAGE2_COLUMNS
+
+STAGE2_CSV = "../final_data.csv"
+
+# service.py reads the Class 0 probability as the crime probability
+STAGE1_CRIME_CLASS = 0
+STAGE1_SAFE_CLASS = 1
+STAGE1_CSV_COLUMNS = ["CMPLNT_FR_DT", "CMPLNT_FR_TM", "BORO_NM", "VIC_SEX", "VIC_AGE_GROUP", "SUSP_SEX",
+                      "SUSP_AGE_GROUP"]
+
+STAGE2_FEATURES = ["year", "month", "day", "hour", "Latitude", "Longitude", "COMPLETED", "ADDR_PCT_CD", "BORO_NM",
+                   "IN_PARK", "IN_PUBLIC_HOUSING", "IN_STATION", "VIC_AGE_GROUP", "VIC_RACE", "VIC_SEX"]
+STAGE2_DUMMIES = ["BORO_NM", "VIC_AGE_GROUP", "VIC_RACE", "VIC_SEX"]
+
+# Tuned LightGBM parameters from Modeling.ipynb (Optuna study)
+LGBM_PARAMS = {
+    "boosting_type": "gbdt",
+    "num_leaves": 189,
+    "learning_rate": 0.0714,
+    "colsample_bytree": 0.638,
+    "subsample": 0.119,
+    "subsample_freq": 4,
+    "min_child_samples": 5,
+}
+
+
+def month_key(year, month):
+    return np.asarray(year, dtype=np.int64) * 12 + np.asarray(month, dtype=np.int64) - 1
+
+
+def month_name(key):
+    return f"{int(key) // 12}-{int(key) % 12 + 1:02d}"
+
+
+def parse_month(text):
+    """'YYYY-MM' -> month key"""
+    year, month = text.split("-")
+    return int(month_key(int(year), int(month)))
+
+
+def load_stage1_data(path=COMPLAINTS_CSV, since=None, seed=42):
+    """
+    (X DataFrame of the create_stage1_df() columns, y, month keys) from complaints on or after month key `since`.
+    Each complaint is a crime row; a synthetic safe row with random time, borough and victim profile
+    (as in model1.ipynb) is paired with it and keeps its month, so month-based holdouts stay balanced.
+    """
+    chunks = []
+    for chunk in iter_complaints(path, columns=STAGE1_CSV_COLUMNS):
+        months = month_key(chunk["year"], chunk["month"])
+        chunk = chunk[months >= since] if since is not None else chunk
+        if len(chunk):
+            chunks.append(chunk)
+    crimes = pd.concat(chunks, ignore_index=True)
+    crimes["VIC_SEX"] = crimes["VIC_SEX"].fillna("U")
+    crimes["SUSP_SEX"] = crimes["SUSP_SEX"].fillna("U")
+    crimes["VIC_AGE_GROUP"] = crimes["VIC_AGE_GROUP"].fillna("UNKNOWN")
+    crimes["SUSP_AGE_GROUP"] = crimes["SUSP_AGE_GROUP"].fillna("UNKNOWN")
+    crimes["is_weekend"] = (crimes["weekday"] >= 5).astype(int)
+    crimes["is_night"] = ((crimes["hour"] >= 20) | (crimes["hour"] <= 6)).astype(int)
+
+    rng = np.random.default_rng(seed)
+    n = len(crimes)
+    safe = pd.DataFrame({
+        "BORO_NM": rng.choice(crimes["BORO_NM"].unique(), n),
+        "hour": rng.integers(0, 24, n),
+        "weekday": rng.integers(0, 7, n),
+        "month": crimes["month"].values,
+        "is_weekend": rng.integers(0, 2, n),
+        "is_night": rng.integers(0, 2, n),
+        "VIC_SEX": rng.choice(["M", "F", "U"], n, p=[0.45, 0.45, 0.10]),
+        "VIC_AGE_GROUP": rng.choice(crimes["VIC_AGE_GROUP"].unique(), n),
+        "SUSP_SEX": "U",
+        "SUSP_AGE_GROUP": "UNKNOWN",
+    })
+    X = pd.concat([crimes[STAGE1_COLUMNS], safe[STAGE1_COLUMNS]], ignore_index=True)
+    y = np.r_[np.full(n, STAGE1_CRIME_CLASS), np.full(n, STAGE1_SAFE_CLASS)].astype(np.int8)
+    months = month_key(crimes["year"], crimes["month"])
+    return X, y, np.r_[months, months]
+
+
+def make_stage1_pipeline(threads=-1, seed=42):
+    from lightgbm import LGBMClassifier
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+    preprocessor = ColumnTransformer([
+        ("num", StandardScaler(), STAGE1_NUM_COLS),
+        ("cat", OneHotEncoder(handle_unknown="ignore", sparse_output=False), STAGE1_CAT_COLS)
+    ], remainder="drop")
+    return Pipeline([
+        ("preprocessor", preprocessor),
+        ("classifier", LGBMClassifier(n_estimators=300, n_jobs=threads, random_state=seed, verbose=-1))
+    ])
+
+
+def make_stage2_model(threads=-1, seed=42):
+    from lightgbm import LGBMClassifier
+    return LGBMClassifier(**LGBM_PARAMS, n_jobs=threads, random_state=seed, verbose=-1)
+
+
+def encode_stage2(df):
+    """float32 matrix in STAGE2_COLUMNS order for rows with the STAGE2_FEATURES columns"""
+    df = df[STAGE2_FEATURES].copy()
+    df["COMPLETED"] = (df["COMPLETED"] == "COMPLETED").astype(np.int8)
+    encoded = pd.get_dummies(df, columns=STAGE2_DUMMIES)
+    encoded = encoded.rename(columns={"VIC_AGE_GROUP_<18": "VIC_AGE_GROUP_-18"})
+    return encoded.reindex(columns=STAGE2_COLUMNS, fill_value=0).to_numpy(dtype=np.float32)
+
+
+def stage2_target(df):
+    """Class codes 0-3 (CRIME_TYPES order); -1 for ADMINISTRATIVE/OTHER and unknown offenses"""
+    codes = {name: code for code, name in enumerate(CATEGORY_NAMES)}
+    return df["OFNS_DESC"].map(codes).fillna(-1).astype(np.int8).to_numpy()
+
+
+def load_stage2_data(path=STAGE2_CSV, sample=None, seed=42):
+    """(X float32, y int8) of the Stage 2 training data, optionally a random sample of rows"""
+    df = pd.read_csv(path, usecols=STAGE2_FEATURES + ["OFNS_DESC"])
+    df = df[~df["OFNS_DESC"].isin(["ADMINISTRATIVE", "OTHER"])]
+    y = stage2_target(df)
+    df, y = df[y >= 0], y[y >= 0]
+    if sample is not None and sample < len(df):
+        rows = np.sort(np.random.default_rng(seed).choice(len(df), sample, replace=False))
+        df, y = df.iloc[rows], y[rows]
+    return encode_stage2(df), y
+
+
+def stage2_months(X):
+    """Month key of each encoded Stage 2 row (year and month are its first two columns)"""
+    return month_key(X[:, 0], X[:, 1])